@@ -13,6 +13,7 @@ import glob
 import optparse
 import os
 import re
+import shutil
 import subprocess
 import sys
 import tempfile
@@ -30,6 +31,9 @@ _GIT_CR_POS_RE = re.compile(
     r'^Cr-Commit-Position: refs/heads/(?:master|main)@{#(\d+)}$'
 )
 
+# Maximum number of blobs to download with one gsutil command.
+_GSUTIL_BLOBS_PER_COMMAND = 1000
+
 # Global variables set by command-line arguments (AddArgs, AddOpts).
 _ARGS_GSUTIL_PY_PATH = None
 
@@ -328,6 +332,131 @@ def GSUtilCopyFile(
   )
 
 
+def _MoveFile(src, dest):
+  """Moves src to dest, replacing dest if it exists.
+
+  os.rename() doesn't replace an existing file on Windows, and python2 has no
+  os.replace().
+  """
+  if chromium_utils.IsWindows() and os.path.exists(dest):
+    os.remove(dest)
+  os.rename(src, dest)
+
+
+def UploadBlobs(blob_sources, store, gs_acl=None, override_gsutil=None):
+  """Uploads blobs to a content-addressed store.
+
+  Blobs already in the store are not uploaded again.
+
+  Args:
+    blob_sources: (dict) Maps the digest of every blob to the path of a file
+        with its contents.
+    store: Google Storage URL, or path of a local directory, under which
+        blobs are stored named by their digest.
+    gs_acl: optional value to add as a canned-acl
+    override_gsutil (list): optional argv to run gsutil
+
+  Raises:
+    chromium_utils.ExternalError if gsutil fails or a digest is invalid.
+  """
+  for digest in blob_sources:
+    chromium_utils.CheckBlobDigest(digest)
+  if not blob_sources:
+    return
+  if not store.startswith('gs://'):
+    chromium_utils.MaybeMakeDirectory(store)
+    for digest, path in sorted(blob_sources.items()):
+      dest = os.path.join(store, digest)
+      if not os.path.exists(dest):
+        # Copy next to the blob first, so that it appears atomically.
+        temp_dest = '%s.%d.tmp' % (dest, os.getpid())
+        shutil.copyfile(path, temp_dest)
+        _MoveFile(temp_dest, dest)
+    return
+
+  # Gather the blobs under their digest, so that gsutil uploads all of them
+  # in parallel with one command.
+  temp_dir = tempfile.mkdtemp()
+  try:
+    for digest, path in blob_sources.items():
+      dest = os.path.join(temp_dir, digest)
+      try:
+        os.link(path, dest)
+      except OSError:
+        shutil.copyfile(path, dest)
+    command = list(override_gsutil or _GSUtilSetup()) + ['-m', 'cp', '-n']
+    if gs_acl:
+      command.extend(['-a', gs_acl])
+    command.extend([
+        'file://' + os.path.join(temp_dir, '*'),
+        store.rstrip('/') + '/'
+    ])
+    if chromium_utils.RunCommand(command):
+      raise chromium_utils.ExternalError(
+          'gsutil returned non-zero status when uploading blobs to %s!' % store
+      )
+  finally:
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def DownloadBlobs(digests, store, blob_dir, override_gsutil=None):
+  """Downloads blobs from a content-addressed store into blob_dir.
+
+  The contents of every blob are verified against its digest before it is
+  added to blob_dir.
+
+  Args:
+    digests: SHA-256 digests of the blobs to download.
+    store: Google Storage URL, or path of a local directory, under which
+        blobs are stored named by their digest.
+    blob_dir: Directory to add the blobs to.
+    override_gsutil (list): optional argv to run gsutil
+
+  Raises:
+    chromium_utils.ExternalError if a digest is invalid, or if a blob can't be
+    downloaded or is corrupt.
+  """
+  for digest in digests:
+    chromium_utils.CheckBlobDigest(digest)
+  if not digests:
+    return
+  chromium_utils.MaybeMakeDirectory(blob_dir)
+  temp_dir = tempfile.mkdtemp(dir=blob_dir)
+  try:
+    if store.startswith('gs://'):
+      gsutil = list(override_gsutil or _GSUtilSetup())
+      for i in range(0, len(digests), _GSUTIL_BLOBS_PER_COMMAND):
+        urls = [
+            '%s/%s' % (store.rstrip('/'), digest)
+            for digest in digests[i:i + _GSUTIL_BLOBS_PER_COMMAND]
+        ]
+        command = gsutil + ['-m', 'cp'] + urls + ['file://' + temp_dir]
+        if chromium_utils.RunCommand(command):
+          raise chromium_utils.ExternalError(
+              'gsutil returned non-zero status when downloading blobs from %s!'
+              % store
+          )
+    else:
+      for digest in digests:
+        try:
+          shutil.copyfile(
+              os.path.join(store, digest), os.path.join(temp_dir, digest)
+          )
+        except IOError as e:
+          raise chromium_utils.ExternalError(
+              'Failed to copy blob %s from %s: %s' % (digest, store, e)
+          )
+    for digest in digests:
+      path = os.path.join(temp_dir, digest)
+      if chromium_utils.HashFile(path) != digest:
+        raise chromium_utils.ExternalError(
+            'Blob %s from %s is corrupt' % (digest, store)
+        )
+      _MoveFile(path, os.path.join(blob_dir, digest))
+  finally:
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+
 def _LogAndRemoveFiles(temp_dir, regex_pattern):
   """Removes files in |temp_dir| that match |regex_pattern|.
   This function prints out the name of each directory or filename before
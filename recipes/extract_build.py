@@ -6,6 +6,7 @@
 """A tool to extract a build, executed by a buildbot slave.
 """
 
+import json
 import optparse
 import os
 import shutil
@@ -91,6 +92,44 @@ def GetBuildUrl(options, build_revision):
   return versioned_url, archive_name
 
 
+def ExtractDeltaBuild(manifest_file, abs_build_dir, options):
+  """Extracts a delta build archive to abs_build_dir, like ExtractZip().
+
+  Only the blobs missing in the local blob cache are downloaded. Blobs the
+  manifest does not refer to are removed from the cache afterwards.
+  """
+  with open(manifest_file) as f:
+    manifest = json.load(f)
+  store = options.delta_store or manifest.get('blob_store')
+  if not store:
+    raise chromium_utils.ExternalError(
+        'No blob store given for delta build %s' % manifest_file
+    )
+  cache_dir = options.delta_cache_dir or os.path.join(
+      abs_build_dir, 'delta_cache'
+  )
+  missing = chromium_utils.MissingDeltaBlobs(manifest, cache_dir)
+  print(
+      'Downloading %d of %d blobs from %s to %s' % (
+          len(missing), len(chromium_utils.DeltaManifestBlobs(manifest)),
+          store, cache_dir
+      )
+  )
+  override_gsutil = None
+  if options.gsutil_py_path:
+    override_gsutil = [sys.executable, options.gsutil_py_path]
+  bot_utils.DownloadBlobs(
+      missing, store, cache_dir, override_gsutil=override_gsutil
+  )
+  chromium_utils.ExtractDeltaArchive(
+      manifest, cache_dir, abs_build_dir, jobs=options.extract_jobs
+  )
+  print(
+      'Pruned %d unused blobs from %s' %
+      (chromium_utils.PruneDeltaBlobs(manifest, cache_dir), cache_dir)
+  )
+
+
 def real_main(options):
   """ Download a build, extract it to build\\BuildDir\\full-build-win32
       and rename it to build\\BuildDir\\Target
@@ -116,6 +155,11 @@ def real_main(options):
   url, archive_name = GetBuildUrl(options, build_revision)
   if archive_name is None:
     archive_name = 'build.zip'
+  if options.delta_archive:
+    # The builder archives a manifest in place of the zip file.
+    if url.endswith('.zip'):
+      url = url[:-len('.zip')] + '.json'
+    archive_name = os.path.splitext(archive_name)[0] + '.json'
 
   if not url.startswith('gs://'):
     print(
@@ -141,7 +185,11 @@ def real_main(options):
     print('Extracting build %s to %s...' % (archive_name, abs_build_dir))
     try:
       chromium_utils.RemoveDirectory(target_build_output_dir)
-      chromium_utils.ExtractZip(archive_name, abs_build_dir)
+      if options.delta_archive:
+        ExtractDeltaBuild(archive_name, abs_build_dir, options)
+      else:
+        chromium_utils.ExtractZip(
+            archive_name, abs_build_dir, jobs=options.extract_jobs)
       # For Chrome builds, the build will be stored in chrome-win32.
       if 'full-build-win32' in output_dir:
         chrome_dir = output_dir.replace('full-build-win32', 'chrome-win32')
@@ -220,6 +268,28 @@ def main():
   option_parser.add_option(
       '--gsutil-py-path', help='Specify path to gsutil.py script.'
   )
+  option_parser.add_option(
+      '--extract-jobs',
+      type=int,
+      help='Extract the build with the python zip module on this many '
+      'threads instead of with an unzip command.'
+  )
+  option_parser.add_option(
+      '--delta-archive',
+      action='store_true',
+      help='Extract a delta build archived by zip_build.py --delta-store.'
+  )
+  option_parser.add_option(
+      '--delta-store',
+      help='Google Storage URL or local directory of the content-addressed '
+      'store to download a delta build from. Defaults to the store recorded '
+      'in its manifest.'
+  )
+  option_parser.add_option(
+      '--delta-cache-dir',
+      help='Directory of the local blob cache for delta builds. Defaults to '
+      'delta_cache in the build output directory.'
+  )
   chromium_utils.AddPropertiesOptions(option_parser)
   bot_utils_callback = bot_utils.AddOpts(option_parser)
 
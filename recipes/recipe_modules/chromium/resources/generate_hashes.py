@@ -4,6 +4,7 @@
 # found in the LICENSE file.
 
 import argparse
+import concurrent.futures
 import hashlib
 import os
 import sys
@@ -14,20 +15,63 @@ import sys
 # not need so many different hashes for each tarball.
 HASHING_ALGORITHMS = ('md5', 'sha1', 'sha224', 'sha256', 'sha384', 'sha512')
 
+# Size of each of the two buffers the input file is read into.
+READ_BUFFER_SIZE = 4 * 1024 * 1024
+
+
+def compute_hashes(input_file, algorithms=HASHING_ALGORITHMS, jobs=None,
+                   buffer_size=READ_BUFFER_SIZE):
+  """Returns the hex digests of |input_file| for |algorithms|, in order.
+
+  The file is read once, in chunks, so memory use does not depend on its size.
+  Each chunk is fed to all the digests, on one thread per digest when |jobs|
+  is greater than 1 since hashlib releases the GIL for large buffers. The next
+  chunk is read while the current one is being hashed.
+  """
+  digests = [getattr(hashlib, alg)() for alg in algorithms]
+  if jobs is None:
+    jobs = min(len(digests), os.cpu_count() or 1)
+  buffers = [memoryview(bytearray(buffer_size)) for _ in range(2)]
+
+  if jobs <= 1:
+    size = input_file.readinto(buffers[0])
+    while size:
+      for digest in digests:
+        digest.update(buffers[0][:size])
+      size = input_file.readinto(buffers[0])
+    return [digest.hexdigest() for digest in digests]
+
+  with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+    current = 0
+    size = input_file.readinto(buffers[current])
+    while size:
+      chunk = buffers[current][:size]
+      futures = [executor.submit(digest.update, chunk) for digest in digests]
+      current = 1 - current
+      size = input_file.readinto(buffers[current])
+      for future in futures:
+        future.result()
+  return [digest.hexdigest() for digest in digests]
+
 
 def main(argv):
   parser = argparse.ArgumentParser()
   parser.add_argument('input_file', type=argparse.FileType('rb'))
   parser.add_argument('output_file', type=argparse.FileType('w'))
+  parser.add_argument(
+      '--jobs',
+      type=int,
+      help='Number of threads to hash on, defaults to one per algorithm, '
+      'up to the number of CPUs.')
   args = parser.parse_args(argv)
 
-  file_contents = args.input_file.read()
+  digests = compute_hashes(args.input_file, jobs=args.jobs)
 
   hashes = []
-  for alg in HASHING_ALGORITHMS:
+  for alg, digest in zip(HASHING_ALGORITHMS, digests):
     hashes.append('%s  %s  %s' % (
         alg,
-        getattr(hashlib, alg)(file_contents).hexdigest(),
+        digest,
         os.path.basename(args.input_file.name)))
 
   args.output_file.write('\n'.join(hashes))
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# Copyright 2022 The Chromium Authors
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import hashlib
+import io
+import os
+import tempfile
+import unittest
+
+import generate_hashes
+
+
+class GenerateHashesTest(unittest.TestCase):
+
+  def setUp(self):
+    # Not a multiple of the buffer size, to cover the last partial chunk.
+    self.data = os.urandom(1000) * 1037
+    self.expected = [
+        getattr(hashlib, alg)(self.data).hexdigest()
+        for alg in generate_hashes.HASHING_ALGORITHMS
+    ]
+
+  def testComputeHashesSequential(self):
+    self.assertEqual(
+        generate_hashes.compute_hashes(
+            io.BytesIO(self.data), jobs=1, buffer_size=64 * 1024),
+        self.expected)
+
+  def testComputeHashesInParallel(self):
+    self.assertEqual(
+        generate_hashes.compute_hashes(
+            io.BytesIO(self.data), jobs=3, buffer_size=64 * 1024),
+        self.expected)
+
+  def testComputeHashesEmpty(self):
+    self.assertEqual(
+        generate_hashes.compute_hashes(io.BytesIO(b''), jobs=2),
+        [
+            getattr(hashlib, alg)().hexdigest()
+            for alg in generate_hashes.HASHING_ALGORITHMS
+        ])
+
+  def testMain(self):
+    with tempfile.TemporaryDirectory() as tdir:
+      input_path = os.path.join(tdir, 'chromium.tar.xz')
+      output_path = os.path.join(tdir, 'chromium.tar.xz.hashes')
+      with open(input_path, 'wb') as f:
+        f.write(self.data)
+      self.assertEqual(generate_hashes.main([input_path, output_path]), 0)
+      with open(output_path) as f:
+        self.assertEqual(
+            f.read().splitlines(), [
+                '%s  %s  chromium.tar.xz' % (alg, digest) for alg, digest in
+                zip(generate_hashes.HASHING_ALGORITHMS, self.expected)
+            ])
+
+
+if __name__ == '__main__':
+  unittest.main()
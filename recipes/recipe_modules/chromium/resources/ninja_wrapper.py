@@ -124,6 +124,8 @@ def run_ninja_tool(ninja_cmd, warning_collector):
 class Node:
   """Represents a node in ninja build graph."""
 
+  __slots__ = ('input_edge', 'output_edges', 'node_name')
+
   def __init__(self):
     # Node has at most one input edge.
     self.input_edge = None
@@ -134,6 +136,9 @@ class Node:
 class Edge:
   """Represents an edge in ninja build graph."""
 
+  __slots__ = ('rule_name', 'normal_input_nodes', 'order_only_input_nodes',
+               'output_nodes')
+
   def __init__(self, name):
     self.rule_name = name
     self.normal_input_nodes = []
@@ -159,6 +164,10 @@ class Graph:
         (_NODE_NODE_RE, self._record_node_node),
     ]
     self.warning_collector = warning_collector
+    # Maps an edge to the frozenset of source root node names it depends on.
+    # Shared across get_root_deps queries, as failed nodes usually have most of
+    # their ancestry in common.
+    self._edge_root_deps = {}
 
   def _record_node_label(self, node_id, node_name):
     """Records node id and its file name."""
@@ -231,11 +240,57 @@ class Graph:
               'Unknown line when parsing graph output: %r' % line)
     return graph
 
+  def _get_edge_root_deps(self, edge):
+    """Returns a frozenset of source root node names the edge depends on."""
+    memo = self._edge_root_deps
+    roots = memo.get(edge)
+    if roots is not None:
+      return roots
+    # Iterative post-order traversal, as generator chains in large builds can
+    # be deeper than the recursion limit. An edge is only computed after all
+    # of its input edges, and each edge is computed once.
+    expanding = set()
+    stack = [(edge, False)]
+    while stack:
+      current, expanded = stack.pop()
+      if not expanded:
+        if current in memo or current in expanding:
+          continue
+        expanding.add(current)
+        stack.append((current, True))
+        for input_node in current.normal_input_nodes:
+          input_edge = input_node.input_edge
+          if input_edge and input_edge not in memo:
+            stack.append((input_edge, False))
+        continue
+      sources = set()
+      input_roots = []
+      for input_node in current.normal_input_nodes:
+        input_edge = input_node.input_edge
+        if not input_edge:
+          if not is_auto_generated(input_node.node_name):
+            # If a file is generated by GN instead of ninja,
+            # it could be a root node in build graph.
+            sources.add(input_node.node_name)
+        else:
+          # Input edges still being expanded only happen on cycles.
+          input_edge_roots = memo.get(input_edge)
+          if input_edge_roots:
+            input_roots.append(input_edge_roots)
+      if not sources and all(r is input_roots[0] for r in input_roots[1:]):
+        # Share the set with the single input edge contributing roots instead
+        # of copying it, which keeps long generator chains cheap.
+        roots = input_roots[0] if input_roots else frozenset()
+      else:
+        roots = frozenset(sources.union(*input_roots))
+      memo[current] = roots
+      expanding.discard(current)
+    return memo[edge]
+
   def get_root_deps(self, node_names):
     """Gets source dependencies by checking root nodes in graph."""
     root_deps = collections.defaultdict(list)
     for node_name in node_names:
-      visited_edges = set()
       node = self.node_name_dict.get(node_name)
       if not node:
         self.warning_collector.add(
@@ -245,19 +300,9 @@ class Graph:
       if not node.input_edge:
         # The node itself is root node.
         continue
-      edge_list = [node.input_edge]
-      visited_edges.add(node.input_edge)
-      while edge_list:
-        edge = edge_list.pop()
-        for input_node in edge.normal_input_nodes:
-          if not input_node.input_edge:
-            if not is_auto_generated(input_node.node_name):
-              # If a file is generated by GN instead of ninja,
-              # it could be a root node in build graph.
-              root_deps[node_name].append(input_node.node_name)
-          elif input_node.input_edge not in visited_edges:
-            edge_list.append(input_node.input_edge)
-            visited_edges.add(input_node.input_edge)
+      roots = self._get_edge_root_deps(node.input_edge)
+      if roots:
+        root_deps[node_name] = sorted(roots)
     return root_deps
 
 
@@ -339,17 +384,25 @@ class NinjaBuildOutputStreamingParser:
     self._failure_begins = False
     self._last_target = None
     self._warning_collector = warning_collector
-    self.failure_outputs = ''
+    # Output lines are accumulated in lists and joined on demand, as repeated
+    # string concatenation is quadratic for failures with huge outputs.
+    self._last_target_output = []
+    self._failure_outputs = []
+
+  @property
+  def failure_outputs(self):
+    return ''.join(self._failure_outputs)
 
   def parse(self, line):
     line = line.strip()
     if self._failure_begins and self._last_target:
       if not _RULE_RE.match(line) and not _FAILED_END_RE.match(line):
-        self._last_target['output'] += line +'\n'
-        self.failure_outputs += line +'\n'
+        self._last_target_output.append(line + '\n')
+        self._failure_outputs.append(line + '\n')
       else:
         # Output of failed edge ends, save its info.
         self._failure_begins = False
+        self._last_target['output'] = ''.join(self._last_target_output)
         self.failed_target_list.append(self._last_target)
     else:
       failed_nodes_match = _FAILED_RE.match(line)
@@ -369,7 +422,8 @@ class NinjaBuildOutputStreamingParser:
           target['output'] = ''
           target['dependencies'] = []
           self._last_target = target
-          self.failure_outputs += self._last_line + '\n' + line +'\n'
+          self._last_target_output = []
+          self._failure_outputs.append(self._last_line + '\n' + line + '\n')
         else:
           self._warning_collector.add(
               'Unknown line when parsing ninja '
@@ -0,0 +1,120 @@
+#!/usr/bin/env vpython3
+# Copyright 2022 The Chromium Authors
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Benchmark for ninja_wrapper.Graph on a large synthetic ninja graph dump.
+
+The dump mimics the output of `ninja -t graph` for many auto-generated files:
+generated files are grouped in components whose generator edges read the
+component's sources, earlier generated files of the component and the output
+of a long chain of shared generated tool files, so that queried files share
+most of their ancestry.
+
+Usage:
+  ninja_wrapper_benchmark.py [--nodes 1000000] [--queries 10000] [--repeat 1]
+"""
+
+import argparse
+import random
+import sys
+import time
+
+import ninja_wrapper
+
+_COMPONENT_SIZE = 100
+_SOURCES_PER_COMPONENT = 20
+_TOOL_CHAIN_LENGTH = 1000
+
+
+def GenerateGraph(num_nodes, seed=0):
+  """Returns (dump, generated_names) of a synthetic ninja graph dump."""
+  rnd = random.Random(seed)
+  lines = [
+      'digraph ninja {', 'rankdir="LR"',
+      'node [fontsize=10, shape=box, height=0.25]', 'edge [fontsize=10]'
+  ]
+  generated = []
+  node_count = 0
+  edge_count = 0
+
+  def add_node(name):
+    nonlocal node_count
+    node_id = '0x%x' % node_count
+    node_count += 1
+    lines.append('"%s" [label="%s"]' % (node_id, name))
+    return node_id
+
+  tool = add_node('../../tools/tool0.py')
+  for i in range(1, _TOOL_CHAIN_LENGTH):
+    name = 'gen/tools/tool%d.py' % i
+    node_id = add_node(name)
+    generated.append(name)
+    lines.append('"%s" -> "%s" [label="ACTION"]' % (tool, node_id))
+    tool = node_id
+  component = 0
+  while node_count < num_nodes:
+    inputs = [
+        add_node('../../src/c%d/s%d.in' % (component, i))
+        for i in range(_SOURCES_PER_COMPONENT)
+    ]
+    for i in range(_COMPONENT_SIZE - _SOURCES_PER_COMPONENT):
+      name = 'gen/c%d/g%d.h' % (component, i)
+      node_id = add_node(name)
+      generated.append(name)
+      edge_inputs = rnd.sample(inputs[-10:], min(len(inputs), 3))
+      if rnd.random() < 0.5:
+        lines.append('"%s" -> "%s" [label="ACTION"]' % (edge_inputs[0],
+                                                         node_id))
+      else:
+        edge_id = 'e%x' % edge_count
+        edge_count += 1
+        lines.append('"%s" [label="ACTION", shape=ellipse]' % edge_id)
+        lines.append('"%s" -> "%s"' % (edge_id, node_id))
+        for input_id in edge_inputs + [tool]:
+          lines.append('"%s" -> "%s" [arrowhead=none]' % (input_id, edge_id))
+      inputs.append(node_id)
+    component += 1
+  lines.append('}')
+  return '\n'.join(lines), generated
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument(
+      '--nodes', type=int, default=1000000,
+      help='Number of nodes in the graph dump.')
+  parser.add_argument(
+      '--queries', type=int, default=10000,
+      help='Number of auto-generated files to get root deps for.')
+  parser.add_argument(
+      '--repeat', type=int, default=1,
+      help='Number of times to run the benchmark.')
+  args = parser.parse_args()
+
+  dump, generated = GenerateGraph(args.nodes)
+  queries = random.Random(1).sample(generated, min(args.queries,
+                                                   len(generated)))
+  best_build = best_query = None
+  for _ in range(args.repeat):
+    warning_collector = ninja_wrapper.WarningCollector()
+    start = time.perf_counter()
+    graph = ninja_wrapper.Graph.build_graph(dump, warning_collector)
+    built = time.perf_counter()
+    graph.get_root_deps(queries)
+    queried = time.perf_counter()
+    assert not warning_collector.get(), warning_collector.get()[:10]
+    build_time, query_time = built - start, queried - built
+    best_build = build_time if best_build is None else min(
+        best_build, build_time)
+    best_query = query_time if best_query is None else min(
+        best_query, query_time)
+
+  print('Built graph of %d nodes in %.2fs' % (len(graph.node_id_dict),
+                                              best_build))
+  print('Got root deps of %d nodes in %.2fs' % (len(queries), best_query))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
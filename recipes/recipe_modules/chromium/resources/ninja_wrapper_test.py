@@ -248,6 +248,55 @@ class NinjaWrapperTestCase(unittest.TestCase):
     self.assertDictEqual(graph_dict, expected_dict)
     self.assertListEqual(warning_collector.get(), [])
 
+  def testGetRootDepsSharedAncestry(self):
+    warning_collector = ninja_wrapper.WarningCollector()
+    graph = ninja_wrapper.Graph.build_graph(
+        textwrap.dedent("""\
+                        "n1" [label="../../a.in"]
+                        "n2" [label="../../b.in"]
+                        "n3" [label="gen/common.h"]
+                        "n4" [label="gen/x.cc"]
+                        "n5" [label="gen/y.cc"]
+                        "n6" [label="gen/gn_written.h"]
+                        "e1" [label="ACTION", shape=ellipse]
+                        "e1" -> "n3"
+                        "n1" -> "e1" [arrowhead=none]
+                        "n2" -> "e1" [arrowhead=none]
+                        "n6" -> "e1" [arrowhead=none]
+                        "n3" -> "n4" [label="ACTION"]
+                        "n3" -> "n5" [label="ACTION"]
+                        """), warning_collector)
+    graph_dict = graph.get_root_deps(['gen/x.cc', 'gen/y.cc', 'gen/unknown'])
+    self.assertDictEqual(graph_dict, {
+        'gen/x.cc': ['../../a.in', '../../b.in'],
+        'gen/y.cc': ['../../a.in', '../../b.in'],
+    })
+    # Both queries share the roots computed for the common generator edge.
+    common_edge = graph.node_name_dict['gen/common.h'].input_edge
+    self.assertIs(
+        graph._edge_root_deps[graph.node_name_dict['gen/x.cc'].input_edge],
+        graph._edge_root_deps[common_edge])
+    self.assertListEqual(warning_collector.get(), [
+        "Node name does not exist in graph when calling "
+        "get_root_deps func: 'gen/unknown'"
+    ])
+
+  def testGetRootDepsDeepChain(self):
+    warning_collector = ninja_wrapper.WarningCollector()
+    depth = sys.getrecursionlimit() * 2
+    lines = ['"n0" [label="../../root.in"]']
+    for i in range(1, depth + 1):
+      lines.append('"n%d" [label="gen/%d"]' % (i, i))
+      lines.append('"n%d" -> "n%d" [label="ACTION"]' % (i - 1, i))
+    graph = ninja_wrapper.Graph.build_graph('\n'.join(lines),
+                                            warning_collector)
+    graph_dict = graph.get_root_deps(['gen/%d' % depth, 'gen/1'])
+    self.assertDictEqual(graph_dict, {
+        'gen/%d' % depth: ['../../root.in'],
+        'gen/1': ['../../root.in'],
+    })
+    self.assertListEqual(warning_collector.get(), [])
+
   def testCheckAutoGeneratedTrue(self):
     file_name = 'gen/123123'
     self.assertTrue(ninja_wrapper.is_auto_generated(file_name))
@@ -1491,6 +1491,35 @@ class SwarmingApi(recipe_api.RecipeApi):
         tuple(task_set) for task_set in result.json.output['sets']
     ], result.json.output['attempts']
 
+  def cancel_tasks(self, tasks, name='cancel tasks'):
+    """Cancels the shards of the given tasks which haven't started running.
+
+    Cancelled tasks can't be collected anymore. Shards which are already
+    running or finished are not affected.
+
+    Args:
+      tasks: A list of SwarmingTask instances, previously triggered with
+             'trigger' method and not collected.
+      name: An optional step name.
+    """
+    task_ids = []
+    for task in tasks:
+      assert task.task_name in self._pending_tasks, (
+          'Trying to cancel a task that was not triggered: %s' %
+          task.task_name)
+      self._pending_tasks.remove(task.task_name)
+      task_ids.extend(task.get_task_ids())
+
+    cmd = [
+        'vpython3',
+        self.m.swarming_client.path.join('swarming.py'),
+        'cancel',
+        '-S',
+        self.m.swarming.current_server,
+    ] + sorted(task_ids)
+    # Tasks may finish before they are cancelled, which isn't a failure.
+    return self.m.step(name, cmd, infra_step=True, ok_ret='any')
+
   def _isolated_script_collect_step(self, task, **kwargs):
     """Collects results for a step that is *not* a googletest, like telemetry.
     """
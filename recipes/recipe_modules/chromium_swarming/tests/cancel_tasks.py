@@ -0,0 +1,59 @@
+# Copyright 2022 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+DEPS = [
+    'chromium_swarming',
+    'recipe_engine/properties',
+]
+
+from recipe_engine import post_process
+from recipe_engine.recipe_api import Property
+
+PROPERTIES = {
+    'trigger': Property(default=True, kind=bool),
+}
+
+
+def RunSteps(api, trigger):
+  task = api.chromium_swarming.task(
+      name='test-task', cas_input_root='00deadbeef00/size', shards=2)
+  if trigger:
+    api.chromium_swarming.trigger_task(task)
+  api.chromium_swarming.cancel_tasks([task])
+
+
+def GenTests(api):
+  yield api.test(
+      'basic',
+      api.post_process(
+          post_process.StepCommandContains,
+          'cancel tasks',
+          [
+              'vpython3',
+              '[START_DIR]/swarming.client/swarming.py',
+              'cancel',
+              '-S',
+              'https://example.swarmingserver.appspot.com',
+          ],
+      ),
+      api.post_process(post_process.StatusSuccess),
+      api.post_process(post_process.DropExpectation),
+  )
+
+  # Tasks may finish before they are cancelled, which doesn't fail the build.
+  yield api.test(
+      'already_finished',
+      api.step_data('cancel tasks', retcode=1),
+      api.post_process(post_process.MustRun, 'cancel tasks'),
+      api.post_process(post_process.StatusSuccess),
+      api.post_process(post_process.DropExpectation),
+  )
+
+  yield api.test(
+      'not_triggered',
+      api.properties(trigger=False),
+      api.expect_exception('AssertionError'),
+      api.post_process(post_process.DoesNotRun, 'cancel tasks'),
+      api.post_process(post_process.DropExpectation),
+  )
@@ -28,9 +28,53 @@ def get_aggregated_coverage_data_from_files(files_coverage_data,
     GroupCoverageSummary data, and the other one is a dict mapping from
     component to GroupCoverageSummary data.
   """
-  per_directory_summaries = _caclulate_per_directory_summaries(
-      files_coverage_data)
-  per_directory_files = _calculate_per_directory_files(files_coverage_data)
+  return merge_partial_aggregated_coverage_data(
+      [get_partial_aggregated_coverage_data(files_coverage_data)],
+      dir_to_component)
+
+
+def get_partial_aggregated_coverage_data(files_coverage_data):
+  """Aggregates a subset of the files coverage data to directories.
+
+  The results of disjoint subsets of files, e.g. computed in different
+  processes, can be combined with `merge_partial_aggregated_coverage_data`.
+
+  Args:
+    files_coverage_data (list): A list of File coverage data.
+
+  Returns:
+    A tuple of two elements: the first one is a dict mapping from directory to
+    coverage metric summaries, and the other one is a dict mapping from
+    directory to a list of CoverageSummary for file.
+  """
+  return (dict(_caclulate_per_directory_summaries(files_coverage_data)),
+          dict(_calculate_per_directory_files(files_coverage_data)))
+
+
+def merge_partial_aggregated_coverage_data(partial_aggregations,
+                                           dir_to_component=None):
+  """Merges partial aggregations to directories and components.
+
+  Args:
+    partial_aggregations (list): A list of the results of
+        `get_partial_aggregated_coverage_data`, one per subset of the files.
+        The merged summaries are updated in place.
+    dir_to_component (dict): Mapping from directory to component. Optional.
+
+  Returns:
+    Same as `get_aggregated_coverage_data_from_files`.
+  """
+  per_directory_summaries = {}
+  per_directory_files = defaultdict(list)
+  for partial_summaries, partial_files in partial_aggregations:
+    for dir_path, summaries in partial_summaries.items():
+      if dir_path in per_directory_summaries:
+        _merge_summary(per_directory_summaries[dir_path], summaries)
+      else:
+        per_directory_summaries[dir_path] = summaries
+    for dir_path, files in partial_files.items():
+      per_directory_files[dir_path].extend(files)
+
   per_directory_subdirs = _calculate_per_directory_subdirs(
       per_directory_summaries)
   per_directory_coverage_data = {}
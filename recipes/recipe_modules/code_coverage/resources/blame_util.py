@@ -5,14 +5,18 @@
 """Utility to generate blame list data."""
 
 from collections import defaultdict
+import concurrent.futures
+import datetime
+import json
 import logging
+import os
 import re
 import subprocess
 
 BLAME_LIST_HEADER_REGEX = re.compile(r'<(.+)>\s(.+)\s(.+)\s(.+)\s+(.+)')
 
 
-def generate_blame_list(src_path, files, num_weeks=4):
+def generate_blame_list(src_path, files, num_weeks=4, jobs=1, cache_dir=None):
   """Generates blame list data for given set of files.
 
   Args:
@@ -23,6 +27,12 @@ def generate_blame_list(src_path, files, num_weeks=4):
           a double-slash(//)
     num_weeks(int): Time period to consider for blame list
           generation.
+    jobs(int): Number of "git blame" processes to run
+          concurrently.
+    cache_dir(str): Optional directory to cache the parsed
+          blame lists in, keyed by file, HEAD commit and
+          num_weeks. As the time period is relative to today,
+          cached blame lists are only reused on the same day.
 
   Returns a dict which looks like following
   {
@@ -34,23 +44,79 @@ def generate_blame_list(src_path, files, num_weeks=4):
   where keys are author emails and values are lists containing
   line numbers modified by the author in past num_weeks.
   """
-  response = {}
+  cache_file = None
+  cache = {}
+  if cache_dir:
+    cache_file = _get_cache_file(src_path, cache_dir, num_weeks)
+    cache = _load_cache(cache_file)
+
+  files_to_blame = []
   for file_name in files:
     assert file_name.startswith('//')
-    # remove leading double-slash(//) from file name while invoking command
-    cmd = ['git', 'blame', '-e', '--since=%d.weeks' % num_weeks, file_name[2:]]
-    try:
-      blame_output = subprocess.check_output(cmd, cwd=src_path, text=True)
-      blame_lines = blame_output.splitlines()
-      blame_list = _parse_blame_list(blame_lines)
-      if blame_list:
-        response[file_name] = blame_list
-    except subprocess.CalledProcessError as e:
-      logging.error('Unable to calculate blame list for file %s' % file_name)
-      logging.error(e.output)
+    if file_name not in cache:
+      files_to_blame.append(file_name)
+
+  with concurrent.futures.ThreadPoolExecutor(max(1, jobs)) as executor:
+    blame_lists = executor.map(
+        lambda f: _get_blame_list(src_path, f, num_weeks), files_to_blame)
+    for file_name, blame_list in zip(files_to_blame, blame_lists):
+      # Failures are not cached so that they are retried on the next run.
+      if blame_list is not None:
+        cache[file_name] = blame_list
+
+  if cache_file and files_to_blame:
+    _save_cache(cache_file, cache)
+
+  response = {}
+  for file_name in files:
+    if cache.get(file_name):
+      response[file_name] = cache[file_name]
   return response
 
 
+def _get_blame_list(src_path, file_name, num_weeks):
+  """Returns the parsed blame list of a file, or None if git blame failed."""
+  # remove leading double-slash(//) from file name while invoking command
+  cmd = ['git', 'blame', '-e', '--since=%d.weeks' % num_weeks, file_name[2:]]
+  try:
+    blame_output = subprocess.check_output(cmd, cwd=src_path, text=True)
+  except subprocess.CalledProcessError as e:
+    logging.error('Unable to calculate blame list for file %s' % file_name)
+    logging.error(e.output)
+    return None
+  return _parse_blame_list(blame_output.splitlines())
+
+
+def _get_cache_file(src_path, cache_dir, num_weeks):
+  """Returns the path to the cache file for the current HEAD and time period."""
+  head = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                 cwd=src_path,
+                                 text=True).strip()
+  return os.path.join(
+      cache_dir, 'blame_%s_%dweeks_%s.json' %
+      (head, num_weeks, datetime.date.today().strftime('%Y%m%d')))
+
+
+def _load_cache(cache_file):
+  if not os.path.isfile(cache_file):
+    return {}
+  try:
+    with open(cache_file) as f:
+      return json.load(f)
+  except ValueError:
+    logging.warning('Ignoring corrupted blame list cache %s', cache_file)
+    return {}
+
+
+def _save_cache(cache_file, cache):
+  if not os.path.isdir(os.path.dirname(cache_file)):
+    os.makedirs(os.path.dirname(cache_file))
+  tmp_file = cache_file + '.tmp'
+  with open(tmp_file, 'w') as f:
+    json.dump(cache, f)
+  os.replace(tmp_file, cache_file)
+
+
 def _parse_blame_list(lines):
   """Parses git blame output."""
   response = defaultdict(list)
@@ -6,7 +6,10 @@
 
 import argparse
 import collections
+import concurrent.futures
+import contextlib
 import copy
+import functools
 import json
 import logging
 import os
@@ -16,15 +19,31 @@ import stat
 import subprocess
 import sys
 import tempfile
+import threading
 import time
 import zlib
 
 import aggregation_util
 import repository_util
 
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
 IS_WIN = platform.system() == 'Windows'
 IS_MAC = platform.system() == 'Darwin'
 
+# Number of characters read at a time when streaming the llvm-cov export.
+_STREAM_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Number of files in each coverage%d.json shard written to the output dir.
+_LLVM_DATA_SHARD_SIZE = 500
+
+# When generating per-target summaries in parallel, no new llvm-cov process is
+# launched while less memory than this is available, unless none is running.
+_MIN_AVAILABLE_MEMORY_BYTES = 4 * 1024 * 1024 * 1024
+
 
 def _posix_path(rawpath):
   return rawpath.replace(os.sep, '/')
@@ -139,6 +158,113 @@ def _extract_coverage_info(segments):
   return line_data, block_data
 
 
+def _extract_coverage_info_numpy(segments):
+  """Same as `_extract_coverage_info`, but computed with numpy array sweeps.
+
+  Instead of walking the segments line by line, the segments are turned into
+  columns (line, col, count, has_count, is_region_entry) and every line's
+  execution count and uncovered blocks are derived from them at once. Falls
+  back to `_extract_coverage_info` for input it can't represent, e.g. when the
+  segments are not sorted or the counts overflow 64-bit integers.
+  """
+  try:
+    columns = numpy.array(segments, dtype=numpy.int64).reshape(-1, 5)
+  except (OverflowError, TypeError, ValueError):
+    return _extract_coverage_info(segments)
+  seg_lines = columns[:, 0]
+  if (len(seg_lines) == 0 or seg_lines[0] < 1 or
+      numpy.any(seg_lines[1:] < seg_lines[:-1])):
+    return _extract_coverage_info(segments)
+  seg_cols = columns[:, 1]
+  seg_counts = columns[:, 2]
+  seg_has_count = columns[:, 3] != 0
+  seg_is_entry = columns[:, 4] != 0
+  seg_starts_region = seg_has_count & seg_is_entry
+
+  # Per line columns, for lines 1 up to one past the last segment's line.
+  lines = numpy.arange(1, seg_lines[-1] + 2)
+  first = numpy.searchsorted(seg_lines, lines, side='left')
+  end = numpy.searchsorted(seg_lines, lines, side='right')
+  has_segments = end > first
+
+  # The wrap segment of a line is the last segment that starts before it.
+  wrap = first - 1
+  has_wrap = wrap >= 0
+  wrap = numpy.maximum(wrap, 0)
+  wrap_has_count = has_wrap & seg_has_count[wrap]
+  wrap_count = numpy.where(has_wrap, seg_counts[wrap], 0)
+
+  starts_region_sums = numpy.concatenate(
+      ([0], numpy.cumsum(seg_starts_region)))
+  line_starts_new_region = (
+      starts_region_sums[end] - starts_region_sums[first] > 0)
+  first_in_line = numpy.minimum(first, len(seg_lines) - 1)
+  is_start_of_skipped_region = (
+      has_segments & ~seg_has_count[first_in_line] &
+      seg_is_entry[first_in_line])
+  is_coverable = ~is_start_of_skipped_region & (
+      wrap_has_count | line_starts_new_region)
+
+  # Maximum count of the segments starting a region, for each line.
+  group_starts = numpy.flatnonzero(
+      numpy.concatenate(([True], seg_lines[1:] != seg_lines[:-1])))
+  region_counts = numpy.maximum.reduceat(
+      numpy.where(seg_starts_region, seg_counts, 0), group_starts)
+  execution_counts = wrap_count.copy()
+  group_line_indices = seg_lines[group_starts] - 1
+  execution_counts[group_line_indices] = numpy.maximum(
+      execution_counts[group_line_indices], region_counts)
+
+  line_data = dict(
+      zip(lines[is_coverable].tolist(),
+          execution_counts[is_coverable].tolist()))
+
+  # Uncovered blocks are only computed for covered lines. A segment closes a
+  # block if the segment before it, which is the wrap segment for the first
+  # segment of a line, is instrumented and not executed.
+  block_data = collections.defaultdict(list)
+  has_blocks = is_coverable & (execution_counts != 0)
+  seg_has_blocks = has_blocks[seg_lines - 1]
+  seg_is_uncovered = seg_has_count & (seg_counts == 0)
+  seg_is_first_in_line = numpy.zeros(len(seg_lines), dtype=bool)
+  seg_is_first_in_line[group_starts] = True
+  seg_is_last_in_line = numpy.zeros(len(seg_lines), dtype=bool)
+  seg_is_last_in_line[numpy.append(group_starts[1:] - 1, len(seg_lines) - 1)] = (
+      True)
+  closes_block = seg_has_blocks & numpy.concatenate(
+      ([False], seg_is_uncovered[:-1]))
+  col_starts = numpy.where(seg_is_first_in_line, 1,
+                           numpy.concatenate(([1], seg_cols[:-1])))
+  # Use -1 to indicate block extends to end of line.
+  ends_line_block = seg_has_blocks & seg_is_last_in_line & seg_is_uncovered
+
+  block_indices = numpy.concatenate(
+      (numpy.flatnonzero(closes_block), numpy.flatnonzero(ends_line_block)))
+  block_lines = seg_lines[block_indices]
+  block_starts = numpy.concatenate(
+      (col_starts[closes_block], seg_cols[ends_line_block]))
+  block_ends = numpy.concatenate(
+      (seg_cols[closes_block] - 1,
+       numpy.full(numpy.count_nonzero(ends_line_block), -1)))
+  is_line_end = numpy.concatenate(
+      (numpy.zeros(numpy.count_nonzero(closes_block), dtype=bool),
+       numpy.ones(numpy.count_nonzero(ends_line_block), dtype=bool)))
+  order = numpy.lexsort((is_line_end, block_indices))
+  for line_num, start, end in zip(block_lines[order].tolist(),
+                                  block_starts[order].tolist(),
+                                  block_ends[order].tolist()):
+    block_data[line_num].append([start, end])
+
+  return line_data, block_data
+
+
+# Engines that convert llvm segments to line and uncovered block data.
+_COVERAGE_ENGINES = {
+    'python': _extract_coverage_info,
+    'numpy': _extract_coverage_info_numpy,
+}
+
+
 def _to_compressed_format(line_data, block_data):
   """Turns output of `_extract_coverage_info` to a compressed format."""
   line_data = sorted(list(line_data.items()), key=lambda x: x[0])
@@ -218,7 +344,8 @@ def _rebase_line_and_block_data(line_data, block_data, line_mapping):
 
 def _to_compressed_file_record(file_coverage_data,
                                diff_mapping=None,
-                               third_party_inclusion_subdirs=None):
+                               third_party_inclusion_subdirs=None,
+                               coverage_engine='python'):
   """Converts the given Clang file coverage data to coverage metadata format.
 
   Coverage metadata format:
@@ -252,6 +379,8 @@ def _to_compressed_file_record(file_coverage_data,
                   well as the line itself.
     third_party_inclusion_subdirs (list): List of third_party subdirs to be
                   included in the aggregation
+    coverage_engine (str): Key of `_COVERAGE_ENGINES` to extract the line and
+                  block coverage info with.
 
   Returns:
     A json conforming to `File` proto representing the file coverage.
@@ -262,7 +391,8 @@ def _to_compressed_file_record(file_coverage_data,
       not any(x in coverage_path for x in third_party_inclusion_subdirs)):
     return None
 
-  line_data, block_data = _extract_coverage_info(file_coverage_data['segments'])
+  line_data, block_data = _COVERAGE_ENGINES[coverage_engine](
+      file_coverage_data['segments'])
 
   if diff_mapping is not None and coverage_path in diff_mapping:
     line_mapping = diff_mapping[coverage_path]
@@ -334,15 +464,16 @@ def _compute_llvm_args(profdata_path,
   return args
 
 
+def _bytes_to_gb(num):
+  if num is None:
+    return 'N/A'
+  return '%.2fG' % (num / 1024.0 / 1024 / 1024)
+
+
 def _show_system_resource_usage(proc):
   if proc is None:
     return
 
-  def bytes_to_gb(num):
-    if num is None:
-      return 'N/A'
-    return '%.2fG' % (num / 1024.0 / 1024 / 1024)
-
   # Dump the memory, cpu, and disk io usage of the process.
   try:
     logging.info('Thread numbers: %d', proc.num_threads())
@@ -350,31 +481,31 @@ def _show_system_resource_usage(proc):
     p_mem = proc.memory_info()
     if IS_WIN or IS_MAC:
       logging.info('llvm-cov Memory: '
-                   'RSS=%s,  VMS=%s', bytes_to_gb(p_mem.rss),
-                   bytes_to_gb(p_mem.vms))
+                   'RSS=%s,  VMS=%s', _bytes_to_gb(p_mem.rss),
+                   _bytes_to_gb(p_mem.vms))
     else:
       logging.info('llvm-cov Memory: '
-                   'RSS=%s,  VMS=%s, shared=%s', bytes_to_gb(p_mem.rss),
-                   bytes_to_gb(p_mem.vms), bytes_to_gb(p_mem.shared))
+                   'RSS=%s,  VMS=%s, shared=%s', _bytes_to_gb(p_mem.rss),
+                   _bytes_to_gb(p_mem.vms), _bytes_to_gb(p_mem.shared))
 
     os_vm = psutil.virtual_memory()
     if IS_WIN or IS_MAC:
       logging.info('OS virtual Memory: '
                    'available=%s, used=%s, free=%s',
-                   bytes_to_gb(os_vm.available), bytes_to_gb(os_vm.used),
-                   bytes_to_gb(os_vm.free))
+                   _bytes_to_gb(os_vm.available), _bytes_to_gb(os_vm.used),
+                   _bytes_to_gb(os_vm.free))
     else:
       logging.info(
           'OS virtual Memory: '
           'available=%s, used=%s, free=%s, cached=%s, shared=%s',
-          bytes_to_gb(os_vm.available), bytes_to_gb(os_vm.used),
-          bytes_to_gb(os_vm.free), bytes_to_gb(os_vm.cached),
-          bytes_to_gb(os_vm.shared))
+          _bytes_to_gb(os_vm.available), _bytes_to_gb(os_vm.used),
+          _bytes_to_gb(os_vm.free), _bytes_to_gb(os_vm.cached),
+          _bytes_to_gb(os_vm.shared))
 
     os_sm = psutil.swap_memory()
     logging.info('OS swap: '
-                 'used=%s, free=%s', bytes_to_gb(os_sm.used),
-                 bytes_to_gb(os_sm.free))
+                 'used=%s, free=%s', _bytes_to_gb(os_sm.used),
+                 _bytes_to_gb(os_sm.free))
 
     p_cpu_times = proc.cpu_times()
     cpu_percent = proc.cpu_percent(interval=1)
@@ -385,13 +516,13 @@ def _show_system_resource_usage(proc):
 
     os_disk_io = psutil.disk_io_counters()
     logging.info('OS-level disk io: write=%s, read=%s',
-                 bytes_to_gb(os_disk_io.write_bytes),
-                 bytes_to_gb(os_disk_io.read_bytes))
+                 _bytes_to_gb(os_disk_io.write_bytes),
+                 _bytes_to_gb(os_disk_io.read_bytes))
     if not IS_MAC:
       p_disk_io = proc.io_counters()
       logging.info('llvm-cov disk io: write=%s, read=%s',
-                   bytes_to_gb(p_disk_io.write_bytes),
-                   bytes_to_gb(p_disk_io.read_bytes))
+                   _bytes_to_gb(p_disk_io.write_bytes),
+                   _bytes_to_gb(p_disk_io.read_bytes))
   except psutil.Error:  # The process might already have finished.
     pass
   # TODO(crbug.com/1203700): Remove the except block after psutil is in a newer
@@ -400,9 +531,9 @@ def _show_system_resource_usage(proc):
     logging.warning('ValueError caught when showing system info: %s', error)
 
 
-def _get_raw_coverage_data(profdata_path, llvm_cov_path, build_dir, binaries,
-                           sources, output_dir, exclusions, arch):
-  """Creates a coverage.json object in output_dir and returns its content."""
+def _run_llvm_cov_export(profdata_path, llvm_cov_path, build_dir, binaries,
+                         sources, output_dir, exclusions, arch):
+  """Runs `llvm-cov export` and returns the path to the json file it wrote."""
   coverage_json_file = os.path.join(output_dir, 'coverage_raw.json')
   error_out_file = os.path.join(output_dir, 'llvm_cov.stderr.log')
   p = None
@@ -446,10 +577,134 @@ def _get_raw_coverage_data(profdata_path, llvm_cov_path, build_dir, binaries,
           print(error_f.read())
         sys.exit(p.returncode)
 
+  return coverage_json_file
+
+
+def _get_raw_coverage_data(profdata_path, llvm_cov_path, build_dir, binaries,
+                           sources, output_dir, exclusions, arch):
+  """Creates a coverage.json object in output_dir and returns its content."""
+  coverage_json_file = _run_llvm_cov_export(profdata_path, llvm_cov_path,
+                                            build_dir, binaries, sources,
+                                            output_dir, exclusions, arch)
   logging.info('---------------------Processing metadata--------------------')
-  if p and p.returncode == 0:
-    with open(coverage_json_file, 'r') as f:
-      return json.load(f)
+  with open(coverage_json_file, 'r') as f:
+    return json.load(f)
+
+
+class _LlvmExportStream(object):
+  """Incrementally parses the json written by `llvm-cov export`.
+
+  Only the file records under 'data'/'files' are handed out, one at a time, so
+  memory usage is bounded by the size of a single file record rather than the
+  whole export. Other top-level keys, such as 'type' and 'version', are
+  collected into |metadata| while parsing.
+  """
+
+  def __init__(self, fp, chunk_size=_STREAM_CHUNK_SIZE):
+    self.metadata = {}
+    self._fp = fp
+    self._chunk_size = chunk_size
+    self._decoder = json.JSONDecoder()
+    self._buffer = ''
+    self._pos = 0
+    self._eof = False
+
+  def iter_files(self):
+    """Yields the llvm file coverage records in the order they appear."""
+    for key in self._iter_object():
+      if key != 'data':
+        self.metadata[key] = self._decode()
+        continue
+      for _ in self._iter_array():
+        for datum_key in self._iter_object():
+          if datum_key != 'files':
+            # Discard 'totals' and the (skipped) 'functions'.
+            self._decode()
+            continue
+          for _ in self._iter_array():
+            yield self._decode()
+
+  def _fill(self):
+    """Reads more data into the buffer, returns False at the end of file."""
+    if self._eof:
+      return False
+    self._buffer = self._buffer[self._pos:]
+    self._pos = 0
+    # Grow geometrically so that huge records are not re-decoded too often.
+    chunk = self._fp.read(max(self._chunk_size, len(self._buffer)))
+    if not chunk:
+      self._eof = True
+      return False
+    self._buffer += chunk
+    return True
+
+  def _peek(self):
+    """Returns the next non-whitespace character without consuming it."""
+    while True:
+      while (self._pos < len(self._buffer) and
+             self._buffer[self._pos] in ' \t\r\n'):
+        self._pos += 1
+      if self._pos < len(self._buffer):
+        return self._buffer[self._pos]
+      if not self._fill():
+        raise ValueError('Unexpected end of llvm-cov export data')
+
+  def _consume(self, expected):
+    char = self._peek()
+    if char != expected:
+      raise ValueError('Expected %r but got %r in llvm-cov export data' %
+                       (expected, char))
+    self._pos += 1
+
+  def _is_last_item(self, closing):
+    """Consumes the separator after an item, returns True if it closed."""
+    char = self._peek()
+    self._pos += 1
+    if char == closing:
+      return True
+    if char != ',':
+      raise ValueError('Unexpected %r in llvm-cov export data' % char)
+    return False
+
+  def _decode(self):
+    """Decodes and returns the json value at the current position."""
+    self._peek()
+    while True:
+      try:
+        value, end = self._decoder.raw_decode(self._buffer, self._pos)
+      except ValueError:
+        if self._fill():
+          continue
+        raise
+      # A number at the very end of the buffer might have been cut in half.
+      if end == len(self._buffer) and self._fill():
+        continue
+      self._pos = end
+      return value
+
+  def _iter_object(self):
+    """Yields the keys of an object, the caller must consume each value."""
+    self._consume('{')
+    if self._peek() == '}':
+      self._pos += 1
+      return
+    while True:
+      key = self._decode()
+      self._consume(':')
+      yield key
+      if self._is_last_item('}'):
+        return
+
+  def _iter_array(self):
+    """Yields once per array element, the caller must consume the element."""
+    self._consume('[')
+    if self._peek() == ']':
+      self._pos += 1
+      return
+    while True:
+      yield
+      if self._is_last_item(']'):
+        return
 
 
 def _split_metadata_in_shards_if_necessary(output_dir, files_dir,
@@ -515,33 +770,145 @@ def _split_metadata_in_shards_if_necessary(output_dir, files_dir,
   return compressed_data
 
 
-def _get_per_target_coverage_summary(profdata_path, llvm_cov_path, build_dir,
-                                     binaries, arch):
-  logging.info('Generating per-target coverage summaries ...')
-  summaries = {}
-  for binary in binaries:
-    args = _compute_llvm_args(
-        profdata_path,
-        llvm_cov_path,
-        build_dir, [binary],
-        summary_only=True,
-        arch=arch)
+class _MemoryAwareThrottle(object):
+  """Limits concurrent llvm-cov processes based on the available memory.
+
+  A new process is only allowed to start if the OS reports at least
+  |min_available_bytes| of available memory, or if no other process started
+  through this throttle is still running, so that progress is always made.
+  """
+
+  def __init__(self, min_available_bytes, poll_interval_seconds=5):
+    self._min_available_bytes = min_available_bytes
+    self._poll_interval_seconds = poll_interval_seconds
+    self._condition = threading.Condition()
+    self._num_running = 0
+
+  def _has_enough_memory(self):
+    available = psutil.virtual_memory().available
+    if available >= self._min_available_bytes:
+      return True
+    logging.info(
+        'Waiting to launch llvm-cov: available memory=%s, running=%d',
+        _bytes_to_gb(available), self._num_running)
+    return False
+
+  @contextlib.contextmanager
+  def acquire(self):
+    with self._condition:
+      while self._num_running and not self._has_enough_memory():
+        self._condition.wait(self._poll_interval_seconds)
+      self._num_running += 1
     try:
+      yield
+    finally:
+      with self._condition:
+        self._num_running -= 1
+        self._condition.notify_all()
+
+
+def _get_binary_coverage_summary(profdata_path,
+                                 llvm_cov_path,
+                                 build_dir,
+                                 binary,
+                                 arch,
+                                 num_threads=None,
+                                 throttle=None):
+  """Returns the coverage totals of a single binary, or None on failure."""
+  args = _compute_llvm_args(
+      profdata_path,
+      llvm_cov_path,
+      build_dir, [binary],
+      num_threads=num_threads,
+      summary_only=True,
+      arch=arch)
+  output = None
+  try:
+    with throttle.acquire() if throttle else contextlib.nullcontext():
       output = subprocess.check_output(args, text=True)
-      summaries[binary] = json.loads(output)['data'][0]['totals']
-    except subprocess.CalledProcessError as e:
-      logging.warn('Summary for binary %s failed with return code %d', binary,
-                   e.returncode)
-      logging.warn('%s', e.output)
-      continue
-    except (ValueError, TypeError):
-      logging.warn('Invalid JSON output for binary %s', binary)
-      logging.warn('%s', output)
-      continue
+    return json.loads(output)['data'][0]['totals']
+  except subprocess.CalledProcessError as e:
+    logging.warn('Summary for binary %s failed with return code %d', binary,
+                 e.returncode)
+    logging.warn('%s', e.output)
+  except (ValueError, TypeError):
+    logging.warn('Invalid JSON output for binary %s', binary)
+    logging.warn('%s', output)
+  return None
+
+
+def _get_per_target_coverage_summary(profdata_path,
+                                     llvm_cov_path,
+                                     build_dir,
+                                     binaries,
+                                     arch,
+                                     jobs=1):
+  """Returns a dict mapping each binary to its coverage totals.
+
+  Args:
+    jobs: Number of llvm-cov processes to run concurrently. When greater than
+          1, the cpu cores are split evenly between them and new processes are
+          throttled by the available memory. The binaries are always reported
+          in the order they were given.
+  """
+  logging.info('Generating per-target coverage summaries ...')
+  if jobs > 1:
+    num_threads = max(1, psutil.cpu_count() // jobs)
+    throttle = _MemoryAwareThrottle(_MIN_AVAILABLE_MEMORY_BYTES)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+      results = list(
+          executor.map(
+              lambda binary: _get_binary_coverage_summary(
+                  profdata_path, llvm_cov_path, build_dir, binary, arch,
+                  num_threads, throttle), binaries))
+  else:
+    results = [
+        _get_binary_coverage_summary(profdata_path, llvm_cov_path, build_dir,
+                                     binary, arch) for binary in binaries
+    ]
+  summaries = {}
+  for binary, summary in zip(binaries, results):
+    if summary is not None:
+      summaries[binary] = summary
   logging.info('Done generating per-target coverage summaries')
   return summaries
 
 
+def _cleanup_file_coverage_data(src_path, file_coverage_data):
+  """Performs cleanup on the raw coverage data of a single file.
+
+  Returns the cleaned up file coverage data, or None if the file should not be
+  reported.
+  """
+  # TODO(crbug.com/1010267) Remove prefixes when Clang supports
+  # relative paths for coverage.
+  prefixes = [
+      src_path,
+      r'C:\botcode\w',  # crbug.com/1010267
+      '/b/f/w',  # crbug.com/1061603
+      '/b/s/w/ir/cache/builder/src',  # crbug.com/1208128
+      '/this/path/is/set'  # crbug.com/1208128
+  ]
+  filename = os.path.normpath(file_coverage_data['filename'])
+  for prefix in prefixes:
+    if filename.startswith(prefix):
+      filename = filename[len(prefix):]
+      break
+  filename = _posix_path(filename).lstrip('/')
+  # Do not generate coverage for out/ paths as it consists of automatically
+  # generated code.
+  if filename.startswith('out/'):
+    return None
+  segments = file_coverage_data['segments']
+  if not segments:
+    return None
+  return {
+      'filename': filename,
+      'segments': segments,
+      'summary': file_coverage_data['summary']
+  }
+
+
 def _cleanup_coverage_data(src_path, llvm_raw_data):
   """Performs cleanup on raw coverage data like rebasing file paths etc.
 
@@ -551,33 +918,9 @@ def _cleanup_coverage_data(src_path, llvm_raw_data):
   cleaned_file_data = []
   for datum in llvm_raw_data['data']:
     for file_coverage_data in datum['files']:
-      # TODO(crbug.com/1010267) Remove prefixes when Clang supports
-      # relative paths for coverage.
-      prefixes = [
-          src_path,
-          r'C:\botcode\w',  # crbug.com/1010267
-          '/b/f/w',  # crbug.com/1061603
-          '/b/s/w/ir/cache/builder/src',  # crbug.com/1208128
-          '/this/path/is/set'  # crbug.com/1208128
-      ]
-      filename = os.path.normpath(file_coverage_data['filename'])
-      for prefix in prefixes:
-        if filename.startswith(prefix):
-          filename = filename[len(prefix):]
-          break
-      filename = _posix_path(filename).lstrip('/')
-      # Do not generate coverage for out/ paths as it consists of automatically
-      # generated code.
-      if filename.startswith('out/'):
-        continue
-      segments = file_coverage_data['segments']
-      if not segments:
-        continue
-      cleaned_file_data.append({
-          'filename': filename,
-          'segments': segments,
-          'summary': file_coverage_data['summary']
-      })
+      cleaned = _cleanup_file_coverage_data(src_path, file_coverage_data)
+      if cleaned:
+        cleaned_file_data.append(cleaned)
   return {
       'data': [{
           'files': cleaned_file_data
@@ -610,7 +953,160 @@ def _write_coverage_to_disk(output_dir, output_file_name, data):
     json.dump(data, fp)
 
 
-def _split_llvm_data_in_shards(data, shard_size=500):
+class _StreamingCoverageWriter(object):
+  """Incrementally writes cleaned up file coverage data to disk.
+
+  Produces the same coverage.json and coverage%d.json files as
+  `_write_coverage_to_disk` and `_split_llvm_data_in_shards` do, without
+  holding all the file coverage data in memory. 'type' and 'version' are only
+  known once the whole llvm-cov export has been read, so they are appended to
+  every file in `close`.
+  """
+
+  def __init__(self, output_dir, shard_size=_LLVM_DATA_SHARD_SIZE):
+    self._output_dir = output_dir
+    self._shard_size = shard_size
+    self._shard_paths = []
+    self._shard_file = None
+    self._num_files = 0
+    self._coverage_file = self._open_data_file(
+        os.path.join(output_dir, 'coverage.json'))
+
+  @staticmethod
+  def _open_data_file(path):
+    f = open(path, 'w')
+    f.write('{"data": [{"files": [')
+    return f
+
+  def add(self, file_coverage_data):
+    """Writes the cleaned up coverage data of a single file."""
+    record = json.dumps(file_coverage_data)
+    if self._num_files:
+      self._coverage_file.write(', ')
+    self._coverage_file.write(record)
+
+    if self._num_files % self._shard_size == 0:
+      if self._shard_file:
+        self._shard_file.close()
+      path = os.path.join(self._output_dir,
+                          'coverage%d.json' % len(self._shard_paths))
+      self._shard_paths.append(path)
+      self._shard_file = self._open_data_file(path)
+    else:
+      self._shard_file.write(', ')
+    self._shard_file.write(record)
+    self._num_files += 1
+
+  def close(self, metadata):
+    """Finishes all written files with the export's 'type' and 'version'."""
+    trailer = ']}], "type": %s, "version": %s}' % (json.dumps(
+        metadata.get('type')), json.dumps(metadata.get('version')))
+    self._coverage_file.write(trailer)
+    self._coverage_file.close()
+    if self._shard_file:
+      self._shard_file.close()
+    for path in self._shard_paths:
+      with open(path, 'a') as f:
+        f.write(trailer)
+
+
+def _stream_coverage_data(src_path, output_dir, coverage_json_file,
+                          diff_mapping, third_party_inclusion_subdirs,
+                          coverage_engine, aggregate, jobs):
+  """Cleans up and compresses the llvm-cov export as it is being read.
+
+  The cleaned up files are grouped in shards of `_LLVM_DATA_SHARD_SIZE` files,
+  so at most a few shards are held in memory at any time.
+
+  Returns:
+    Same as `_compress_llvm_data_shards`.
+  """
+  writer = _StreamingCoverageWriter(output_dir)
+  with open(coverage_json_file, 'r') as f:
+    stream = _LlvmExportStream(f)
+
+    def _iter_shards():
+      files_data = []
+      for file_coverage_data in stream.iter_files():
+        cleaned = _cleanup_file_coverage_data(src_path, file_coverage_data)
+        if not cleaned:
+          continue
+        writer.add(cleaned)
+        files_data.append(cleaned)
+        if len(files_data) == _LLVM_DATA_SHARD_SIZE:
+          yield {'data': [{'files': files_data}]}
+          files_data = []
+      if files_data:
+        yield {'data': [{'files': files_data}]}
+
+    results = list(
+        _compress_llvm_data_shards(_iter_shards(), diff_mapping,
+                                   third_party_inclusion_subdirs,
+                                   coverage_engine, aggregate, jobs))
+  writer.close(stream.metadata)
+  return results
+
+
+def _compress_llvm_data_shard(shard, diff_mapping,
+                              third_party_inclusion_subdirs, coverage_engine,
+                              aggregate):
+  """Converts the files of a shard of llvm coverage data to metadata format.
+
+  This runs in worker processes, so everything it takes and returns must be
+  picklable.
+
+  Returns:
+    A tuple (files_coverage, partial_aggregation) where files_coverage is a
+    list of compressed file records, and partial_aggregation is the result of
+    `aggregation_util.get_partial_aggregated_coverage_data` on them, or None if
+    |aggregate| is False or no file has coverage.
+  """
+  files_coverage = []
+  for datum in shard['data']:
+    for file_data in datum['files']:
+      record = _to_compressed_file_record(file_data, diff_mapping,
+                                          third_party_inclusion_subdirs,
+                                          coverage_engine)
+      if record:
+        files_coverage.append(record)
+  partial_aggregation = None
+  if aggregate and files_coverage:
+    partial_aggregation = (
+        aggregation_util.get_partial_aggregated_coverage_data(files_coverage))
+  return files_coverage, partial_aggregation
+
+
+def _compress_llvm_data_shards(shards, diff_mapping,
+                               third_party_inclusion_subdirs, coverage_engine,
+                               aggregate, jobs):
+  """Yields the result of `_compress_llvm_data_shard` for each shard in order.
+
+  If |jobs| is greater than 1, the shards are processed by a pool of that many
+  processes. At most 2 * |jobs| shards are submitted ahead of the one being
+  yielded, so that |shards| can be a generator reading data lazily.
+  """
+  compress = functools.partial(
+      _compress_llvm_data_shard,
+      diff_mapping=diff_mapping,
+      third_party_inclusion_subdirs=third_party_inclusion_subdirs,
+      coverage_engine=coverage_engine,
+      aggregate=aggregate)
+  if jobs <= 1:
+    for shard in shards:
+      yield compress(shard)
+    return
+
+  with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+    pending = collections.deque()
+    for shard in shards:
+      pending.append(executor.submit(compress, shard))
+      if len(pending) >= 2 * jobs:
+        yield pending.popleft().result()
+    while pending:
+      yield pending.popleft().result()
+
+
+def _split_llvm_data_in_shards(data, shard_size=_LLVM_DATA_SHARD_SIZE):
   """Splits llvm coverage data into smaller shards."""
   shards = []
   for datum in data['data']:
@@ -641,7 +1137,12 @@ def _generate_metadata(src_path,
                        diff_mapping=None,
                        exclusions=None,
                        third_party_inclusion_subdirs=None,
-                       arch=None):
+                       arch=None,
+                       stream_llvm_export=False,
+                       summary_jobs=1,
+                       coverage_engine='python',
+                       jobs=1,
+                       git_revisions_cache_path=None):
   """Generates code coverage metadata.
 
   Args:
@@ -661,6 +1162,15 @@ def _generate_metadata(src_path,
     third_party_inclusion_subdirs (list): List of third_party subdirs to be
               included in the aggregation
     arch: A string indicating the architecture of the binaries.
+    stream_llvm_export: If True, processes the llvm-cov export one file at a
+                        time instead of loading it into memory as a whole.
+    summary_jobs: Number of per-target summaries to generate concurrently.
+    coverage_engine: Key of `_COVERAGE_ENGINES` to process the segments with.
+    jobs: Number of processes converting the coverage data of files to
+          metadata format in parallel.
+    git_revisions_cache_path: Optional path to a file caching the git
+                              revisions of files across runs. Only meaningful
+                              to full-repo coverage.
 
   Returns:
     A tuple (data, summaries) where:
@@ -671,45 +1181,66 @@ def _generate_metadata(src_path,
   """
   logging.info('Generating coverage metadata ...')
   start_time = time.time()
-  raw_data = _get_raw_coverage_data(profdata_path, llvm_cov_path, build_dir,
-                                    binaries, sources, output_dir, exclusions,
-                                    arch)
-  data = _cleanup_coverage_data(src_path, raw_data)
-  _write_coverage_to_disk(output_dir, 'coverage.json', data)
-
-  data_shards = _split_llvm_data_in_shards(data)
-  for i in range(len(data_shards)):
-    file_name = 'coverage%d.json' % i
-    _write_coverage_to_disk(output_dir, file_name, data_shards[i])
+  if stream_llvm_export:
+    coverage_json_file = _run_llvm_cov_export(profdata_path, llvm_cov_path,
+                                              build_dir, binaries, sources,
+                                              output_dir, exclusions, arch)
+    minutes = (time.time() - start_time) / 60
+    logging.info(
+        'Generating coverage metadata with "llvm-cov export" '
+        'took %.0f minutes', minutes)
+
+    logging.info('Processing coverage data ...')
+    start_time = time.time()
+    shard_results = _stream_coverage_data(src_path, output_dir,
+                                          coverage_json_file, diff_mapping,
+                                          third_party_inclusion_subdirs,
+                                          coverage_engine,
+                                          diff_mapping is None, jobs)
+  else:
+    raw_data = _get_raw_coverage_data(profdata_path, llvm_cov_path, build_dir,
+                                      binaries, sources, output_dir, exclusions,
+                                      arch)
+    data = _cleanup_coverage_data(src_path, raw_data)
+    _write_coverage_to_disk(output_dir, 'coverage.json', data)
+
+    data_shards = _split_llvm_data_in_shards(data)
+    for i in range(len(data_shards)):
+      file_name = 'coverage%d.json' % i
+      _write_coverage_to_disk(output_dir, file_name, data_shards[i])
+
+    minutes = (time.time() - start_time) / 60
+    logging.info(
+        'Generating & loading coverage metadata with "llvm-cov export" '
+        'took %.0f minutes', minutes)
 
-  minutes = (time.time() - start_time) / 60
-  logging.info(
-      'Generating & loading coverage metadata with "llvm-cov export" '
-      'took %.0f minutes', minutes)
+    logging.info('Processing coverage data ...')
+    start_time = time.time()
+    shard_results = list(
+        _compress_llvm_data_shards(data_shards, diff_mapping,
+                                   third_party_inclusion_subdirs,
+                                   coverage_engine, diff_mapping is None,
+                                   jobs))
 
-  logging.info('Processing coverage data ...')
-  start_time = time.time()
   files_coverage = []
-  for datum in data['data']:
-    for file_data in datum['files']:
-      record = _to_compressed_file_record(file_data, diff_mapping,
-                                          third_party_inclusion_subdirs)
-      if record:
-        files_coverage.append(record)
+  for shard_files_coverage, _ in shard_results:
+    files_coverage.extend(shard_files_coverage)
 
   per_directory_coverage = {}
   per_component_coverage = {}
   if diff_mapping is None:
     per_directory_coverage, per_component_coverage = (
-        aggregation_util.get_aggregated_coverage_data_from_files(
-            files_coverage, component_mapping))
+        aggregation_util.merge_partial_aggregated_coverage_data(
+            [p for _, p in shard_results if p is not None],
+            component_mapping))
 
   summaries = _get_per_target_coverage_summary(profdata_path, llvm_cov_path,
-                                               build_dir, binaries, arch)
+                                               build_dir, binaries, arch,
+                                               summary_jobs)
 
   if diff_mapping is None:
     repository_util.AddGitRevisionsToCoverageFilesMetadata(
-        files_coverage, src_path, 'DEPS')
+        files_coverage, src_path, 'DEPS', git_revisions_cache_path)
 
   minutes = (time.time() - start_time) / 60
   logging.info('Processing coverage data took %.0f minutes', minutes)
@@ -836,6 +1367,33 @@ def _parse_args(args):
       type=str,
       help='architecture of binaries',
   )
+  parser.add_argument(
+      '--stream-llvm-export',
+      action='store_true',
+      help='process the llvm-cov export one file at a time to bound memory '
+      'usage, instead of loading it as a whole')
+  parser.add_argument(
+      '--summary-jobs',
+      type=int,
+      default=1,
+      help='number of per-target coverage summaries to generate in parallel')
+  parser.add_argument(
+      '--coverage-engine',
+      choices=sorted(_COVERAGE_ENGINES),
+      default='python',
+      help='implementation used to turn llvm segments into line coverage; '
+      '"numpy" requires numpy to be installed')
+  parser.add_argument(
+      '--jobs',
+      type=int,
+      default=1,
+      help='number of processes converting the coverage data of files in '
+      'parallel')
+  parser.add_argument(
+      '--git-revisions-cache',
+      type=str,
+      help='absolute path to a file caching the git revisions of files across '
+      'runs, it is created if missing')
   return parser.parse_args(args=args)
 
 
@@ -858,6 +1416,9 @@ def main():
   if not os.path.isfile(params.profdata_path):
     raise RuntimeError('Input data %s is missing' % params.profdata_path)
 
+  if params.coverage_engine == 'numpy' and numpy is None:
+    raise RuntimeError('numpy is required by --coverage-engine=numpy')
+
   if (params.dir_metadata_path and
       not os.path.isfile(params.dir_metadata_path)):
     raise RuntimeError('Dir metadata %s is missing' % params.dir_metadata_path)
@@ -890,7 +1451,9 @@ def main():
       params.src_path, params.output_dir, params.profdata_path, params.llvm_cov,
       params.build_dir, params.binaries, component_mapping, abs_sources,
       diff_mapping, params.exclusion_pattern,
-      params.third_party_inclusion_subdirs, params.arch)
+      params.third_party_inclusion_subdirs, params.arch,
+      params.stream_llvm_export, params.summary_jobs, params.coverage_engine,
+      params.jobs, params.git_revisions_cache)
 
   with open(os.path.join(params.output_dir, 'all.json.gz'), 'wb') as f:
     f.write(zlib.compress(json.dumps(data).encode()))
@@ -242,7 +242,9 @@ def generate_json_coverage_metadata(src_path,
                                     source_files,
                                     exclusion_pattern=None,
                                     third_party_inclusion_subdirs=None,
-                                    generate_blame_list=False):
+                                    generate_blame_list=False,
+                                    blame_jobs=1,
+                                    blame_cache_dir=None):
   """Generates a JSON representation based on Jacoco XML report.
 
   JSON format conforms to the proto:
@@ -260,6 +262,9 @@ def generate_json_coverage_metadata(src_path,
     exclusion_pattern: A regex string to exclude matches from aggregation.
     third_party_inclusion_subdirs (list): List of third_party subdirs to be
                 included in the aggregation
+    generate_blame_list: Whether to generate blame list data for the files.
+    blame_jobs: Number of files to generate blame list data for concurrently.
+    blame_cache_dir: Optional directory to cache blame list data across runs.
 
   Returns:
     JSON format coverage metadata.
@@ -271,7 +276,10 @@ def generate_json_coverage_metadata(src_path,
   filenames = [x['path'] for x in data['files']]
   blame_list = {}
   if generate_blame_list:
-    blame_list = blame_util.generate_blame_list(src_path, filenames)
+    blame_list = blame_util.generate_blame_list(src_path,
+                                                filenames,
+                                                jobs=blame_jobs,
+                                                cache_dir=blame_cache_dir)
 
   # Add per directory and component coverage data.
   if data['files'] and component_mapping:
@@ -357,6 +365,14 @@ def _parse_args(args):
       '--generate-blame-list',
       action='store_true',
       help='generate blame list data for files whose coverage is known')
+  parser.add_argument('--blame-jobs',
+                      type=int,
+                      default=1,
+                      help='number of files to run git blame on concurrently')
+  parser.add_argument(
+      '--blame-cache-dir',
+      type=str,
+      help='absolute path to a directory caching blame list data across runs')
   params = parser.parse_args(args=args)
 
   if params.dir_metadata_path and not os.path.isfile(params.dir_metadata_path):
@@ -546,7 +562,8 @@ def main():
     data, blame_list = generate_json_coverage_metadata(
         params.src_path, xml_root, component_mapping, diff_mapping,
         params.source_files, params.exclusion_pattern,
-        params.third_party_inclusion_subdirs, params.generate_blame_list)
+        params.third_party_inclusion_subdirs, params.generate_blame_list,
+        params.blame_jobs, params.blame_cache_dir)
     logging.info('Writing fulfilled Java coverage metadata to %s',
                  params.output_dir)
     with open(os.path.join(params.output_dir, 'all.json.gz'), 'wb') as f:
@@ -8,6 +8,9 @@ to get the last changed revision of files.
 """
 
 import collections
+import concurrent.futures
+import contextlib
+import json
 import logging
 import multiprocessing
 import os
@@ -145,6 +148,147 @@ def _RetrieveRevisionFromGit(args):
     return None
 
 
+def _IterGitLogFileChanges(checkout_dir, revision_range=None):
+  """Yields the files changed by each commit in the history of a checkout.
+
+  Commits are walked once, from the newest to the oldest, with a single
+  "git log" process whose output is parsed as it is produced.
+
+  Args:
+    checkout_dir (str): System absolute path to the checkout.
+    revision_range (str): Range of commits to walk, e.g. "old..new". Defaults
+                          to the whole history of HEAD.
+
+  Yields:
+    Tuples <path, git_hash, timestamp> where path is relative to the checkout.
+  """
+  cmd = [
+      GIT, 'log', '-z', '--name-only', '--no-renames',
+      '--format=%x01%H:%ct'
+  ]
+  if revision_range:
+    cmd.append(revision_range)
+  proc = subprocess.Popen(cmd, cwd=checkout_dir, stdout=subprocess.PIPE)
+  try:
+    remainder = b''
+    commit = None
+    is_first_file = False
+    for chunk in iter(lambda: proc.stdout.read(1024 * 1024), b''):
+      tokens = (remainder + chunk).split(b'\0')
+      remainder = tokens.pop()
+      for token in tokens:
+        if token.startswith(b'\x01'):
+          git_hash, timestamp = token[1:].decode().split(':')
+          commit = (git_hash, int(timestamp))
+          is_first_file = True
+          continue
+        # The list of files of a commit starts on a new line.
+        if is_first_file and token.startswith(b'\n'):
+          token = token[1:]
+        is_first_file = False
+        if token and commit:
+          yield token.decode('utf-8', 'replace'), commit[0], commit[1]
+  finally:
+    if proc.poll() is None:
+      proc.kill()
+    elif proc.returncode != 0:
+      logging.warning('"git log" failed in %s with return code %d',
+                      checkout_dir, proc.returncode)
+    proc.stdout.close()
+    proc.wait()
+
+
+def _GetLastChangedRevisionsFromGitLog(checkout_dir, paths):
+  """Returns the last changed revision of the given files in one history walk.
+
+  Args:
+    checkout_dir (str): System absolute path to the checkout.
+    paths (list): Paths relative to the checkout.
+
+  Returns:
+    A dict mapping from paths to tuples <git_hash, timestamp>. Paths that are
+    not changed by any commit shown by "git log", e.g. changed only by merge
+    commits, are not included.
+  """
+  remaining = set(paths)
+  revisions = {}
+  if not remaining:
+    return revisions
+  with contextlib.closing(_IterGitLogFileChanges(checkout_dir)) as changes:
+    for path, git_hash, timestamp in changes:
+      if path in remaining:
+        remaining.remove(path)
+        revisions[path] = (git_hash, timestamp)
+        if not remaining:
+          break
+  return revisions
+
+
+def _GetCheckoutFileRevisions(checkout_dir, paths, cached=None):
+  """Returns the last changed revision of files in a checkout.
+
+  Args:
+    checkout_dir (str): System absolute path to the checkout.
+    paths (list): Paths relative to the checkout.
+    cached (dict): Optional result of a previous call for the same checkout,
+                   which is reused if its head is an ancestor of HEAD.
+
+  Returns:
+    A dict {'head': git_hash, 'revisions': revisions} where revisions maps
+    from paths relative to the checkout to tuples <git_hash, timestamp>. If
+    |cached| is given, head is the current HEAD of the checkout, and revisions
+    also include the files of |cached| so that it can be used as a cache.
+  """
+  head = None
+  revisions = {}
+  if cached is not None:
+    head = subprocess.check_output([GIT, 'rev-parse', 'HEAD'],
+                                   cwd=checkout_dir,
+                                   text=True).strip()
+    if cached.get('head') == head:
+      revisions = dict(cached['revisions'])
+    elif cached.get('head') and subprocess.call(
+        [GIT, 'merge-base', '--is-ancestor', cached['head'], head],
+        cwd=checkout_dir) == 0:
+      revisions = dict(cached['revisions'])
+      updated = set()
+      for path, git_hash, timestamp in _IterGitLogFileChanges(
+          checkout_dir, '%s..%s' % (cached['head'], head)):
+        if path not in updated:
+          updated.add(path)
+          revisions[path] = (git_hash, timestamp)
+
+  missing = [path for path in paths if path not in revisions]
+  revisions.update(_GetLastChangedRevisionsFromGitLog(checkout_dir, missing))
+  return {'head': head, 'revisions': revisions}
+
+
+def _LoadRevisionsCache(cache_path):
+  """Returns the revisions cache at the given path, or an empty one."""
+  if not cache_path or not os.path.isfile(cache_path):
+    return {}
+  try:
+    with open(cache_path) as f:
+      cache = json.load(f)
+  except ValueError:
+    logging.warning('Ignoring corrupted git revisions cache %s', cache_path)
+    return {}
+  for checkout_cache in cache.values():
+    checkout_cache['revisions'] = {
+        path: tuple(revision)
+        for path, revision in checkout_cache['revisions'].items()
+    }
+  return cache
+
+
+def _SaveRevisionsCache(cache_path, cache):
+  """Atomically writes the revisions cache to the given path."""
+  tmp_path = cache_path + '.tmp'
+  with open(tmp_path, 'w') as f:
+    json.dump(cache, f)
+  os.replace(tmp_path, cache_path)
+
+
 def _GetCommitedFilesForEachCheckout(root_dir, checkouts):
   """Returns source absolute paths to all committed files in each checkout.
 
@@ -170,14 +314,21 @@ def _GetCommitedFilesForEachCheckout(root_dir, checkouts):
   return all_files
 
 
-def _GetFileRevisions(root_dir, deps_file_path, file_paths):
+def _GetFileRevisions(root_dir, deps_file_path, file_paths, cache_path=None):
   """Returns a dict mapping from the path to its git revision for given files.
 
+  The history of each checkout is walked once for all its files. Files which
+  can't be resolved this way fall back to one "git log" per file.
+
   Args:
     root_dir (str): System absolute path to the directory of the root checkout.
     deps_file_path (str): Relative path to the DEPS file in the root checkout.
     file_paths (list): The list of source absolute file paths to retrieve git
                        revisions for.
+    cache_path (str): Optional path to a json file caching the revisions of
+                      each checkout, keyed by its HEAD. It is updated in place,
+                      and only the commits made since the cached HEAD are
+                      walked on the next run.
 
   Returns:
     A dict that maps from file source absolute paths to tuples of two elements:
@@ -209,24 +360,58 @@ def _GetFileRevisions(root_dir, deps_file_path, file_paths):
   timer.End('Finding correct checkout')
 
   timer.Start()
+  paths_by_checkout = collections.defaultdict(list)
+  for _, checkout, path in file_data:
+    paths_by_checkout[checkout].append(path[len(checkout):])
+  cache = _LoadRevisionsCache(cache_path) if cache_path else None
   # Leave 5 cpus for other system or infra processes.
-  pool = multiprocessing.Pool(processes=max(5, multiprocessing.cpu_count() - 5))
-  future_results = pool.map(_RetrieveRevisionFromGit, file_data, 100)
-  pool.close()
-  pool.join()
-  timer.End('Multiprocess _RetrieveRevisionFromGit')
-
+  num_workers = max(5, multiprocessing.cpu_count() - 5)
+  with concurrent.futures.ThreadPoolExecutor(num_workers) as executor:
+    futures = {
+        checkout: executor.submit(
+            _GetCheckoutFileRevisions, os.path.join(root_dir, checkout[2:]),
+            paths, None if cache is None else cache.get(checkout, {}))
+        for checkout, paths in paths_by_checkout.items()
+    }
   all_result = {}
-  for result in future_results:
-    if not result:
-      continue
-    path, git_hash, timestamp = result
-    all_result[path] = (git_hash, timestamp)
-  return all_result
+  for checkout, future in futures.items():
+    checkout_revisions = future.result()
+    if cache is not None:
+      cache[checkout] = checkout_revisions
+    for path, revision in checkout_revisions['revisions'].items():
+      all_result[checkout + path] = revision
+  if cache is not None:
+    _SaveRevisionsCache(cache_path, cache)
+  timer.End('Batched _GetCheckoutFileRevisions')
+
+  file_data = [data for data in file_data if data[2] not in all_result]
+  if file_data:
+    timer.Start()
+    pool = multiprocessing.Pool(processes=num_workers)
+    future_results = pool.map(_RetrieveRevisionFromGit, file_data, 100)
+    pool.close()
+    pool.join()
+    timer.End('Multiprocess _RetrieveRevisionFromGit for %d files' %
+              len(file_data))
+
+    for result in future_results:
+      if not result:
+        continue
+      path, git_hash, timestamp = result
+      all_result[path] = (git_hash, timestamp)
+
+  requested_paths = set(file_paths)
+  return {
+      path: revision
+      for path, revision in all_result.items()
+      if path in requested_paths
+  }
 
 
-def AddGitRevisionsToCoverageFilesMetadata(files_coverage_data, src_path,
-                                           deps_file_path):
+def AddGitRevisionsToCoverageFilesMetadata(files_coverage_data,
+                                           src_path,
+                                           deps_file_path,
+                                           cache_path=None):
   """Add git revisions to a list File in coverage metadata format.
 
   Coverage metadata format:
@@ -238,12 +423,15 @@ def AddGitRevisionsToCoverageFilesMetadata(files_coverage_data, src_path,
     src_path (str): Absolute path to the source root.
     deps_file_path (str): Relative path to the DEPS file that manages
                           dependencies.
+    cache_path (str): Optional path to a cache of git revisions, see
+                      `_GetFileRevisions`.
   """
   logging.info('Retrieving file git metadata...')
   start_time = time.time()
 
   all_files = [file_record['path'] for file_record in files_coverage_data]
-  file_git_metadata = _GetFileRevisions(src_path, deps_file_path, all_files)
+  file_git_metadata = _GetFileRevisions(src_path, deps_file_path, all_files,
+                                        cache_path)
   for file_record in files_coverage_data:
     git_metadata = file_git_metadata.get(file_record['path'])
     if not git_metadata:
@@ -3,6 +3,8 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import copy
+import json
 import ntpath
 import os
 import sys
@@ -107,6 +109,49 @@ class AggregationUtilTest(unittest.TestCase):
     self.assertDictEqual(expected_per_directory_data, per_directory_data)
     self.assertDictEqual(expected_per_component_data, per_component_data)
 
+  def test_merge_partial_aggregations(self):
+    files_coverage_data = []
+    for i, path in enumerate([
+        '//a/file1.cc', '//b/c/file2.cc', '//a/d/file3.cc', '//file4.cc',
+        '//b/file5.cc', '//a/file6.cc'
+    ]):
+      files_coverage_data.append({
+          'path': path,
+          'lines': [{
+              'first': 1,
+              'last': 1,
+              'count': 1,
+          }],
+          'summaries': [{
+              'name': 'line',
+              'covered': i,
+              'total': 10,
+          }, {
+              'name': 'function',
+              'covered': 1,
+              'total': i + 1,
+          }],
+      })
+    dir_to_component = {'a': 'Test>A', 'b/c': 'Test>C'}
+
+    expected = aggregation_util.get_aggregated_coverage_data_from_files(
+        copy.deepcopy(files_coverage_data), dir_to_component)
+
+    files_coverage_data = copy.deepcopy(files_coverage_data)
+    partial_aggregations = [
+        aggregation_util.get_partial_aggregated_coverage_data(
+            files_coverage_data[:2]),
+        aggregation_util.get_partial_aggregated_coverage_data(
+            files_coverage_data[2:5]),
+        aggregation_util.get_partial_aggregated_coverage_data(
+            files_coverage_data[5:]),
+    ]
+    actual = aggregation_util.merge_partial_aggregated_coverage_data(
+        partial_aggregations, dir_to_component)
+
+    # Compare the serialized data to also check that the order is preserved.
+    self.assertEqual(json.dumps(expected), json.dumps(actual))
+
   def test_avoid_component_double_counting(self):
     files_coverage_data = [
         {
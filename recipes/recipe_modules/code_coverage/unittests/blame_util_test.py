@@ -4,7 +4,9 @@
 # found in the LICENSE file.
 
 import os
+import shutil
 import sys
+import tempfile
 import unittest
 
 import mock
@@ -40,6 +42,61 @@ class BlameUtilTest(unittest.TestCase):
         'jane@chromium.org': [2, 3]
     }}, response)
 
+  @mock.patch('blame_util.subprocess.check_output', autospec=True)
+  def test_generate_blame_list_concurrently(self, mock_subprocess):
+
+    def mock_subprocess_side_effect(cmd, cwd, text=None):
+      file_name = cmd[-1]
+      if file_name == 'broken.cc':
+        raise blame_util.subprocess.CalledProcessError(1, cmd, 'error')
+      if file_name == 'old.cc':
+        return '^9041ee4b83 (<john@chromium.org> 2022-10-05 15:19:11 +0000 1) x'
+      return ('47faf11ca3d (<%s@chromium.org> 2022-10-05 15:19:11 +0000 7) x' %
+              file_name)
+
+    mock_subprocess.side_effect = mock_subprocess_side_effect
+    files = ['//a.cc', '//broken.cc', '//b.cc', '//old.cc', '//c.cc']
+
+    response = blame_util.generate_blame_list('path/to/src',
+                                              files,
+                                              num_weeks=4,
+                                              jobs=3)
+
+    self.assertListEqual(['//a.cc', '//b.cc', '//c.cc'], list(response))
+    self.assertDictEqual({'a.cc@chromium.org': [7]}, response['//a.cc'])
+
+  @mock.patch('blame_util.subprocess.check_output', autospec=True)
+  def test_generate_blame_list_with_cache(self, mock_subprocess):
+    cache_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, cache_dir)
+    blame_calls = []
+
+    def mock_subprocess_side_effect(cmd, cwd, text=None):
+      if cmd[:2] == ['git', 'rev-parse']:
+        return 'headhash\n'
+      blame_calls.append(cmd[-1])
+      if cmd[-1] == 'broken.cc':
+        raise blame_util.subprocess.CalledProcessError(1, cmd, 'error')
+      return '47faf11ca3d (<jane@chromium.org> 2022-10-05 15:19:11 +0000 2) x'
+
+    mock_subprocess.side_effect = mock_subprocess_side_effect
+    files = ['//README.md', '//broken.cc']
+
+    for _ in range(2):
+      response = blame_util.generate_blame_list('path/to/src',
+                                                files,
+                                                num_weeks=4,
+                                                cache_dir=cache_dir)
+      self.assertDictEqual({'//README.md': {
+          'jane@chromium.org': [2]
+      }}, response)
+
+    # Failures are retried, successful blame lists are read from the cache.
+    self.assertListEqual(['README.md', 'broken.cc', 'broken.cc'], blame_calls)
+    self.assertEqual(1, len(os.listdir(cache_dir)))
+    self.assertTrue(
+        os.listdir(cache_dir)[0].startswith('blame_headhash_4weeks'))
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -3,9 +3,13 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import io
 import json
 import os
+import random
+import shutil
 import sys
+import tempfile
 import unittest
 
 import mock
@@ -14,6 +18,7 @@ THIS_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0,
                 os.path.abspath(os.path.join(THIS_DIR, os.pardir, 'resources')))
 
+import aggregation_util
 import generate_coverage_metadata as generator
 
 
@@ -735,6 +740,184 @@ class GenerateCoverageMetadataTest(unittest.TestCase):
 
     self.assertListEqual(expected_compressed_files, compressed_data['files'])
 
+  def _get_multi_file_raw_data(self):
+    return {
+        'data': [{
+            'files': [{
+                'branches': [],
+                'expansions': [],
+                'filename': '/path/to/src/dir1/file1.cc',
+                'segments': [
+                    [1, 12, 1, True, True],
+                    [2, 7, 1, True, True],
+                    [2, 14, 1, True, False],
+                    [2, 18, 0, True, True],
+                    [2, 25, 1, True, False],
+                    [2, 27, 1, True, True],
+                    [4, 4, 0, True, False],
+                    [6, 3, 0, True, True],
+                    [7, 2, 0, False, False],
+                ],
+                'summary': {
+                    'lines': {
+                        'count': 7,
+                        'covered': 4,
+                        'percent': 57
+                    },
+                },
+            }, {
+                'filename': '/path/to/src/out/gen/file.cc',
+                'segments': [[1, 12, 1, True, True]],
+                'summary': {
+                    'lines': {
+                        'count': 1,
+                        'covered': 1,
+                        'percent': 100
+                    },
+                },
+            }, {
+                'filename': '/path/to/src/dir2/file2.cc',
+                'segments': [[1, 12, 12345678901, True, True],
+                             [1, 25, 0, False, False]],
+                'summary': {
+                    'lines': {
+                        'count': 1,
+                        'covered': 1,
+                        'percent': 100
+                    },
+                },
+            }],
+            'totals': {
+                'lines': {
+                    'count': 9,
+                    'covered': 6,
+                    'percent': 66.67
+                },
+            },
+        }],
+        'type': 'llvm.coverage.json.export',
+        'version': '2.0.1'
+    }
+
+  def test_llvm_export_stream(self):
+    raw_data = self._get_multi_file_raw_data()
+    for raw_json in (json.dumps(raw_data), json.dumps(raw_data, indent=2),
+                     json.dumps(raw_data, separators=(',', ':'))):
+      # Use a tiny chunk size to exercise refilling the buffer in the middle of
+      # strings, numbers and separators.
+      for chunk_size in (1, 7, 1024):
+        f = io.StringIO(raw_json)
+        stream = generator._LlvmExportStream(f, chunk_size=chunk_size)
+        self.assertListEqual(raw_data['data'][0]['files'],
+                             list(stream.iter_files()))
+        self.assertDictEqual(
+            {
+                'type': 'llvm.coverage.json.export',
+                'version': '2.0.1'
+            }, stream.metadata)
+
+  def test_llvm_export_stream_truncated(self):
+    raw_json = json.dumps(self._get_multi_file_raw_data())
+    stream = generator._LlvmExportStream(
+        io.StringIO(raw_json[:len(raw_json) // 2]), chunk_size=16)
+    with self.assertRaises(ValueError):
+      list(stream.iter_files())
+
+  def test_streaming_coverage_writer(self):
+    data = generator._cleanup_coverage_data(
+        '/path/to/src', self._get_multi_file_raw_data())
+    expected_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, expected_dir)
+    generator._write_coverage_to_disk(expected_dir, 'coverage.json', data)
+    for i, shard in enumerate(
+        generator._split_llvm_data_in_shards(data, shard_size=1)):
+      generator._write_coverage_to_disk(expected_dir, 'coverage%d.json' % i,
+                                        shard)
+
+    actual_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, actual_dir)
+    writer = generator._StreamingCoverageWriter(actual_dir, shard_size=1)
+    for file_data in data['data'][0]['files']:
+      writer.add(file_data)
+    writer.close({'type': data['type'], 'version': data['version']})
+
+    self.assertListEqual(
+        sorted(os.listdir(expected_dir)), sorted(os.listdir(actual_dir)))
+    for file_name in os.listdir(expected_dir):
+      with open(os.path.join(expected_dir, file_name)) as expected, open(
+          os.path.join(actual_dir, file_name)) as actual:
+        self.assertEqual(expected.read(), actual.read())
+
+  @mock.patch.object(generator, '_get_per_target_coverage_summary')
+  @mock.patch.object(generator.repository_util, '_GetFileRevisions')
+  @mock.patch.object(generator, '_run_llvm_cov_export')
+  @mock.patch.object(generator, '_get_raw_coverage_data')
+  def test_generate_metadata_with_stream_llvm_export(
+      self, mock_get_coverage_data, mock_run_llvm_cov_export,
+      mock__GetFileRevisions, mock_get_per_target_coverage_summary):
+    raw_data = self._get_multi_file_raw_data()
+    output_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, output_dir)
+    raw_json_file = os.path.join(output_dir, 'coverage_raw.json')
+    with open(raw_json_file, 'w') as f:
+      json.dump(raw_data, f)
+
+    mock_get_coverage_data.return_value = raw_data
+    mock_run_llvm_cov_export.return_value = raw_json_file
+    mock__GetFileRevisions.return_value = {
+        '//dir1/file1.cc': ('hash1', 1234),
+        '//dir2/file2.cc': ('hash2', 5678),
+    }
+    mock_get_per_target_coverage_summary.return_value = {}
+
+    results = []
+    for stream_llvm_export, jobs in ((False, 1), (True, 1), (True, 2)):
+      results.append(
+          generator._generate_metadata(
+              src_path='/path/to/src',
+              output_dir=output_dir,
+              profdata_path='/path/to/coverage.profdata',
+              llvm_cov_path='/path/to/llvm-cov',
+              build_dir='/path/to/build_dir',
+              binaries=['/path/to/binary1'],
+              component_mapping={'dir1': 'Test>Component'},
+              sources=[],
+              stream_llvm_export=stream_llvm_export,
+              jobs=jobs))
+
+    self.maxDiff = None
+    self.assertEqual(results[0], results[1])
+    self.assertEqual(results[0], results[2])
+    self.assertEqual(['//dir1/file1.cc', '//dir2/file2.cc'],
+                     [f['path'] for f in results[1][0]['files']])
+
+  def test_compress_llvm_data_shards_in_parallel(self):
+    data = generator._cleanup_coverage_data('/path/to/src',
+                                            self._get_multi_file_raw_data())
+    shards = generator._split_llvm_data_in_shards(data, shard_size=1)
+
+    results = []
+    for jobs in (1, 2):
+      results.append(
+          list(
+              generator._compress_llvm_data_shards(
+                  shards,
+                  diff_mapping=None,
+                  third_party_inclusion_subdirs=None,
+                  coverage_engine='python',
+                  aggregate=True,
+                  jobs=jobs)))
+
+    self.maxDiff = None
+    self.assertEqual(results[0], results[1])
+    self.assertEqual(['//dir1/file1.cc', '//dir2/file2.cc'],
+                     [r['path'] for files, _ in results[1] for r in files])
+    self.assertEqual(
+        aggregation_util.get_aggregated_coverage_data_from_files(
+            [r for files, _ in results[0] for r in files]),
+        aggregation_util.merge_partial_aggregated_coverage_data(
+            [p for _, p in results[1]]))
+
   @mock.patch('psutil.cpu_count')
   @mock.patch('subprocess.check_output')
   def test_per_target_summaries(self, call, cpu_count):
@@ -784,6 +967,59 @@ class GenerateCoverageMetadataTest(unittest.TestCase):
     self.assertIn('binary1', summaries)
     self.assertEqual(summaries['binary1'], summary_data['data'][0]['totals'])
 
+  @mock.patch('psutil.virtual_memory')
+  @mock.patch('psutil.cpu_count')
+  @mock.patch('subprocess.check_output')
+  def test_per_target_summaries_in_parallel(self, call, cpu_count,
+                                            virtual_memory):
+    cpu_count.return_value = 100
+    virtual_memory.return_value.available = 64 * 1024 * 1024 * 1024
+
+    def check_output(args, **_):
+      binary = args[-1]
+      if binary == 'binary2':
+        raise generator.subprocess.CalledProcessError(1, args, 'error')
+      return json.dumps({'data': [{'totals': {'lines': {'count': binary}}}]})
+
+    call.side_effect = check_output
+    binaries = ['binary%d' % i for i in range(10)]
+
+    summaries = generator._get_per_target_coverage_summary(
+        '/foo/bar/baz.profdata',
+        '/path/to/llvm-cov',
+        '/path/to/build_dir',
+        binaries,
+        arch=None,
+        jobs=4)
+
+    # The cpu cores are split between the concurrent llvm-cov processes.
+    for args in call.call_args_list:
+      self.assertEqual('25', args[0][0][args[0][0].index('-num-threads') + 1])
+    expected_binaries = [b for b in binaries if b != 'binary2']
+    self.assertListEqual(expected_binaries, list(summaries.keys()))
+    for binary in expected_binaries:
+      self.assertEqual({'lines': {'count': binary}}, summaries[binary])
+
+  @mock.patch('psutil.virtual_memory')
+  def test_memory_aware_throttle(self, virtual_memory):
+    virtual_memory.return_value.available = 0
+    throttle = generator._MemoryAwareThrottle(1, poll_interval_seconds=0.01)
+
+    # A process is always allowed to start if no other one is running.
+    with throttle.acquire():
+      started = generator.threading.Event()
+
+      def _start_second():
+        with throttle.acquire():
+          started.set()
+
+      thread = generator.threading.Thread(target=_start_second)
+      thread.start()
+      self.assertFalse(started.wait(0.1))
+      virtual_memory.return_value.available = 2
+      self.assertTrue(started.wait(5))
+      thread.join()
+
   @mock.patch('psutil.Process')
   def test_exception_in_show_system_resource_usage(self, mock_process):
     psutil_process = mock_process.return_value
@@ -797,5 +1033,102 @@ class GenerateCoverageMetadataTest(unittest.TestCase):
     generator._show_system_resource_usage(psutil_process)
 
 
+# Segments used by the tests above, plus made-up ones for corner cases such as
+# a wrap segment spanning empty lines, uncovered blocks closed by the first
+# segment of a line and counts that don't fit in 32 bits.
+_SEGMENTS_FIXTURES = [
+    [
+        [1, 12, 1, True, True],
+        [2, 7, 1, True, True],
+        [2, 14, 1, True, False],
+        [2, 18, 0, True, True],
+        [2, 25, 1, True, False],
+        [2, 27, 1, True, True],
+        [4, 4, 0, True, False],
+        [6, 3, 0, True, True],
+        [7, 2, 0, False, False],
+    ],
+    [[1, 12, 1, True, True], [1, 25, 0, False, False]],
+    [[3, 49, 0, True, True], [5, 3, 0, False, True], [8, 1, 0, True, False],
+     [8, 5, 0, True, True], [8, 14, 0, True, False], [10, 2, 0, False, False]],
+    [
+        [102, 35, 4, True, True],
+        [104, 4, 0, False, False],
+        [107, 35, 4, True, True],
+        [109, 4, 0, False, False],
+    ],
+    [[1, 12, 1, True, True]],
+    [[1, 1, 0, True, True], [3, 5, 7, True, True], [3, 9, 0, True, False],
+     [6, 2, 3, True, False]],
+    [[2, 1, 12345678901, True, True], [2, 10, 0, True, True],
+     [5, 1, 0, False, True], [5, 8, 1, True, True], [9, 1, 0, False, False]],
+]
+
+
+@unittest.skipIf(generator.numpy is None, 'numpy is not installed')
+class CoverageEngineDifferentialTest(unittest.TestCase):
+  """Checks that all coverage engines produce exactly the same output."""
+
+  def _random_segments(self, rand):
+    segments = []
+    line = 1
+    for _ in range(rand.randint(1, 40)):
+      line += rand.choice([0, 0, 1, 1, 2, 5])
+      col = segments[-1][1] + rand.randint(1, 10) if (
+          segments and segments[-1][0] == line) else rand.randint(1, 10)
+      segments.append([
+          line, col,
+          rand.choice([0, 0, 1, 3, 2**40]),
+          rand.random() < 0.8,
+          rand.random() < 0.6
+      ])
+    return segments
+
+  def _assert_same_output(self, segments):
+    expected = generator._extract_coverage_info(segments)
+    actual = generator._extract_coverage_info_numpy(segments)
+    self.assertEqual(expected, actual, segments)
+    self.assertEqual(
+        json.dumps(sorted(expected[1].items())),
+        json.dumps(sorted(actual[1].items())), segments)
+
+    file_coverage_data = {
+        'segments': segments,
+        'summary': {
+            'lines': {
+                'covered': 1,
+                'count': 1,
+            }
+        },
+        'filename': 'base/base.cc',
+    }
+    self.assertEqual(
+        json.dumps(generator._to_compressed_file_record(file_coverage_data)),
+        json.dumps(
+            generator._to_compressed_file_record(
+                file_coverage_data, coverage_engine='numpy')), segments)
+
+  def test_fixtures(self):
+    for segments in _SEGMENTS_FIXTURES:
+      self._assert_same_output(segments)
+
+  def test_random_segments(self):
+    rand = random.Random(1234)
+    for _ in range(2000):
+      self._assert_same_output(self._random_segments(rand))
+
+  def test_unsorted_segments_fall_back(self):
+    segments = [[3, 1, 1, True, True], [1, 1, 1, True, True]]
+    with mock.patch.object(
+        generator, '_extract_coverage_info',
+        wraps=generator._extract_coverage_info) as python_engine:
+      generator._extract_coverage_info_numpy(segments)
+      python_engine.assert_called_once_with(segments)
+
+  def test_counts_overflowing_int64_fall_back(self):
+    self._assert_same_output([[1, 1, 2**64 - 1, True, True],
+                              [2, 1, 0, False, False]])
+
+
 if __name__ == '__main__':
   unittest.main()
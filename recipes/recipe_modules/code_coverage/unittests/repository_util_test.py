@@ -3,9 +3,12 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import io
 import os
+import shutil
 import subprocess
 import sys
+import tempfile
 import textwrap
 import unittest
 
@@ -20,9 +23,16 @@ import repository_util
 
 class RepositoryUtilTest(unittest.TestCase):
 
+  # Files that are not found by walking the history of their checkout fall
+  # back to one "git log" per file.
+  @mock.patch.object(
+      repository_util,
+      '_GetLastChangedRevisionsFromGitLog',
+      autospec=True,
+      return_value={})
   @mock.patch('repository_util.os.path.isdir', autospec=True)
   @mock.patch('repository_util.subprocess.check_output', autospec=True)
-  def test_get_file_revisions(self, mock_subprocess, mock_is_dir):
+  def test_get_file_revisions(self, mock_subprocess, mock_is_dir, _):
     deps_file_content = textwrap.dedent('''
       vars = {
         'chromium_git': 'https://chromium.googlesource.com',
@@ -70,6 +80,122 @@ class RepositoryUtilTest(unittest.TestCase):
       self.assertDictEqual(expected_file_revisions, file_revisions)
       m.assert_called_once_with('/src/DEPS', 'r')
 
+  @mock.patch('repository_util.subprocess.Popen', autospec=True)
+  def test_iter_git_log_file_changes(self, mock_popen):
+    mock_popen.return_value.stdout = io.BytesIO(
+        b'\x01hash3:300\0\x01hash2:200\0\nfile1.cc\0dir/file 2.cc\0'
+        b'\x01hash1:100\0\nfile1.cc\0')
+    mock_popen.return_value.poll.return_value = 0
+    mock_popen.return_value.returncode = 0
+
+    changes = list(repository_util._IterGitLogFileChanges('/src', 'a..b'))
+
+    self.assertListEqual([
+        ('file1.cc', 'hash2', 200),
+        ('dir/file 2.cc', 'hash2', 200),
+        ('file1.cc', 'hash1', 100),
+    ], changes)
+    mock_popen.assert_called_once_with([
+        'git', 'log', '-z', '--name-only', '--no-renames',
+        '--format=%x01%H:%ct', 'a..b'
+    ],
+                                       cwd='/src',
+                                       stdout=subprocess.PIPE)
+
+  @mock.patch.object(repository_util, '_IterGitLogFileChanges', autospec=True)
+  @mock.patch('repository_util.os.path.isdir', autospec=True)
+  @mock.patch('repository_util.subprocess.check_output', autospec=True)
+  def test_get_file_revisions_batched(self, mock_subprocess, mock_is_dir,
+                                      mock_iter_git_log_file_changes):
+    deps_file_content = textwrap.dedent('''
+      deps = {
+        'src/third_party/repo': 'https://chromium.googlesource.com/repo.git',
+      }''')
+    mock_is_dir.return_value = True
+
+    def mock_subprocess_side_effect(commands, cwd, text=None):
+      assert commands == ['git', 'ls-files'], 'Unexpected subprocess call'
+      if os.path.normpath(cwd) == '/src':
+        return 'file1.cc\nfile3.cc'
+      return 'file2.cc'
+
+    mock_subprocess.side_effect = mock_subprocess_side_effect
+
+    def mock_iter_side_effect(checkout_dir, revision_range=None):
+      self.assertIsNone(revision_range)
+      if os.path.normpath(checkout_dir) == '/src':
+        changes = [('file1.cc', 'hash3', 3), ('file3.cc', 'hash3', 3),
+                   ('file1.cc', 'hash1', 1)]
+      else:
+        changes = [('file2.cc', 'hash2', 2)]
+      return (change for change in changes)
+
+    mock_iter_git_log_file_changes.side_effect = mock_iter_side_effect
+
+    with mock.patch('repository_util.open',
+                    mock.mock_open(read_data=deps_file_content)):
+      file_revisions = repository_util._GetFileRevisions(
+          '/src', 'DEPS', ['//file1.cc', '//third_party/repo/file2.cc'])
+
+    self.assertDictEqual(
+        {
+            '//file1.cc': ('hash3', 3),
+            '//third_party/repo/file2.cc': ('hash2', 2)
+        }, file_revisions)
+
+  @mock.patch.object(repository_util, '_IterGitLogFileChanges', autospec=True)
+  @mock.patch('repository_util.subprocess.call', autospec=True)
+  @mock.patch('repository_util.subprocess.check_output', autospec=True)
+  def test_get_checkout_file_revisions_with_cache(
+      self, mock_check_output, mock_call, mock_iter_git_log_file_changes):
+    mock_check_output.return_value = 'newhead\n'
+    mock_call.return_value = 0  # The cached head is an ancestor of HEAD.
+
+    def mock_iter_side_effect(checkout_dir, revision_range=None):
+      if revision_range == 'oldhead..newhead':
+        changes = [('a.cc', 'hash5', 5), ('c.cc', 'hash4', 4),
+                   ('a.cc', 'hash4', 4)]
+      else:
+        self.assertIsNone(revision_range)
+        changes = [('c.cc', 'hash4', 4), ('d.cc', 'hash0', 0)]
+      return (change for change in changes)
+
+    mock_iter_git_log_file_changes.side_effect = mock_iter_side_effect
+    cached = {
+        'head': 'oldhead',
+        'revisions': {
+            'a.cc': ('hash1', 1),
+            'b.cc': ('hash2', 2),
+        }
+    }
+
+    result = repository_util._GetCheckoutFileRevisions(
+        '/src', ['a.cc', 'b.cc', 'd.cc'], cached)
+
+    self.assertDictEqual(
+        {
+            'head': 'newhead',
+            'revisions': {
+                'a.cc': ('hash5', 5),
+                'b.cc': ('hash2', 2),
+                'c.cc': ('hash4', 4),
+                'd.cc': ('hash0', 0),
+            }
+        }, result)
+    mock_call.assert_called_once_with(
+        ['git', 'merge-base', '--is-ancestor', 'oldhead', 'newhead'],
+        cwd='/src')
+
+  def test_revisions_cache_round_trip(self):
+    cache_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, cache_dir)
+    cache_path = os.path.join(cache_dir, 'cache.json')
+    self.assertDictEqual({}, repository_util._LoadRevisionsCache(cache_path))
+
+    cache = {'//': {'head': 'head', 'revisions': {'a.cc': ('hash1', 1)}}}
+    repository_util._SaveRevisionsCache(cache_path, cache)
+    self.assertDictEqual(cache, repository_util._LoadRevisionsCache(cache_path))
+
   @mock.patch.object(repository_util, '_GetFileRevisions', autospec=True)
   def test_add_git_revisions_to_coverage_files_metadata(
       self, mock_get_file_revisions):
@@ -2,6 +2,9 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import bisect
+import collections
+import math
 import re
 from enum import Enum
 
@@ -167,6 +170,50 @@ class UnexpectedTestResult(TestResult):
     return not other.expected
 
 
+class _IntervalIndex:
+  """Index of the time intervals of TestResults for overlap queries.
+
+  Results with timing info are sorted by start time, and a segment tree over
+  that order holds the latest end time of each range, so that ranges ending
+  before a query are skipped. A query returning k results costs
+  O(log n + k log n).
+  """
+
+  def __init__(self, results):
+    self._results = sorted(
+        (r for r in results
+         if r.start_time is not None and r.duration is not None),
+        key=lambda r: r.start_time)
+    self._start_times = [r.start_time for r in self._results]
+    self._size = 1
+    while self._size < len(self._results):
+      self._size *= 2
+    self._max_end_times = [-math.inf] * (2 * self._size)
+    for i, r in enumerate(self._results):
+      self._max_end_times[self._size + i] = r.start_time + r.duration / 1000
+    for i in range(self._size - 1, 0, -1):
+      self._max_end_times[i] = max(self._max_end_times[2 * i],
+                                   self._max_end_times[2 * i + 1])
+
+  def get_overlapping(self, start_time, end_time):
+    # Only results starting before |end_time| could overlap.
+    count = bisect.bisect_right(self._start_times, end_time)
+    overlapping = []
+    stack = [(1, 0, self._size)]  # (node, first result, last result + 1)
+    while stack:
+      node, lo, hi = stack.pop()
+      if lo >= count or self._max_end_times[node] < start_time:
+        continue
+      if node >= self._size:
+        overlapping.append(self._results[lo])
+        continue
+      mid = (lo + hi) // 2
+      # Visit the left child first to return results in start_time order.
+      stack.append((2 * node + 1, mid, hi))
+      stack.append((2 * node, lo, mid))
+    return overlapping
+
+
 class BaseResultSummary:
   """
   Collection of all test results within a run.
@@ -174,12 +221,18 @@ class BaseResultSummary:
 
   def __init__(self):
     self._results = []
+    # {test_name: [TestResult]}, sorted by start_time unless the test_name is
+    # in _unsorted_test_names.
+    self._results_by_test_name = collections.defaultdict(list)
+    self._unsorted_test_names = set()
+    # Built on first use, and reset by add().
+    self._interval_index = None
 
   def __iter__(self):
     return iter(self._results)
 
   def __contains__(self, test_name):
-    return any(r.test_name == test_name for r in self)
+    return test_name in self._results_by_test_name
 
   def __len__(self):
     return len(self._results)
@@ -187,6 +240,9 @@ class BaseResultSummary:
   def add(self, test_result):
     assert isinstance(test_result, TestResult)
     self._results.append(test_result)
+    self._results_by_test_name[test_result.test_name].append(test_result)
+    self._unsorted_test_names.add(test_result.test_name)
+    self._interval_index = None
 
   def get_all(self, test_name):
     """Get all TestResult that matches the given test_name in start_time order.
@@ -197,10 +253,31 @@ class BaseResultSummary:
     Returns:
       A list of TestResult of all tests matching the given test_name.
     """
-    # Python sort is stable, if result doesn't have start_time, the sorted
-    # result should keep the same.
-    return sorted([r for r in self if r.test_name == test_name],
-                  key=lambda r: r.start_time or 0)
+    if test_name not in self._results_by_test_name:
+      return []
+    results = self._results_by_test_name[test_name]
+    if test_name in self._unsorted_test_names:
+      # Python sort is stable, if result doesn't have start_time, the sorted
+      # result should keep the same.
+      results.sort(key=lambda r: r.start_time or 0)
+      self._unsorted_test_names.discard(test_name)
+    return list(results)
+
+  def get_overlapping(self, start_time, end_time):
+    """Get all TestResult running at some point between start_time and end_time.
+
+    Results without start_time or duration are ignored.
+
+    Args:
+      start_time (float): The start of the time range, in seconds.
+      end_time (float): The end of the time range, in seconds.
+
+    Returns:
+      A list of TestResult in start_time order.
+    """
+    if self._interval_index is None:
+      self._interval_index = _IntervalIndex(self._results)
+    return self._interval_index.get_overlapping(start_time, end_time)
 
   def get_failing_sample(self, test_name, default=UnexpectedTestResult):
     """Get an unexpected sample for |test_name|, or |default| if not found."""
@@ -3,9 +3,11 @@
 # found in the LICENSE file.
 
 import collections
+import concurrent.futures
 import math
 import logging
 import os
+import threading
 import time
 
 from . import utils
@@ -41,6 +43,9 @@ class ParallelStrategy(BaseStrategy):
   SINGLE_ITERATION_TIME_LIMIT = 5 * 60
   GROUP_VERIFY_TIME_LIMIT = 20 * 60
   SINGLE_TEST_VERIFY_TIME_LIMIT = 10 * 60
+  # Max groups verified concurrently. Each verification runs |parallel_jobs|
+  # tests in parallel, so fewer are run if the bot lacks free cores.
+  MAX_CONCURRENT_VERIFICATIONS = 4
 
   def __init__(self, *args, **kwargs):
     super().__init__(*args, **kwargs)
@@ -48,6 +53,7 @@ class ParallelStrategy(BaseStrategy):
     self.deadline = None
     self.parallel_jobs = None
     self.running_time = {}  # test_name: [total_duration, run_cnt]
+    self._running_time_lock = threading.Lock()
 
   def valid_for_test(self):
     if not isinstance(self.test_binary, TestBinaryWithParallelMixin):
@@ -136,37 +142,105 @@ class ParallelStrategy(BaseStrategy):
     iteration = 0
     max_reproduced_cnt = 0
     group_test_results = {}  # {group_index: ReproduceTestResult}
-    # Retry until reproduced REPRODUCE_CNT times or GROUP_VERIFY_TIME_LIMIT.
-    while (iteration < self.MAX_ITERATIONS and
-           max_reproduced_cnt < self.REPRODUCE_CNT and time.time() < deadline):
-      for i, group in enumerate(groups):
+    concurrency = self._calc_concurrent_verifications(len(groups))
+    executor = None
+    if concurrency > 1:
+      executor = concurrent.futures.ThreadPoolExecutor(concurrency)
+    try:
+      # Retry until reproduced REPRODUCE_CNT times or GROUP_VERIFY_TIME_LIMIT.
+      while (iteration < self.MAX_ITERATIONS and
+             max_reproduced_cnt < self.REPRODUCE_CNT and
+             time.time() < deadline):
         # Ignore the groups that not reproducible after 2 retries (if we have
         # reproducible group).
-        if (max_reproduced_cnt and iteration >= self.NOT_REPRODUCE_RETRY and
-            (i not in group_test_results or
-             group_test_results[i].reproduced == 0)):
-          continue
-        ret = self._verify_parallel_tests(group)
-        logging.info('verify group %d/%d: iter=%d, reproduced=%d/%d', i + 1,
-                     len(groups), iteration, ret.reproduced,
-                     len(ret.test_history))
-        if i not in group_test_results:
-          group_test_results[i] = ret
+        indexes = [
+            i for i in range(len(groups)) if not (
+                max_reproduced_cnt and iteration >= self.NOT_REPRODUCE_RETRY and
+                (i not in group_test_results or
+                 group_test_results[i].reproduced == 0))
+        ]
+        if executor:
+          self._verify_groups_concurrently(executor, groups, indexes, iteration,
+                                           deadline, group_test_results)
         else:
-          group_test_results[i].reproduced += ret.reproduced
-          group_test_results[i].test_history += ret.test_history
-      iteration += 1
-      max_reproduced_cnt = max(
-          v.reproduced for v in group_test_results.values())
+          for i in indexes:
+            self._add_group_test_result(groups, i, iteration,
+                                        self._verify_parallel_tests(groups[i]),
+                                        group_test_results)
+        iteration += 1
+        max_reproduced_cnt = max(
+            v.reproduced for v in group_test_results.values())
+    finally:
+      if executor:
+        # The verifications that haven't started are already cancelled by
+        # _verify_groups_concurrently, even if it raised.
+        executor.shutdown()
     if not group_test_results:
       return None
-    best_group_result = max(
-        group_test_results.values(),
-        key=lambda g: (g.reproduced, -len(g.test_history)))
+    # Prefer the first group on ties, regardless of the verification order.
+    best_index = max(
+        group_test_results,
+        key=lambda i: (group_test_results[i].reproduced,
+                       -len(group_test_results[i].test_history), -i))
+    best_group_result = group_test_results[best_index]
     if not best_group_result.reproduced:
       return None
     return best_group_result
 
+  def _calc_concurrent_verifications(self, groups_cnt):
+    """Returns the number of groups to verify concurrently."""
+    free_cores = os.cpu_count() or 1
+    if hasattr(os, 'getloadavg'):
+      free_cores -= math.ceil(os.getloadavg()[0])
+    return max(
+        1,
+        min(self.MAX_CONCURRENT_VERIFICATIONS, groups_cnt,
+            free_cores // self.parallel_jobs))
+
+  def _verify_groups_concurrently(self, executor, groups, indexes, iteration,
+                                  deadline, group_test_results):
+    """Verify groups[i] for i in indexes concurrently.
+
+    Verifications that haven't started are cancelled once a group reproduced
+    REPRODUCE_CNT times or after the deadline, while the running ones are
+    still waited for and recorded.
+    """
+    futures = {
+        executor.submit(self._verify_parallel_tests, groups[i]): i
+        for i in indexes
+    }
+    pending = set(futures)
+    stopping = False
+    try:
+      while pending:
+        timeout = None if stopping else max(0, deadline - time.time())
+        done, pending = concurrent.futures.wait(
+            pending,
+            timeout=timeout,
+            return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in sorted(done, key=futures.get):
+          if not future.cancelled():
+            self._add_group_test_result(groups, futures[future], iteration,
+                                        future.result(), group_test_results)
+        if not stopping and (time.time() >= deadline or
+                             any(v.reproduced >= self.REPRODUCE_CNT
+                                 for v in group_test_results.values())):
+          stopping = True
+          pending = {f for f in pending if not f.cancel()}
+    finally:
+      for future in pending:
+        future.cancel()
+
+  def _add_group_test_result(self, groups, i, iteration, ret,
+                             group_test_results):
+    logging.info('verify group %d/%d: iter=%d, reproduced=%d/%d', i + 1,
+                 len(groups), iteration, ret.reproduced, len(ret.test_history))
+    if i not in group_test_results:
+      group_test_results[i] = ret
+    else:
+      group_test_results[i].reproduced += ret.reproduced
+      group_test_results[i].test_history += ret.test_history
+
   def _generate_reproduce_step(self, group_result):
     single_round_runtime = self._calc_single_round_runtime(
         group_result.tests + [self.failing_sample])
@@ -201,11 +275,12 @@ class ParallelStrategy(BaseStrategy):
         .with_repeat(repeat)  #
     )
     result = test_binary.run()
-    for test in result:
-      if test.duration is None:
-        continue
-      self.running_time[test.test_name][0] += test.duration
-      self.running_time[test.test_name][1] += 1
+    with self._running_time_lock:
+      for test in result:
+        if test.duration is None:
+          continue
+        self.running_time[test.test_name][0] += test.duration
+        self.running_time[test.test_name][1] += 1
     test_history = result.get_all(self.test_name)
     if not test_history:
       raise KeyError(
@@ -249,15 +324,11 @@ class ParallelStrategy(BaseStrategy):
     parallel_tests = []
     start_time = self.failing_sample.start_time
     end_time = start_time + self.failing_sample.duration / 1000
-    for test in self.result_summary:
+    for test in self.result_summary.get_overlapping(start_time, end_time):
       if test is self.failing_sample:
         continue
       if (self.failing_sample.thread_id is not None and
           self.failing_sample.thread_id == test.thread_id):
         continue
-      if test.start_time is None or test.duration is None:
-        continue
-      if (test.start_time <= end_time and
-          test.start_time + test.duration / 1000 >= start_time):
-        parallel_tests.append(test)
-    return sorted(parallel_tests, key=lambda x: x.start_time or 0)
+      parallel_tests.append(test)
+    return parallel_tests
@@ -5,6 +5,11 @@
 import logging
 import subprocess
 import os
+import threading
+
+# Serializes the chdir around Popen in run_cmd, as the working directory is
+# shared by all the threads of the process.
+_CHDIR_LOCK = threading.Lock()
 
 
 def strip_command_wrappers(command, strip_wrappers):
@@ -103,10 +108,11 @@ def run_cmd(argv, cwd=None, env=None):
   logging.info('Running %r in %r with %r', argv, cwd, env)
   # NOTE: Windows wouldn't search for the executable in cwd set via Popen.
   # Using `chdir` before Popen to workaround this issue.
-  old_cwd = os.getcwd()
-  os.chdir(cwd)
-  try:
-    process = subprocess.Popen(argv, env=env)
-    return process.wait()
-  finally:
-    os.chdir(old_cwd)
+  with _CHDIR_LOCK:
+    old_cwd = os.getcwd()
+    os.chdir(cwd)
+    try:
+      process = subprocess.Popen(argv, env=env)
+    finally:
+      os.chdir(old_cwd)
+  return process.wait()
@@ -3,6 +3,8 @@
 # found in the LICENSE file.
 
 import json
+import threading
+import time
 import unittest
 from unittest.mock import patch
 
@@ -26,12 +28,25 @@ class ParallelStrategyTest(unittest.TestCase, GenerateResultSummaryMixin):
       if test.thread_id is not None:
         test.thread_id += i
         test.duration = 10
+    # Verify groups one after another unless a test enables concurrent
+    # verifications, so that the number of runs doesn't depend on the bot.
+    patcher = patch.object(ParallelStrategy, 'MAX_CONCURRENT_VERIFICATIONS', 1)
+    patcher.start()
+    self.addCleanup(patcher.stop)
 
   def get_strategy(self, test_name, test_binary=None, result_summary=None):
     test_binary = test_binary or self.test_binary
     result_summary = result_summary or self.result_summary
     return ParallelStrategy(test_binary, result_summary, test_name)
 
+  def get_strategy_for_group_verification(self):
+    strategy = self.get_strategy('MockUnitTests.CrashTest')
+    strategy.valid_for_test()
+    strategy.deadline = float('inf')
+    for test in strategy._get_parallel_tests() + [strategy.failing_sample]:
+      strategy.running_time[test.test_name] = [test.duration, 1]
+    return strategy
+
   def test_valid_for_test(self):
     self.assertFalse(
         self.get_strategy('MockUnitTests.AnyTest').valid_for_test())
@@ -244,6 +259,90 @@ class ParallelStrategyTest(unittest.TestCase, GenerateResultSummaryMixin):
     # MAX_ITERATIONS
     self.assertEqual(mock_test_binary_run.call_count, 10)
 
+  @patch.object(GTestTestBinary, 'run', autospec=True)
+  def test_verify_groups_concurrently(self, mock_test_binary_run):
+    test_self = self
+    lock = threading.Lock()
+    running = [0, 0]  # [running, max running]
+
+    def mock_test_binary_run_side_effect(self, *args, **kwargs):
+      with lock:
+        running[0] += 1
+        running[1] = max(running)
+      if mock_test_binary_run.call_count <= len(groups):
+        # Wait for the other verifications of the first iteration to start.
+        barrier.wait(timeout=5)
+      with lock:
+        running[0] -= 1
+      if 'MockUnitTests.FailTest' in self.tests:
+        return test_self.generate_result_summary(
+            'MockUnitTests.CrashTest',
+            'C' + 'P' * (self.repeat - 1),
+            duration=0,
+        )
+      return test_self.generate_result_summary('MockUnitTests.CrashTest',
+                                               'P' * self.repeat,
+                                               duration=0)
+
+    mock_test_binary_run.side_effect = mock_test_binary_run_side_effect
+
+    strategy = self.get_strategy_for_group_verification()
+    groups = [[t] for t in strategy._get_parallel_tests()]
+    self.assertEqual(len(groups), 2)
+    barrier = threading.Barrier(len(groups))
+    with patch.object(ParallelStrategy,
+                      '_calc_concurrent_verifications',
+                      return_value=2):
+      best_test = strategy._find_best_parallel_group(groups, 60)
+    self.assertEqual(running[1], 2)
+    self.assertEqual([t.test_name for t in best_test.tests],
+                     ['MockUnitTests.FailTest'])
+    self.assertEqual(best_test.reproduced, 3)
+    # REPRODUCE_CNT iterations of FailTest, NOT_REPRODUCE_RETRY of PassTest.
+    self.assertEqual(mock_test_binary_run.call_count, 5)
+
+  @patch.object(GTestTestBinary, 'run', autospec=True)
+  def test_verify_groups_concurrently_cancels_pending(self,
+                                                      mock_test_binary_run):
+    test_self = self
+
+    def mock_test_binary_run_side_effect(self, *args, **kwargs):
+      if mock_test_binary_run.call_count > 1:
+        # Leave time to cancel once the first verification reproduced.
+        time.sleep(0.1)
+      return test_self.generate_result_summary('MockUnitTests.CrashTest',
+                                               'C',
+                                               duration=0)
+
+    mock_test_binary_run.side_effect = mock_test_binary_run_side_effect
+    strategy = self.get_strategy_for_group_verification()
+    tests = strategy._get_parallel_tests()
+    groups = [[tests[i % len(tests)]] for i in range(20)]
+    with patch.object(ParallelStrategy, 'REPRODUCE_CNT', 1), \
+        patch.object(ParallelStrategy, '_calc_concurrent_verifications',
+                     return_value=2):
+      best_group = strategy._find_best_parallel_group(groups, 60)
+    self.assertEqual(best_group.reproduced, 1)
+    # The verifications not started when the first group reproduced are
+    # cancelled.
+    self.assertLess(mock_test_binary_run.call_count, len(groups))
+
+  @patch('os.getloadavg', return_value=(2.5, 0, 0), create=True)
+  @patch('os.cpu_count', return_value=16)
+  def test_calc_concurrent_verifications(self, *_):
+    strategy = self.get_strategy('MockUnitTests.CrashTest')
+    strategy.parallel_jobs = 3
+    with patch.object(ParallelStrategy, 'MAX_CONCURRENT_VERIFICATIONS', 8):
+      # 13 free cores for 3 parallel jobs each.
+      self.assertEqual(strategy._calc_concurrent_verifications(10), 4)
+      self.assertEqual(strategy._calc_concurrent_verifications(2), 2)
+      strategy.parallel_jobs = 20
+      self.assertEqual(strategy._calc_concurrent_verifications(10), 1)
+      strategy.parallel_jobs = 1
+      self.assertEqual(strategy._calc_concurrent_verifications(10), 8)
+    with patch.object(ParallelStrategy, 'MAX_CONCURRENT_VERIFICATIONS', 2):
+      self.assertEqual(strategy._calc_concurrent_verifications(10), 2)
+
   @patch.object(GTestTestBinary, 'run', autospec=True)
   def test_should_raise_if_target_test_not_run(self, mock_test_binary_run):
     mock_test_binary_run.return_value = self.generate_result_summary('', '')
@@ -3,6 +3,7 @@
 # found in the LICENSE file.
 
 import json
+import random
 import unittest
 from unittest.mock import patch
 
@@ -134,6 +135,56 @@ class BaseResultSummaryTest(unittest.TestCase):
     self.assertIs(
         result_summary.get_failing_sample('test.foo.bar.fail'), fail_test)
 
+  def test_get_all(self):
+    result_summary = BaseResultSummary()
+    first = TestResult('test.foo', start_time=2)
+    second = TestResult('test.foo', start_time=1)
+    no_time = TestResult('test.foo')
+    result_summary.add(first)
+    result_summary.add(TestResult('test.bar', start_time=0))
+    result_summary.add(second)
+    self.assertIn('test.foo', result_summary)
+    self.assertNotIn('test.baz', result_summary)
+    self.assertListEqual(result_summary.get_all('test.foo'), [second, first])
+    self.assertListEqual(result_summary.get_all('test.baz'), [])
+
+    # Results added after a lookup are sorted in as well.
+    result_summary.add(no_time)
+    self.assertListEqual(result_summary.get_all('test.foo'),
+                         [no_time, second, first])
+    # The returned list is a copy.
+    result_summary.get_all('test.foo').clear()
+    self.assertEqual(len(result_summary.get_all('test.foo')), 3)
+    self.assertEqual(len(result_summary), 4)
+
+  def test_get_overlapping(self):
+    rnd = random.Random(0)
+    result_summary = BaseResultSummary()
+    for i in range(500):
+      result_summary.add(
+          TestResult('test.%d' % i,
+                     start_time=rnd.choice([None, rnd.uniform(0, 100)]),
+                     duration=rnd.choice([None, 0,
+                                          rnd.randint(0, 20000)])))
+    for _ in range(50):
+      start_time = rnd.uniform(-10, 110)
+      end_time = start_time + rnd.uniform(0, 10)
+      expected = [
+          r for r in sorted(
+              result_summary, key=lambda r: r.start_time or 0)
+          if r.start_time is not None and r.duration is not None and
+          r.start_time <= end_time and
+          r.start_time + r.duration / 1000 >= start_time
+      ]
+      self.assertListEqual(result_summary.get_overlapping(start_time, end_time),
+                           expected)
+
+    # The index is rebuilt after adding results.
+    late = TestResult('test.late', start_time=200, duration=1000)
+    result_summary.add(late)
+    self.assertListEqual(result_summary.get_overlapping(200.5, 300), [late])
+    self.assertListEqual(BaseResultSummary().get_overlapping(0, 1), [])
+
   def test_should_not_implement_in_base(self):
     result_summary = BaseResultSummary()
     with self.assertRaises(NotImplementedError):
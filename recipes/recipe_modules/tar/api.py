@@ -8,7 +8,8 @@ from recipe_engine import recipe_api
 class TarApi(recipe_api.RecipeApi):
   """Provides steps to tar and untar files."""
 
-  def make_package(self, root, output, compression=None):
+  def make_package(self, root, output, compression=None, verbose=False,
+                   jobs=None):
     """Returns TarPackage object that can be used to compress a set of files.
 
     Usage:
@@ -21,13 +22,19 @@ class TarApi(recipe_api.RecipeApi):
       root: a directory that would become root of a package, all files added to
           an archive will have archive paths relative to this directory.
       output: path to a tar file to create.
+      compression: None, 'gz', 'bz2' or 'zst'. Compression is multi-threaded,
+          using pigz or zstd when available on the bot and compressing blocks
+          in-process otherwise.
+      verbose (bool): If True, print the name of each tared file.
+      jobs (int): number of compression threads, defaults to the number of
+          CPUs.
 
     Returns:
       TarPackage object.
     """
-    return TarPackage(self, root, output, compression)
+    return TarPackage(self, root, output, compression, verbose, jobs)
 
-  def directory(self, step_name, directory, output):
+  def directory(self, step_name, directory, output, compression=None):
     """Step to compress a single directory.
 
     Args:
@@ -36,16 +43,18 @@ class TarApi(recipe_api.RecipeApi):
           an archive, i.e. |directory|/file.txt would be named 'file.txt' in
           the archive.
       output: path to a tar file to create.
+      compression: None, 'gz', 'bz2' or 'zst', see make_package.
     """
-    pkg = self.make_package(directory, output)
+    pkg = self.make_package(directory, output, compression)
     pkg.add_directory(directory)
     pkg.tar(step_name)
 
-  def untar(self, step_name, tar_file, output, quiet=False):
+  def untar(self, step_name, tar_file, output, quiet=True):
     """Step to uncompress |tar_file| into |output| directory.
 
     Tar package will be unpacked to |output| so that root of an archive is in
-    |output|, i.e. archive.tar/file.txt will become |output|/file.txt.
+    |output|, i.e. archive.tar/file.txt will become |output|/file.txt. The
+    compression of the archive is detected from its content.
 
     Step will FAIL if |output| already exists.
 
@@ -70,11 +79,14 @@ class TarApi(recipe_api.RecipeApi):
 class TarPackage:
   """Used to gather a list of files to tar."""
 
-  def __init__(self, module, root, output, compression):
+  def __init__(self, module, root, output, compression, verbose=False,
+               jobs=None):
     self._module = module
     self._root = root
     self._output = output
     self._compression = compression
+    self._verbose = verbose
+    self._jobs = jobs
     self._entries = []
 
   @property
@@ -119,6 +131,8 @@ class TarPackage:
       'output': str(self._output),
       'compression': str(self._compression),
       'root': str(self._root),
+      'verbose': self._verbose,
+      'jobs': self._jobs,
     }
     step_result = self._module.m.step(
         name=step_name,
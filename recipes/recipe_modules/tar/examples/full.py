@@ -32,6 +32,12 @@ def RunSteps(api):
   # Coverage for 'output' property.
   api.step('report', ['echo', package.output])
 
+  # Build a zstd compressed tar, listing the tared files.
+  zst_package = api.tar.make_package(
+      temp, temp.join('more.tar.zst'), 'zst', verbose=True, jobs=4)
+  zst_package.add_directory(zst_package.root.join('sub'))
+  zst_package.tar('taring zstd')
+
   # Untar the package.
   api.tar.untar('untaring', temp.join('output.tar'), temp.join('output'),
                 quiet=True)
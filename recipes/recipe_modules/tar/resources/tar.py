@@ -8,22 +8,166 @@ recipe module internally. Should not be used elsewhere.
 
 from __future__ import absolute_import
 from __future__ import print_function
+import bz2
+import collections
+import concurrent.futures
+import functools
+import gzip
 import json
 import os
+import shutil
 import subprocess
 import sys
 import tarfile
+import time
 
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
 
-def tar_with_subprocess(root, output, entries, compression):
+# Size of the chunks read from the 'tar' utility.
+_READ_CHUNK_SIZE = 1024 * 1024
+
+# Size of the blocks compressed independently by the in-process compressor.
+_COMPRESS_BLOCK_SIZE = 4 * 1024 * 1024
+
+# Multi-threaded compressors reading an uncompressed stream from stdin and
+# writing the compressed stream to stdout, in order of preference.
+_PARALLEL_COMPRESSORS = {
+    'gz': [['pigz', '-p', '{jobs}', '-c']],
+    'zst': [['zstd', '-q', '-T{jobs}', '-c']],
+}
+
+
+def _compress_zstd_block(data):
+  # ZstdCompressor objects must not be shared between threads.
+  return zstandard.ZstdCompressor().compress(data)
+
+
+# In-process compressors of a single block. Each returns a complete gzip
+# member, bzip2 stream or zstd frame, and decompressors read concatenated ones
+# back as a single stream. zlib and bz2 release the GIL while compressing.
+_BLOCK_COMPRESSORS = {
+    'gz': functools.partial(gzip.compress, compresslevel=6, mtime=0),
+    'bz2': bz2.compress,
+}
+if zstandard:
+  _BLOCK_COMPRESSORS['zst'] = _compress_zstd_block
+
+
+class _FileWriter:
+  """Writes an uncompressed tar stream to a file."""
+
+  def __init__(self, fileobj):
+    self._fileobj = fileobj
+    self.bytes_in = 0
+
+  def write(self, data):
+    self.bytes_in += len(data)
+    return self._fileobj.write(data)
+
+  def close(self):
+    pass
+
+
+class _ProcessWriter:
+  """Pipes a tar stream through a compressor process into a file."""
+
+  def __init__(self, fileobj, cmd):
+    print('Compressing with: {}'.format(cmd))
+    self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=fileobj)
+    self._cmd = cmd
+    self.bytes_in = 0
+
+  def write(self, data):
+    self.bytes_in += len(data)
+    return self._proc.stdin.write(data)
+
+  def close(self):
+    self._proc.stdin.close()
+    if self._proc.wait():
+      raise subprocess.CalledProcessError(self._proc.returncode, self._cmd)
+
+
+class _BlockCompressWriter:
+  """Compresses blocks of a tar stream in a thread pool, in order."""
+
+  def __init__(self, fileobj, compress_block, jobs):
+    print('Compressing in-process with {} thread(s)'.format(jobs))
+    self._fileobj = fileobj
+    self._compress_block = compress_block
+    self._executor = concurrent.futures.ThreadPoolExecutor(jobs)
+    # Bounds memory to a few blocks per thread.
+    self._max_pending = 2 * jobs
+    self._pending = collections.deque()
+    self._buffer = bytearray()
+    self.bytes_in = 0
+
+  def _submit(self, block):
+    while len(self._pending) >= self._max_pending:
+      self._fileobj.write(self._pending.popleft().result())
+    self._pending.append(self._executor.submit(self._compress_block, block))
+
+  def write(self, data):
+    self.bytes_in += len(data)
+    self._buffer += data
+    while len(self._buffer) >= _COMPRESS_BLOCK_SIZE:
+      self._submit(bytes(self._buffer[:_COMPRESS_BLOCK_SIZE]))
+      del self._buffer[:_COMPRESS_BLOCK_SIZE]
+    return len(data)
+
+  def close(self):
+    try:
+      if self._buffer:
+        self._submit(bytes(self._buffer))
+        self._buffer = bytearray()
+      while self._pending:
+        self._fileobj.write(self._pending.popleft().result())
+    finally:
+      # Don't compress the remaining blocks after an error.
+      for future in self._pending:
+        future.cancel()
+      self._executor.shutdown()
+
+
+def open_writer(fileobj, compression, jobs):
+  """Returns a writer compressing a tar stream into |fileobj|.
+
+  Uses a multi-threaded compressor from PATH when available, and compresses
+  blocks in-process in a thread pool otherwise.
+
+  Args:
+    fileobj: file object open for writing in binary mode.
+    compression: 'gz', 'bz2', 'zst' or any other value for no compression.
+    jobs: number of threads to compress with.
+
+  Returns:
+    An object with write(data) and close() methods and a bytes_in attribute
+    counting the uncompressed bytes written.
+  """
+  if compression not in ('gz', 'bz2', 'zst'):
+    return _FileWriter(fileobj)
+  for cmd in _PARALLEL_COMPRESSORS.get(compression, []):
+    if shutil.which(cmd[0]):
+      return _ProcessWriter(fileobj, [arg.format(jobs=jobs) for arg in cmd])
+  compress_block = _BLOCK_COMPRESSORS.get(compression)
+  if not compress_block:
+    raise ValueError('No %s compressor available, install %s' %
+                     (compression, _PARALLEL_COMPRESSORS[compression][0][0]))
+  return _BlockCompressWriter(fileobj, compress_block, jobs)
+
+
+def tar_with_subprocess(root, writer, entries, verbose):
   """tars set of files and directories using 'tar' utility.
 
   Works only on Linux and Mac, uses system 'tar' program.
 
   Args:
     root: absolute path to a directory that will become a root of the archive.
-    output: absolute path to a destination archive.
+    writer: writer of the uncompressed tar stream, see open_writer.
     entries: list of dicts, describing what to tar, see tar/api.py.
+    verbose: whether to list archived files.
 
   Returns:
     Exit code (0 on success).
@@ -49,28 +193,30 @@ def tar_with_subprocess(root, output, entries, compression):
     else:
       raise AssertionError('Invalid entry type: %s' % (tp,))
 
-  # Invoke 'tar' in |root| directory.
+  # Invoke 'tar' in |root| directory, writing the archive to stdout so that it
+  # is compressed by |writer|.
   args = ['tar']
-  options = '-cv'
-  if compression in ['gz', 'bz2']:
-    options += {'gz': 'z', 'bz2': 'j'}[compression]
+  options = '-c'
+  if verbose:
+    options += 'v'
 
   # Sequence of options must have f at the end to define the output.
-  # -cv[z/j]f
-  args += [options + 'f', output]
+  # -c[v]f
+  args += [options + 'f', '-']
   args += items_to_tar
   print(('Executing command: {}'.format(args)))
   proc = subprocess.Popen(
       args=args,
-      cwd=root)
-  proc.communicate()
-  if proc.stderr:
-    print(('Error: {}'.format(proc.stderr)))
+      cwd=root,
+      stdout=subprocess.PIPE)
+  for chunk in iter(lambda: proc.stdout.read(_READ_CHUNK_SIZE), b''):
+    writer.write(chunk)
+  proc.wait()
   print(('Ret code: {}'.format(proc.returncode)))
   return proc.returncode
 
 
-def tar_with_python(root, output, entries, compression):
+def tar_with_python(root, output, writer, entries, verbose):
   """tars set of files and directories using 'tarfile' python module.
 
   Works everywhere where python works (Windows and POSIX).
@@ -78,15 +224,14 @@ def tar_with_python(root, output, entries, compression):
   Args:
     root: absolute path to a directory that will become a root of the archive.
     output: absolute path to a destination archive.
+    writer: writer of the uncompressed tar stream, see open_writer.
     entries: list of dicts, describing what to tar, see tar/api.py.
+    verbose: whether to list archived files.
 
   Returns:
     Exit code (0 on success).
   """
-  mode = 'w'
-  if compression in ['gz', 'bz2']:
-    mode += ':%s' % compression
-  with tarfile.open(output, mode) as tf:
+  with tarfile.open(fileobj=writer, mode='w|') as tf:
     def add(path, archive_name):
       assert path.startswith(root), path
       # Do not add itself to archive.
@@ -94,7 +239,8 @@ def tar_with_python(root, output, entries, compression):
         return
       if archive_name is None:
         archive_name = path[len(root):]
-      print('Adding %s' % archive_name)
+      if verbose:
+        print('Adding %s' % archive_name)
       tf.add(path, archive_name)
 
     for entry in entries:
@@ -126,6 +272,8 @@ def main():
   entries = data['entries']
   output = data['output']
   compression = data['compression']
+  verbose = data.get('verbose', False)
+  jobs = data.get('jobs') or os.cpu_count() or 1
   root = data['root'].rstrip(os.path.sep) + os.path.sep
 
   # Archive root directory should exist and be an absolute path.
@@ -136,16 +284,25 @@ def main():
   assert os.path.isabs(output), output
 
   print('Taring %s...' % output)
+  start = time.time()
   exit_code = -1
   try:
-    if use_python_tar(entries):
-      # Used on Windows, since there's no builtin 'tar' utility there, and when
-      # an explicit archive_name is set, since there's no way to do that with
-      # the native tar utility without filesystem shenanigans
-      exit_code = tar_with_python(root, output, entries, compression)
-    else:
-      # On mac and linux 'tar' utility handles symlink and file modes.
-      exit_code = tar_with_subprocess(root, output, entries, compression)
+    with open(output, 'wb') as f:
+      writer = open_writer(f, compression, jobs)
+      try:
+        if use_python_tar(entries):
+          # Used on Windows, since there's no builtin 'tar' utility there, and
+          # when an explicit archive_name is set, since there's no way to do
+          # that with the native tar utility without filesystem shenanigans
+          tar_exit_code = tar_with_python(root, output, writer, entries,
+                                          verbose)
+        else:
+          # On mac and linux 'tar' utility handles symlink and file modes.
+          tar_exit_code = tar_with_subprocess(root, writer, entries, verbose)
+      finally:
+        # Also stops the compressor process or threads if taring failed.
+        writer.close()
+      exit_code = tar_exit_code
   finally:
     # On non-zero exit code or on unexpected exception, clean up.
     if exit_code:
@@ -154,7 +311,11 @@ def main():
       except:  # pylint: disable=bare-except
         pass
   if not exit_code:
+    elapsed = max(time.time() - start, 1e-6)
     print('Archive size: %.1f KB' % (os.stat(output).st_size / 1024.0,))
+    print('Archived %.1f MB in %.1fs (%.1f MB/s)' %
+          (writer.bytes_in / 1024.0**2, elapsed,
+           writer.bytes_in / 1024.0**2 / elapsed))
   return exit_code
 
 
@@ -3,17 +3,65 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import bz2
+import gzip
+import io
 import json
 import os.path
+import shutil
 import subprocess
+import tarfile
 import tempfile
 import unittest
+from unittest import mock
+
+import tar
+import untar
 
 THIS_DIR = os.path.dirname(__file__)
 
 
 class Test(unittest.TestCase):
 
+  def _tar_untar(self, tdir, compression, **kwargs):
+    input_dir = os.path.join(tdir, 'input')
+    os.makedirs(os.path.join(input_dir, 'sub'))
+    contents = {
+        'empty': b'',
+        os.path.join('sub', 'random'): os.urandom(3 * 1024 * 1024),
+        os.path.join('sub', 'zeros'): b'\0' * 5 * 1024 * 1024,
+    }
+    for name, content in contents.items():
+      with open(os.path.join(input_dir, name), 'wb') as f:
+        f.write(content)
+    output = os.path.join(tdir, 'output.tar.' + compression)
+
+    json_input = dict(
+        entries=[{
+            'type': 'dir',
+            'path': input_dir,
+        }],
+        output=output,
+        compression=compression,
+        root=tdir,
+        **kwargs)
+    subprocess.run(['python3', os.path.join(THIS_DIR, 'tar.py')],
+                   input=json.dumps(json_input),
+                   text=True,
+                   check=True)
+    json_input = json.dumps({
+        'output': os.path.join(tdir, 'out'),
+        'tar_file': output,
+        'quiet': True,
+    })
+    subprocess.run(['python3', os.path.join(THIS_DIR, 'untar.py')],
+                   input=json_input,
+                   text=True,
+                   check=True)
+    for name, content in contents.items():
+      with open(os.path.join(tdir, 'out', 'input', name), 'rb') as f:
+        self.assertEqual(f.read(), content, name)
+
   def test_tar_untar(self):
     with tempfile.TemporaryDirectory() as tdir:
       input_dir = os.path.join(tdir, 'input')
@@ -49,6 +97,83 @@ class Test(unittest.TestCase):
                      text=True,
                      check=True)
 
+  def test_tar_untar_gz_in_parallel(self):
+    with tempfile.TemporaryDirectory() as tdir:
+      self._tar_untar(tdir, 'gz', jobs=4)
+
+  def test_tar_untar_bz2_verbose(self):
+    with tempfile.TemporaryDirectory() as tdir:
+      self._tar_untar(tdir, 'bz2', verbose=True)
+
+  @unittest.skipUnless(shutil.which('zstd'), 'zstd is not installed')
+  def test_tar_untar_zst(self):
+    with tempfile.TemporaryDirectory() as tdir:
+      self._tar_untar(tdir, 'zst', jobs=2)
+
+  def test_block_compress_writer(self):
+    data = os.urandom(1000) * 1000
+    for compression, decompress in (('gz', gzip.decompress),
+                                    ('bz2', bz2.decompress)):
+      f = io.BytesIO()
+      with mock.patch.object(tar, '_COMPRESS_BLOCK_SIZE', 64 * 1024):
+        writer = tar._BlockCompressWriter(f, tar._BLOCK_COMPRESSORS[compression],
+                                          3)
+        for i in range(0, len(data), 10000):
+          writer.write(data[i:i + 10000])
+        writer.close()
+      self.assertEqual(writer.bytes_in, len(data))
+      self.assertEqual(decompress(f.getvalue()), data, compression)
+
+  @unittest.skipUnless(tar.zstandard, 'zstandard is not installed')
+  def test_untar_zst_blocks_in_process(self):
+    data = os.urandom(1000) * 1000
+    with tempfile.TemporaryDirectory() as tdir:
+      output = os.path.join(tdir, 'output.tar.zst')
+      with open(output, 'wb') as f, mock.patch.object(
+          tar, '_COMPRESS_BLOCK_SIZE', 64 * 1024):
+        writer = tar._BlockCompressWriter(f, tar._BLOCK_COMPRESSORS['zst'], 3)
+        with tarfile.open(fileobj=writer, mode='w|') as tf:
+          info = tarfile.TarInfo('data')
+          info.size = len(data)
+          tf.addfile(info, io.BytesIO(data))
+        writer.close()
+      out = os.path.join(tdir, 'out')
+      os.mkdir(out)
+      # Decompress with zstandard rather than the zstd utility.
+      with mock.patch.object(untar.shutil, 'which', return_value=None):
+        self.assertEqual(untar.untar_with_python(output, out, True), 0)
+      with open(os.path.join(out, 'data'), 'rb') as f:
+        self.assertEqual(f.read(), data)
+
+  def test_main_closes_writer_on_error(self):
+    writer = mock.Mock()
+    with tempfile.TemporaryDirectory() as tdir:
+      output = os.path.join(tdir, 'output.tar.gz')
+      json_input = json.dumps({
+          'entries': [{
+              'type': 'file',
+              'path': os.path.join(tdir, 'missing'),
+              'archive_name': 'missing',
+          }],
+          'output': output,
+          'compression': 'gz',
+          'root': tdir,
+      })
+      with mock.patch.object(tar.sys, 'stdin', io.StringIO(json_input)), \
+          mock.patch.object(tar, 'open_writer', return_value=writer):
+        with self.assertRaises(OSError):
+          tar.main()
+      writer.close.assert_called_once_with()
+      self.assertFalse(os.path.exists(output))
+
+  def test_open_writer_falls_back_to_block_compression(self):
+    with mock.patch.object(tar.shutil, 'which', return_value=None):
+      writer = tar.open_writer(io.BytesIO(), 'gz', 2)
+      writer.close()
+      self.assertIsInstance(writer, tar._BlockCompressWriter)
+      self.assertIsInstance(tar.open_writer(io.BytesIO(), 'None', 2),
+                            tar._FileWriter)
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -14,6 +14,45 @@ import shutil
 import subprocess
 import sys
 import tarfile
+import time
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+# Leading bytes of compressed archives, see tar.py for the compressions.
+_MAGIC_NUMBERS = [
+    (b'\x1f\x8b', 'gz'),
+    (b'BZh', 'bz2'),
+    (b'\x28\xb5\x2f\xfd', 'zst'),
+]
+
+# Decompressors writing the decompressed archive to stdout. pigz decompresses
+# on a single thread but reads, writes and checksums on separate ones.
+_DECOMPRESSORS = {
+    'gz': ['pigz', '-dc'],
+    'zst': ['zstd', '-dcq'],
+}
+
+
+def detect_compression(tar_file):
+  """Returns the compression of |tar_file|, or None if it is uncompressed."""
+  with open(tar_file, 'rb') as f:
+    header = f.read(4)
+  for magic, compression in _MAGIC_NUMBERS:
+    if header.startswith(magic):
+      return compression
+  return None
+
+
+def open_decompressor(tar_file, compression):
+  """Starts a decompressor of |tar_file| from PATH, or returns None."""
+  cmd = _DECOMPRESSORS.get(compression)
+  if not cmd or not shutil.which(cmd[0]):
+    return None
+  print('Decompressing with: {}'.format(cmd))
+  return subprocess.Popen(cmd + [tar_file], stdout=subprocess.PIPE)
 
 
 def untar_with_subprocess(tar_file, output, quiet):
@@ -35,13 +74,32 @@ def untar_with_subprocess(tar_file, output, quiet):
   if not quiet:
     options += 'v'
   options += 'f'
-  args += [options, tar_file]
-  return subprocess.call(
+  decompressor = open_decompressor(tar_file, detect_compression(tar_file))
+  if not decompressor:
+    # 'tar' detects gzip and bzip2 compression by itself.
+    args += [options, tar_file]
+    return subprocess.call(
+        args=args,
+        cwd=output)
+  args += [options, '-']
+  exit_code = subprocess.call(
       args=args,
-      cwd=output)
+      cwd=output,
+      stdin=decompressor.stdout)
+  decompressor.stdout.close()
+  return decompressor.wait() or exit_code
 
 
-def untar_with_python(tar_file, output):
+def _extract_all(tf, output, quiet):
+  # Iterates over members rather than extracting them by name, as each name
+  # lookup scans all the members, and so that streamed archives work too.
+  for member in tf:
+    if not quiet:
+      print('Extracting %s' % member.name)
+    tf.extract(member, output)
+
+
+def untar_with_python(tar_file, output, quiet):
   """Untars an archive using 'tarfile' python module.
 
   Works everywhere where Python works (Windows and POSIX).
@@ -49,14 +107,33 @@ def untar_with_python(tar_file, output):
   Args:
     tar_file: absolute path to an archive to untar.
     output: existing directory to untar to.
+    quiet (bool): If True, do not print the name of each extracted file.
 
   Returns:
     Exit code (0 on success).
   """
-  with tarfile.open(tar_file, 'r') as tf:
-    for name in tf.getnames():
-      print('Extracting %s' % name)
-      tf.extract(name, output)
+  compression = detect_compression(tar_file)
+  if compression != 'zst':
+    with tarfile.open(tar_file, 'r') as tf:
+      _extract_all(tf, output, quiet)
+    return 0
+
+  # tarfile doesn't support zstd, stream the archive from a decompressor.
+  decompressor = open_decompressor(tar_file, compression)
+  if decompressor:
+    with tarfile.open(fileobj=decompressor.stdout, mode='r|') as tf:
+      _extract_all(tf, output, quiet)
+    decompressor.stdout.close()
+    return decompressor.wait()
+  if not zstandard:
+    print('No zstd decompressor available, install zstd')
+    return 1
+  with open(tar_file, 'rb') as f:
+    # tar.py writes archives compressed in-process as several zstd frames.
+    reader = zstandard.ZstdDecompressor().stream_reader(
+        f, read_across_frames=True)
+    with tarfile.open(fileobj=reader, mode='r|') as tf:
+      _extract_all(tf, output, quiet)
   return 0
 
 
@@ -76,12 +153,13 @@ def main():
   assert not os.path.exists(output), output
 
   print('Untaring %s...' % tar_file)
+  start = time.time()
   exit_code = -1
   try:
     os.makedirs(output)
     if sys.platform == 'win32':
       # Used on Windows, since there's no builtin 'untar' utility there.
-      exit_code = untar_with_python(tar_file, output)
+      exit_code = untar_with_python(tar_file, output, quiet)
     else:
       # On mac and linux 'untar' utility handles symlink and file modes.
       exit_code = untar_with_subprocess(tar_file, output, quiet)
@@ -89,6 +167,11 @@ def main():
     # On non-zero exit code or on unexpected exception, clean up.
     if exit_code:
       shutil.rmtree(output, ignore_errors=True)
+  if not exit_code:
+    elapsed = max(time.time() - start, 1e-6)
+    size = os.stat(tar_file).st_size / 1024.0**2
+    print('Extracted %.1f MB archive in %.1fs (%.1f MB/s)' %
+          (size, elapsed, size / elapsed))
   return exit_code
 
 
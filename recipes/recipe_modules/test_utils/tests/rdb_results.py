@@ -0,0 +1,144 @@
+# Copyright 2022 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+from google.protobuf import duration_pb2
+
+from recipe_engine import post_process
+
+from PB.go.chromium.org.luci.resultdb.proto.v1 import (test_result as
+                                                       test_result_pb2)
+from PB.go.chromium.org.luci.resultdb.proto.v1 import (common as common_pb2)
+from PB.go.chromium.org.luci.resultdb.proto.v1 import (failure_reason as
+                                                       failure_reason_pb2)
+
+from RECIPE_MODULES.build.test_utils import util
+
+DEPS = [
+    'recipe_engine/assertions',
+    'recipe_engine/resultdb',
+]
+
+_PREFIX = 'ninja://base:base_unittests/'
+
+
+def _result(test_name, status, expected, failure_reason=None, tag=None,
+            duration=None):
+  var = common_pb2.Variant()
+  getattr(var, 'def')['test_suite'] = 'base_unittests'
+  return test_result_pb2.TestResult(
+      test_id=_PREFIX + test_name,
+      variant=var,
+      status=status,
+      expected=expected,
+      failure_reason=failure_reason_pb2.FailureReason(
+          primary_error_message=failure_reason) if failure_reason else None,
+      tags=[common_pb2.StringPair(key='test_name', value=tag)] if tag else [],
+      duration=duration)
+
+
+def RunSteps(api):
+  failure = 'base_unittests.cc(10): Check failed:'
+  invocations = {
+      'inv0':
+          api.resultdb.Invocation(test_results=[
+              _result('A.Pass', test_result_pb2.PASS, True,
+                      duration=duration_pb2.Duration(seconds=1, nanos=5000000)),
+              _result('A.Fail', test_result_pb2.FAIL, False, failure),
+              _result('A.Fail', test_result_pb2.FAIL, False, failure),
+          ]),
+      'inv1':
+          api.resultdb.Invocation(test_results=[
+              _result('A.Flaky/0', test_result_pb2.FAIL, False, failure,
+                      tag='Flaky/A.Flaky'),
+              _result('A.Flaky/0', test_result_pb2.PASS, True,
+                      tag='Flaky/A.Flaky'),
+              _result('A.Skip', test_result_pb2.SKIP, False),
+          ]),
+  }
+  suite = util.RDBPerSuiteResults.create(invocations, 'base_unittests',
+                                         _PREFIX, 0)
+
+  # Tests of a suite are stored in shared columns.
+  tests = suite.all_tests
+  api.assertions.assertIsInstance(tests, util.RDBTestSequence)
+  api.assertions.assertEqual(len(tests), 4)
+  api.assertions.assertEqual(len({id(t.columns) for t in tests}), 1)
+  api.assertions.assertEqual(
+      [t.test_name for t in tests],
+      ['A.Pass', 'A.Fail', 'Flaky/A.Flaky', 'A.Skip'])
+
+  passed, failed, flaky, skipped = tests
+  api.assertions.assertEqual(passed.test_id, _PREFIX + 'A.Pass')
+  api.assertions.assertEqual(passed.invocation_id, 'inv0')
+  api.assertions.assertEqual(passed.duration_milliseconds, 1005)
+  api.assertions.assertEqual(passed.statuses, (test_result_pb2.PASS,))
+  api.assertions.assertEqual(passed.expectednesses, (True,))
+  api.assertions.assertEqual(passed.failure_reasons, ('',))
+  api.assertions.assertEqual(failed.total_test_count(), 2)
+  api.assertions.assertEqual(failed.unexpected_unpassed_count(), 2)
+  api.assertions.assertEqual(failed.failure_reasons, (failure, failure))
+  api.assertions.assertIsNone(failed.duration_milliseconds)
+  api.assertions.assertEqual(flaky.test_id, _PREFIX + 'A.Flaky/0')
+  api.assertions.assertEqual(flaky.invocation_id, 'inv1')
+  api.assertions.assertEqual(flaky.expectednesses, (False, True))
+  api.assertions.assertEqual(skipped.statuses, (test_result_pb2.SKIP,))
+
+  # Failure reasons are stored once per suite.
+  api.assertions.assertEqual(sorted(failed.columns.failure_reasons),
+                             ['', failure])
+
+  # Slicing and indexing.
+  api.assertions.assertEqual(tests[1:3], (failed, flaky))
+  api.assertions.assertEqual(tests[::-1], (skipped, flaky, failed, passed))
+  api.assertions.assertEqual(tests[-1], skipped)
+  with api.assertions.assertRaises(IndexError):
+    tests[4]  # pylint: disable=pointless-statement
+  api.assertions.assertEqual(tests, (passed, failed, flaky, skipped))
+  api.assertions.assertNotEqual(tests, [passed, failed, flaky, skipped])
+  api.assertions.assertIn('A.Skip', repr(tests))
+
+  # Unexpected tests are the same views as the ones in all_tests.
+  api.assertions.assertEqual(suite.unexpected_failing_tests, {failed, skipped})
+  api.assertions.assertEqual(suite.unexpected_skipped_tests, {skipped})
+  api.assertions.assertEqual(suite.unexpected_passing_tests, set())
+  api.assertions.assertEqual(
+      set(suite.individual_unexpected_test_by_test_name), {'A.Fail', 'A.Skip'})
+
+  # Tests created on their own compare equal to the ones of a suite with the
+  # same results.
+  standalone = util.RDBPerIndividualTestResults.create(
+      test_id=_PREFIX + 'A.Fail',
+      test_results=[
+          _result('A.Fail', test_result_pb2.FAIL, False, failure),
+          _result('A.Fail', test_result_pb2.FAIL, False, failure),
+      ],
+      test_id_prefix=_PREFIX,
+      invocation_id='inv0')
+  api.assertions.assertIsNot(standalone.columns, failed.columns)
+  api.assertions.assertEqual(len(standalone.columns), 1)
+  api.assertions.assertEqual(standalone, failed)
+  api.assertions.assertEqual(hash(standalone), hash(failed))
+  api.assertions.assertNotEqual(standalone, passed)
+  api.assertions.assertNotEqual(standalone, 'A.Fail')
+  api.assertions.assertEqual(repr(standalone), repr(failed))
+
+  # Suites created from tests are compared by the tests' results.
+  other_suite = util.RDBPerSuiteResults.create(invocations, 'base_unittests',
+                                               _PREFIX, 0)
+  api.assertions.assertEqual(other_suite, suite)
+  manual_suite = util.RDBPerSuiteResults(
+      'base_unittests', '', 1, set(), {standalone}, set(), False, {},
+      [standalone], '')
+  api.assertions.assertEqual(manual_suite.all_tests, (standalone,))
+
+  _, lines = util.RDBResults.create([suite, manual_suite]).get_size_details()
+  api.assertions.assertIn('\t\tNumber of RDBPerIndividualTestResults entries: 4',
+                          lines)
+
+
+def GenTests(api):
+  yield api.test(
+      'basic',
+      api.post_process(post_process.DropExpectation),
+  )
@@ -2,8 +2,10 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import array
 import attr
 import collections
+import collections.abc
 import sys
 
 from . import canonical
@@ -12,7 +14,8 @@ from google.protobuf import json_format
 from PB.go.chromium.org.luci.resultdb.proto.v1 import (test_result as
                                                        test_result_pb2)
 
-from RECIPE_MODULES.build.attr_utils import attrib, attrs, mapping, sequence
+from RECIPE_MODULES.build.attr_utils import (AttributeConstraint, attrib,
+                                             attrs, mapping)
 
 
 class GTestResults:
@@ -185,11 +188,210 @@ class RDBResults:
               len(suite.all_tests)))
       lines.append(
           '\t\tSize of all RDBPerIndividualTestResults entries: {}'.format(
-              hr_size(sum([t.get_size_in_mem() for t in suite.all_tests]))))
+              hr_size(suite.get_tests_size_in_mem())))
 
     return total_size_hr, lines
 
 
+def _intern_index(values, index_by_value, value):
+  """Returns the index of value in the list values, appending it if needed."""
+  index = index_by_value.get(value)
+  if index is None:
+    index = len(values)
+    values.append(value)
+    index_by_value[value] = index
+  return index
+
+
+class RDBResultColumns:
+  """Stores the tests of a suite and their results in columns.
+
+  Suites can have hundreds of thousands of tests, so instead of an object per
+  test, each test is a row of per-test columns pointing at its rows in the
+  per-result columns:
+  * Test IDs are stored without |test_id_prefix| in one utf-8 buffer, and test
+    names only if they aren't the test ID without the prefix.
+  * Invocation IDs and failure reasons are indexes into lists of the distinct
+    values, since a suite mostly has few of them.
+  * Durations, statuses and expectednesses are stored in arrays.
+  |RDBPerIndividualTestResults| are views of single tests of the columns.
+  """
+
+  __slots__ = (
+      'test_id_prefix',
+      '_test_id_suffixes',
+      '_test_id_suffix_offsets',
+      '_test_names',
+      '_invocation_indexes',
+      '_invocation_ids',
+      '_index_by_invocation_id',
+      '_durations',
+      '_result_offsets',
+      'statuses',
+      'expectednesses',
+      'failure_reason_indexes',
+      'failure_reasons',
+      '_index_by_failure_reason',
+  )
+
+  # Stored in |_durations| for tests without a duration, the minimum of the
+  # array's type.
+  _NO_DURATION = -2**31
+
+  def __init__(self, test_id_prefix=''):
+    self.test_id_prefix = test_id_prefix
+    self._test_id_suffixes = bytearray()
+    self._test_id_suffix_offsets = array.array('I', [0])
+    # Maps the index of a test to its name, for tests whose name isn't the
+    # test ID without the prefix, e.g. parameterized gtests.
+    self._test_names = {}
+    self._invocation_indexes = array.array('I')
+    self._invocation_ids = []
+    self._index_by_invocation_id = {}
+    self._durations = array.array('i')
+    # The results of test i are the ones from _result_offsets[i] to
+    # _result_offsets[i + 1].
+    self._result_offsets = array.array('I', [0])
+    self.statuses = array.array('B')
+    self.expectednesses = array.array('B')
+    self.failure_reason_indexes = array.array('I')
+    self.failure_reasons = []
+    self._index_by_failure_reason = {}
+
+  def __len__(self):
+    return len(self._durations)
+
+  def append(self, test_id, test_name, invocation_id, duration_milliseconds,
+             results):
+    """Adds a test and returns its index.
+
+    Args:
+      test_id: The full test ID, starting with |test_id_prefix|.
+      test_name: The name of the test.
+      invocation_id: The invocation ID of the test.
+      duration_milliseconds: The duration of the test, or None.
+      results: A list of (status, expected, failure reason) tuples.
+    """
+    assert test_id.startswith(self.test_id_prefix)
+    index = len(self)
+    test_id_suffix = test_id[len(self.test_id_prefix):]
+    self._test_id_suffixes += test_id_suffix.encode('utf-8')
+    self._test_id_suffix_offsets.append(len(self._test_id_suffixes))
+    if test_name != test_id_suffix:
+      self._test_names[index] = test_name
+    self._invocation_indexes.append(
+        _intern_index(self._invocation_ids, self._index_by_invocation_id,
+                      invocation_id))
+    self._durations.append(self._NO_DURATION if duration_milliseconds is None
+                           else duration_milliseconds)
+    for status, expected, failure_reason in results:
+      self.statuses.append(status)
+      self.expectednesses.append(expected)
+      self.failure_reason_indexes.append(
+          _intern_index(self.failure_reasons, self._index_by_failure_reason,
+                        failure_reason))
+    self._result_offsets.append(len(self.statuses))
+    return index
+
+  def test_id(self, index):
+    return self.test_id_prefix + self._test_id_suffix(index)
+
+  def _test_id_suffix(self, index):
+    return self._test_id_suffixes[
+        self._test_id_suffix_offsets[index]:
+        self._test_id_suffix_offsets[index + 1]].decode('utf-8')
+
+  def test_name(self, index):
+    test_name = self._test_names.get(index)
+    if test_name is None:
+      test_name = self._test_id_suffix(index)
+    return test_name
+
+  def invocation_id(self, index):
+    return self._invocation_ids[self._invocation_indexes[index]]
+
+  def duration_milliseconds(self, index):
+    duration = self._durations[index]
+    return None if duration == self._NO_DURATION else duration
+
+  def results_slice(self, column, index):
+    """Returns the entries of a per-result column for a test."""
+    return column[self._result_offsets[index]:self._result_offsets[index + 1]]
+
+  def get_size_in_mem(self):
+    total = sys.getsizeof(self)
+    # test_id_prefix is the suite's, which the RDBResults accounts for.
+    total += sys.getsizeof(self._test_id_suffixes)
+    total += sys.getsizeof(self._test_id_suffix_offsets)
+    total += sys.getsizeof(self._test_names)
+    for test_name in self._test_names.values():
+      total += sys.getsizeof(test_name)
+    total += sys.getsizeof(self._invocation_indexes)
+    # Keys of the _index_by_* dicts are the elements of the lists.
+    total += sys.getsizeof(self._invocation_ids)
+    total += sys.getsizeof(self._index_by_invocation_id)
+    for invocation_id in self._invocation_ids:
+      total += sys.getsizeof(invocation_id)
+    total += sys.getsizeof(self._durations)
+    total += sys.getsizeof(self._result_offsets)
+    total += sys.getsizeof(self.statuses)
+    total += sys.getsizeof(self.expectednesses)
+    total += sys.getsizeof(self.failure_reason_indexes)
+    total += sys.getsizeof(self.failure_reasons)
+    total += sys.getsizeof(self._index_by_failure_reason)
+    for reason in self.failure_reasons:
+      total += sys.getsizeof(reason)
+    return total
+
+
+class RDBTestSequence(collections.abc.Sequence):
+  """The tests of an |RDBResultColumns|, as |RDBPerIndividualTestResults|.
+
+  The |RDBPerIndividualTestResults| are created when accessed, so that a
+  suite doesn't keep an object per test.
+  """
+
+  __slots__ = ('columns',)
+
+  def __init__(self, columns):
+    self.columns = columns
+
+  def __len__(self):
+    return len(self.columns)
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return tuple(self[i] for i in range(*index.indices(len(self))))
+    if index < 0:
+      index += len(self)
+    if not 0 <= index < len(self):
+      raise IndexError('test index out of range')
+    return RDBPerIndividualTestResults(columns=self.columns, index=index)
+
+  def __eq__(self, other):
+    if not isinstance(other, (tuple, RDBTestSequence)):
+      return NotImplemented
+    return tuple(self) == tuple(other)
+
+  __hash__ = None
+
+  def __repr__(self):
+    return 'RDBTestSequence({!r})'.format(tuple(self))
+
+
+def _to_tests(value):
+  if isinstance(value, RDBTestSequence):
+    return value
+  return tuple(value)
+
+
+# Constraint for a sequence of |RDBPerIndividualTestResults|. Sequences of
+# tests created together are kept as |RDBTestSequence|.
+_tests = AttributeConstraint.from_callables(
+    validator=attr.validators.instance_of((tuple, RDBTestSequence)),
+    converter=_to_tests)
+
+
 @attrs()
 class RDBPerSuiteResults:
   """Contains results of a single test suite as returned by RDB."""
@@ -218,8 +420,8 @@ class RDBPerSuiteResults:
   # A mapping from test name str to its |RDBPerIndividualTestResults| object
   # for tests without any expected results.
   individual_unexpected_test_by_test_name = attrib(mapping[str, ...])
-  # A list of all |RDBPerIndividualTestResults| objects within this class.
-  all_tests = attrib(sequence[...])
+  # A sequence of all |RDBPerIndividualTestResults| objects within this class.
+  all_tests = attrib(_tests)
   # |test_id_prefix| from the test specs in testing/buildbot. Empty str if it's
   # not set, or if any test IDs from invocations don't have the exact prefix
   # as input.
@@ -272,16 +474,16 @@ class RDBPerSuiteResults:
     unexpected_passing_tests = set()
     unexpected_skipped_tests = set()
     individual_unexpected_test_by_test_name = {}
-    all_tests = []
+    columns = RDBResultColumns(test_id_prefix)
     for test_id, test_results in results_by_test_id.items():
       individual_test = RDBPerIndividualTestResults.create(
           test_id=test_id,
           test_results=test_results,
           test_id_prefix=test_id_prefix,
-          invocation_id=test_id_to_invocation_id[test_id])
+          invocation_id=test_id_to_invocation_id[test_id],
+          columns=columns)
       if individual_test.unexpected_unpassed_count() > 0:
         exists_unexpected_failing_result = True
-      all_tests.append(individual_test)
       # This filters out any tests that were auto-retried within the
       # invocation and finished with an expected result. eg: a test that's
       # expected to CRASH and runs with results [FAIL, CRASH]. RDB returns
@@ -313,7 +515,7 @@ class RDBPerSuiteResults:
         invalid=invalid,
         individual_unexpected_test_by_test_name=(
             individual_unexpected_test_by_test_name),
-        all_tests=all_tests,
+        all_tests=RDBTestSequence(columns) if len(columns) else (),
         test_id_prefix=test_id_prefix,
         exists_unexpected_failing_result=exists_unexpected_failing_result)
 
@@ -366,58 +568,73 @@ class RDBPerSuiteResults:
     total += sys.getsizeof(self.suite_name)
     total += sys.getsizeof(self.variant_hash)
     total += sys.getsizeof(self.total_tests_ran)
-    # The elements in the unexpected_*_tests sets contain test names, whose
-    # strings' sizes are already captured as part of the elements in all_tests.
-    # So only count the size of their sets.
+    # The elements in the unexpected_*_tests sets are captured by
+    # get_tests_size_in_mem(). So only count the size of their sets.
     total += sys.getsizeof(self.unexpected_passing_tests)
     total += sys.getsizeof(self.unexpected_failing_tests)
     total += sys.getsizeof(self.unexpected_skipped_tests)
-    # Both keys and vals of individual_unexpected_test_by_test_name are already
-    # captured in size reporting elsewhere. So only capture the size of the dict
-    # here.
+    # The keys of individual_unexpected_test_by_test_name are test names, whose
+    # strings' sizes are captured as part of the columns.
     total += sys.getsizeof(self.individual_unexpected_test_by_test_name)
     total += sys.getsizeof(self.all_tests)
-    for t in self.all_tests:
-      total += t.get_size_in_mem()
+    total += self.get_tests_size_in_mem()
     # Let the RDBResults account for test_id_prefix since it can de-dupe
     # repeats.
     return total
 
+  def get_tests_size_in_mem(self):
+    """Returns the size of the |RDBPerIndividualTestResults| of this suite."""
+    total = 0
+    # Only count the tests that are kept, tests of an RDBTestSequence are
+    # created when accessed.
+    tests = list(self.individual_unexpected_test_by_test_name.values())
+    tests.extend(self.unexpected_passing_tests)
+    tests.extend(self.unexpected_failing_tests)
+    if isinstance(self.all_tests, tuple):
+      tests.extend(self.all_tests)
+    seen_ids = set()
+    for t in tests:
+      if id(t) not in seen_ids:
+        total += t.get_size_in_mem()
+      seen_ids.add(id(t))
+    # Tests created together share a single RDBResultColumns.
+    all_columns = [t.columns for t in tests]
+    if isinstance(self.all_tests, RDBTestSequence):
+      all_columns.append(self.all_tests.columns)
+    seen_columns_ids = set()
+    for columns in all_columns:
+      if id(columns) not in seen_columns_ids:
+        total += columns.get_size_in_mem()
+      seen_columns_ids.add(id(columns))
+    return total
 
-@attrs()
+
+@attrs(eq=False, repr=False)
 class RDBPerIndividualTestResults:
   """Contains result info of an individual test as returned by RDB.
 
   "individual test" is uniquely identified by test id. For each individual test
   within a test_suite, there could be multiple test results from being retried,
-  or repeated within shards of the suite. These result info are stored in
+  or repeated within shards of the suite. These result info are exposed as
   |statuses|, |expectednesses|, etc.
+
+  The info is stored in |columns|, usually shared by all the tests of the suite,
+  and read from them when accessed. Instances compare equal if their info is.
   """
 
   # NOTE: If you add an attribute here, make sure to reflect the change in
   # update get_size_in_mem() below.
-  # Read from any result's test_name tag. If not exist, use the part of test_id
-  # after test_id_prefix.
-  # e.g. Service/FeatureInfoTest.Basic/0
-  test_name = attrib(str)
-  # Full test ID.
-  # e.g. ninja://gpu:gpu_unittests/FeatureInfoTest.Basic/Service.0
-  test_id = attrib(str)
-  # Full invocation ID that includes the swarming task ID
-  # e.g. task-chromium-swarm.appspot.com-5e052f4430ead411
-  invocation_id = attrib(str)
-  # A duration of any passed run.
-  duration_milliseconds = attrib(int, default=None)
-  # |statuses| and |expectednesses| are outcomes of single results.
-  # Values at each index are for the same test run.
-  statuses = attrib(sequence[...])
-  expectednesses = attrib(sequence[bool])
-  # Reasons of all results corresponding to |statuses|. Empty str if the
-  # raw RDB result doesn't have this stored.
-  failure_reasons = attrib(sequence[str])
+  columns = attrib(RDBResultColumns)
+  # The index of this test in |columns|.
+  index = attrib(int)
 
   @classmethod
-  def create(cls, test_id, test_results, test_id_prefix, invocation_id):
+  def create(cls,
+             test_id,
+             test_results,
+             test_id_prefix,
+             invocation_id,
+             columns=None):
     """
     Args:
       test_id: The test ID of results.
@@ -425,16 +642,16 @@ class RDBPerIndividualTestResults:
       test_id_prefix: The test ID prefix of the |RDBPerSuiteResults| where this
         result is grouped into.
       invocation_id: Invocation ID of the test.
+      columns: The |RDBResultColumns| to store the test in. If None, the test
+        is stored in new columns.
     """
     duration_milliseconds = None
     test_name = None
     test_id = ''
-    statuses = [tr.status for tr in test_results]
-    expectednesses = [tr.expected for tr in test_results]
-    failure_reasons = [
-        tr.failure_reason.primary_error_message or '' for tr in test_results
-    ]
+    results = []
     for tr in test_results:
+      results.append((tr.status, tr.expected,
+                      tr.failure_reason.primary_error_message or ''))
       test_id = tr.test_id
       # Durations of expected runs or unexpected passed (exonerated) runs are
       # considered valid. Use duration of the last passed or expected result
@@ -452,39 +669,91 @@ class RDBPerIndividualTestResults:
     if not test_name:
       test_name = test_id[len(test_id_prefix):]
 
-    return cls(
-        test_name=test_name,
-        test_id=test_id,
-        invocation_id=invocation_id,
-        duration_milliseconds=duration_milliseconds,
-        statuses=statuses,
-        expectednesses=expectednesses,
-        failure_reasons=failure_reasons)
+    if columns is None:
+      columns = RDBResultColumns(test_id_prefix)
+    index = columns.append(test_id, test_name, invocation_id,
+                           duration_milliseconds, results)
+    return cls(columns=columns, index=index)
+
+  # Read from any result's test_name tag. If not exist, use the part of test_id
+  # after test_id_prefix.
+  # e.g. Service/FeatureInfoTest.Basic/0
+  @property
+  def test_name(self):
+    return self.columns.test_name(self.index)
+
+  # Full test ID.
+  # e.g. ninja://gpu:gpu_unittests/FeatureInfoTest.Basic/Service.0
+  @property
+  def test_id(self):
+    return self.columns.test_id(self.index)
+
+  # Full invocation ID that includes the swarming task ID
+  # e.g. task-chromium-swarm.appspot.com-5e052f4430ead411
+  @property
+  def invocation_id(self):
+    return self.columns.invocation_id(self.index)
+
+  # A duration of any passed run.
+  @property
+  def duration_milliseconds(self):
+    return self.columns.duration_milliseconds(self.index)
+
+  def _results_slice(self, column):
+    return self.columns.results_slice(column, self.index)
+
+  # |statuses| and |expectednesses| are outcomes of single results.
+  # Values at each index are for the same test run.
+  @property
+  def statuses(self):
+    return tuple(self._results_slice(self.columns.statuses))
+
+  @property
+  def expectednesses(self):
+    return tuple(
+        bool(e) for e in self._results_slice(self.columns.expectednesses))
+
+  # Reasons of all results corresponding to |statuses|. Empty str if the
+  # raw RDB result doesn't have this stored.
+  @property
+  def failure_reasons(self):
+    return tuple(
+        self.columns.failure_reasons[i]
+        for i in self._results_slice(self.columns.failure_reason_indexes))
+
+  def _key(self):
+    return (self.test_name, self.test_id, self.invocation_id,
+            self.duration_milliseconds, self.statuses, self.expectednesses,
+            self.failure_reasons)
+
+  def __eq__(self, other):
+    if not isinstance(other, RDBPerIndividualTestResults):
+      return NotImplemented
+    if self.columns is other.columns and self.index == other.index:
+      return True
+    return self._key() == other._key()
+
+  def __hash__(self):
+    return hash(self._key())
+
+  def __repr__(self):
+    return ('RDBPerIndividualTestResults(test_name={!r}, test_id={!r}, '
+            'invocation_id={!r}, duration_milliseconds={!r}, statuses={!r}, '
+            'expectednesses={!r}, failure_reasons={!r})'.format(*self._key()))
 
   def total_test_count(self):
-    return len(self.statuses)
+    return len(self._results_slice(self.columns.statuses))
 
   def unexpected_unpassed_count(self):
     return sum([(status != test_result_pb2.PASS and not expected)
-                for status, expected in zip(self.statuses, self.expectednesses)
-               ])
+                for status, expected in zip(
+                    self._results_slice(self.columns.statuses),
+                    self._results_slice(self.columns.expectednesses))])
 
   def get_size_in_mem(self):
-    total = sys.getsizeof(self)
-    total += sys.getsizeof(self.test_id)
-    total += sys.getsizeof(self.test_name)
-    total += sys.getsizeof(self.duration_milliseconds)
-    # self.statuses and self.expectednesses are lists of very few unique
-    # elements. So don't bother counting the size of each element since each
-    # unique element is only stored once.
-    total += sys.getsizeof(self.statuses)
-    total += sys.getsizeof(self.expectednesses)
-    # Assume the elements in self.failure_reasons are all unique. So count
-    # both the size of the list, and the size of each element.
-    total += sys.getsizeof(self.failure_reasons)
-    for reason in self.failure_reasons:
-      total += sys.getsizeof(reason)
-    return total
+    # The test's info is in self.columns, which is usually shared with other
+    # tests, so let the RDBPerSuiteResults account for it.
+    return sys.getsizeof(self)
 
 
 @attrs()
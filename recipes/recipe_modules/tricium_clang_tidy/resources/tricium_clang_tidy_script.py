@@ -26,25 +26,38 @@ import bisect
 import collections
 import contextlib
 import dataclasses
+import hashlib
 import io
+import itertools
 import json
 import logging
 import multiprocessing
 import multiprocessing.pool
 import os
 import os.path
+import pickle
 import pipes
 import re
 import shlex
+import shutil
 import signal
 import subprocess
 import sys
 import tempfile
+import threading
 import time
 from typing import (IO, Any, Callable, Dict, Generator, Iterable, List,
                     Optional, Set, Tuple, TypeVar)
 
-from yaml import reader as yaml_reader, parser as yaml_parser, safe_load as yaml_safe_load
+import yaml
+
+# libyaml's loader is an order of magnitude faster than the pure-python one,
+# which matters since clang-tidy fixes files can be huge and are parsed while
+# holding the GIL.
+try:
+  _YamlSafeLoader: Any = yaml.CSafeLoader
+except AttributeError:
+  _YamlSafeLoader = yaml.SafeLoader
 
 _CC_FILE_EXTENSIONS = ('.cc', '.cpp', '.c', '.cxx')
 _HEADER_FILE_EXTENSIONS = ('.h', '.hpp')
@@ -276,6 +289,36 @@ class _DiagnosticNoteBuilder:
         for x in self._notes)
 
 
+def _intern_diagnostic(diag: _TidyDiagnostic) -> _TidyDiagnostic:
+  """Returns `diag` with all of its paths, names and messages interned.
+
+  Strings of diagnostics that were unpickled or loaded from JSON aren't shared
+  with identical ones, which adds up with many diagnostics.
+  """
+
+  def intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+  def intern_expansion_locs(locs):
+    return tuple(
+        dataclasses.replace(x, file_path=intern(x.file_path)) for x in locs)
+
+  return dataclasses.replace(
+      diag,
+      file_path=intern(diag.file_path),
+      diag_name=intern(diag.diag_name),
+      message=intern(diag.message),
+      expansion_locs=intern_expansion_locs(diag.expansion_locs),
+      notes=tuple(
+          dataclasses.replace(
+              x,
+              file_path=intern(x.file_path),
+              message=intern(x.message),
+              expansion_locs=intern_expansion_locs(x.expansion_locs),
+          ) for x in diag.notes),
+  )
+
+
 def _parse_tidy_fixes_file(
     read_line_offsets: Callable[[str], _LineOffsetMap],
     stream: Any,
@@ -295,8 +338,8 @@ def _parse_tidy_fixes_file(
   assert os.path.isabs(tidy_invocation_dir)
 
   try:
-    findings = yaml_safe_load(stream)
-  except (yaml_parser.ParserError, yaml_reader.ReaderError) as v:
+    findings = yaml.load(stream, Loader=_YamlSafeLoader)
+  except yaml.YAMLError as v:
     raise _ParseError('Broken yaml: %s' % v) from v
 
   if findings is None:
@@ -322,10 +365,15 @@ def _parse_tidy_fixes_file(
 
   # Rarely (e.g., in the case of missing `#include`s, clang will emit relative
   # file paths for diagnostics. This fixes those.
+  #
+  # Paths, check names and messages are heavily duplicated across diagnostics,
+  # so they're all interned.
   def makeabs(file_path):
-    if not file_path or os.path.isabs(file_path):
+    if not file_path:
       return file_path
-    return os.path.abspath(os.path.join(tidy_invocation_dir, file_path))
+    if not os.path.isabs(file_path):
+      file_path = os.path.abspath(os.path.join(tidy_invocation_dir, file_path))
+    return sys.intern(file_path)
 
   try:
     for diag in findings['Diagnostics']:
@@ -370,7 +418,7 @@ def _parse_tidy_fixes_file(
         absolute_note_path = makeabs(note['FilePath'])
         note_offsets = get_line_offsets(absolute_note_path)
         line_number = note_offsets.get_line_number(note['FileOffset'])
-        note_message = note['Message']
+        note_message = sys.intern(note['Message'])
         if note_message.startswith('expanded from macro '):
           notes_builder.push_expansion_loc(
               _ExpandedFrom(
@@ -385,8 +433,8 @@ def _parse_tidy_fixes_file(
           )
 
       yield _TidyDiagnostic(
-          diag_name=diag['DiagnosticName'],
-          message=message['Message'],
+          diag_name=sys.intern(diag['DiagnosticName']),
+          message=sys.intern(message['Message']),
           file_path=absolute_file_path,
           line_number=line_offsets.get_line_number(message['FileOffset']),
           replacements=tuple(replacements),
@@ -645,13 +693,14 @@ def _parse_ninja_deps_output(input_stream: IO[str], cwd: str
     #
     # As one might infer, '(STALE)' is only printed if the deps are potentially
     # stale, and the files that `foo.o` depends on are printed with an indent
-    # under the first line.
+    # under the first line. Targets asked for explicitly that have no deps
+    # logged show up as `obj/foo.o: deps not found`.
     if not line[0].isspace():
       if current_target is not None:
         assert all_deps is not None
         yield current_target, all_deps
 
-      if line.endswith('(STALE)'):
+      if line.endswith('(STALE)') or line.endswith(': deps not found'):
         current_target = None
         all_deps = None
       else:
@@ -667,8 +716,11 @@ def _parse_ninja_deps_output(input_stream: IO[str], cwd: str
     yield current_target, all_deps
 
 
-def _parse_ninja_deps(out_dir: str
-                     ) -> Generator[Tuple[str, List[str]], None, None]:
+def _parse_ninja_deps(
+    out_dir: str,
+    targets: Optional[Iterable[str]] = None,
+    max_targets_per_invocation: int = 500,
+) -> Generator[Tuple[str, List[str]], None, None]:
   """Runs and parses the output of `ninja -t deps`.
 
   Yields successive tuples of (object_file, [file_it_depends_on]). Ignores any
@@ -676,8 +728,24 @@ def _parse_ninja_deps(out_dir: str
 
   `object_file`s are all relative to out_dir; all `file_it_depends_on`s are
   absolute.
+
+  If `targets` is not None, only deps of those are queried. This is far
+  cheaper than dumping the deps of every object in the build.
   """
-  command = ['ninja', '-t', 'deps']
+  if targets is None:
+    for val in _parse_ninja_deps_of(out_dir, []):
+      yield val
+    return
+
+  for chunk in _chunk_iterable(sorted(targets), max_targets_per_invocation):
+    for val in _parse_ninja_deps_of(out_dir, chunk):
+      yield val
+
+
+def _parse_ninja_deps_of(out_dir: str, targets: List[str]
+                        ) -> Generator[Tuple[str, List[str]], None, None]:
+  """Runs and parses `ninja -t deps` for `targets`, or for all if empty."""
+  command = ['ninja', '-t', 'deps'] + targets
   ninja = subprocess.Popen(
       command, cwd=out_dir, stdout=subprocess.PIPE, encoding='utf-8')
   try:
@@ -707,6 +775,9 @@ def _parse_ninja_deps(out_dir: str
 class _GnDesc:
   """Represents the output of `gn desc` in an efficiently-usable manner."""
 
+  # Bump this if the format of `to_index` changes.
+  _INDEX_VERSION = 1
+
   def __init__(self, per_target_srcs: Dict[str, List[str]],
                deps: Dict[str, List[str]]):
     self._per_target_srcs = per_target_srcs
@@ -715,13 +786,18 @@ class _GnDesc:
     for target, srcs in per_target_srcs.items():
       for src in srcs:
         targets_containing[src].append(target)
-    self._targets_containing = targets_containing
+    self._targets_containing = dict(targets_containing)
 
     direct_reverse_depends = collections.defaultdict(list)
     for target, depends_on in deps.items():
       for rev_dep in depends_on:
         direct_reverse_depends[rev_dep].append(target)
-    self._direct_reverse_depends = direct_reverse_depends
+    self._direct_reverse_depends = dict(direct_reverse_depends)
+
+    self._targets_with_cc_sources = {
+        target for target, srcs in per_target_srcs.items()
+        if any(x.endswith(_CC_FILE_EXTENSIONS) for x in srcs)
+    }
 
   def targets_containing(self, src_file: str) -> Iterable[str]:
     return self._targets_containing.get(src_file, ())
@@ -732,6 +808,31 @@ class _GnDesc:
   def targets_which_directly_depend_on(self, target: str) -> Iterable[str]:
     return self._direct_reverse_depends.get(target, ())
 
+  def has_cc_sources(self, target: str) -> bool:
+    return target in self._targets_with_cc_sources
+
+  def to_index(self) -> Dict[str, Any]:
+    """Returns all of the maps of this object, ready to be pickled."""
+    return {
+        'version': self._INDEX_VERSION,
+        'per_target_srcs': self._per_target_srcs,
+        'targets_containing': self._targets_containing,
+        'direct_reverse_depends': self._direct_reverse_depends,
+        'targets_with_cc_sources': self._targets_with_cc_sources,
+    }
+
+  @classmethod
+  def from_index(cls, index: Dict[str, Any]) -> Optional['_GnDesc']:
+    """Inverse of `to_index`. Returns None for indices of other versions."""
+    if index.get('version') != cls._INDEX_VERSION:
+      return None
+    gn_desc = cls.__new__(cls)
+    gn_desc._per_target_srcs = index['per_target_srcs']
+    gn_desc._targets_containing = index['targets_containing']
+    gn_desc._direct_reverse_depends = index['direct_reverse_depends']
+    gn_desc._targets_with_cc_sources = index['targets_with_cc_sources']
+    return gn_desc
+
 
 def _parse_gn_desc_output(full_desc: Dict[str, Any],
                           chromium_root: str) -> _GnDesc:
@@ -766,6 +867,73 @@ def _parse_gn_desc(out_dir: str, chromium_root: str, gn: str) -> _GnDesc:
   return _parse_gn_desc_output(full_desc, chromium_root)
 
 
+def _gn_gen_fingerprint(out_dir: str, chromium_root: str,
+                        gn: str) -> Optional[str]:
+  """Fingerprints gn and everything `gn gen` read to generate out_dir.
+
+  gn lists all of the files it read in build.ninja.d, so together with the gn
+  binary itself, these determine the output of `gn desc`. Returns None if gn
+  can't be found or build.ninja.d can't be read.
+  """
+  gn_path = shutil.which(gn)
+  if not gn_path:
+    return None
+  try:
+    with open(os.path.join(out_dir, 'build.ninja.d'), encoding='utf-8') as f:
+      _, inputs = f.read().split(':', 1)
+  except (OSError, ValueError):
+    return None
+
+  digest = hashlib.sha256()
+  digest.update(chromium_root.encode('utf-8'))
+  for path in [os.path.abspath(gn_path), 'args.gn'] + inputs.split():
+    try:
+      st = os.stat(os.path.join(out_dir, path))
+      digest.update(('\0%s\0%d\0%d' % (path, st.st_mtime_ns,
+                                         st.st_size)).encode('utf-8'))
+    except OSError:
+      digest.update(('\0%s\0missing' % path).encode('utf-8'))
+  return digest.hexdigest()
+
+
+def _load_gn_desc(out_dir: str, chromium_root: str, gn: str,
+                  index_path: Optional[str]) -> _GnDesc:
+  """Returns the _GnDesc of out_dir, reusing the one at index_path if current.
+
+  `gn desc` dumps GBs of JSON for Chromium. If `index_path` is given, the
+  resulting _GnDesc is persisted there along with a fingerprint of gn's
+  inputs, and reused as long as none of them changed.
+  """
+  if not index_path:
+    return _parse_gn_desc(out_dir, chromium_root, gn)
+
+  fingerprint = _gn_gen_fingerprint(out_dir, chromium_root, gn)
+  if fingerprint is not None:
+    try:
+      with open(index_path, 'rb') as f:
+        index = pickle.load(f)
+      if index['fingerprint'] == fingerprint:
+        gn_desc = _GnDesc.from_index(index['gn_desc'])
+        if gn_desc is not None:
+          logging.info('Reusing gn desc index at %s', index_path)
+          return gn_desc
+    except FileNotFoundError:
+      pass
+    except Exception:  # pylint: disable=broad-except
+      logging.exception('Ignoring broken gn desc index at %s', index_path)
+
+  gn_desc = _parse_gn_desc(out_dir, chromium_root, gn)
+  if fingerprint is not None:
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+      pickle.dump({
+          'fingerprint': fingerprint,
+          'gn_desc': gn_desc.to_index(),
+      }, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, index_path)
+  return gn_desc
+
+
 def _buildable_src_files_for(src_file: str,
                              cc_to_target_map: Dict[str, List[str]],
                              gn_desc: _GnDesc) -> List[str]:
@@ -855,8 +1023,7 @@ def _reverse_dependencies_with_cc_sources(base_target: str,
       continue
     seen.add(target)
 
-    src_files = gn_desc.source_files_for_target(target)
-    if any(x.endswith(e) for x in src_files for e in _CC_FILE_EXTENSIONS):
+    if gn_desc.has_cc_sources(target):
       result.add(target)
       continue
 
@@ -935,7 +1102,8 @@ def _determine_rdeps_to_build_for(
 
 
 def _perform_build(out_dir: str, run_ninja: Any, parse_ninja_deps: Callable[
-    [str], Generator[Tuple[str, List[str]], None, None]],
+    [str, Optional[Iterable[str]]], Generator[Tuple[str, List[str]], None,
+                                              None]],
                    cc_to_target_map: Dict[str, List[str]], gn_desc: _GnDesc,
                    potential_src_cc_file_deps: Dict[str, List[str]]
                   ) -> Tuple[Dict[str, List[str]], List[str]]:
@@ -949,7 +1117,8 @@ def _perform_build(out_dir: str, run_ninja: Any, parse_ninja_deps: Callable[
         object_targets: a list of file-backed ninja targets to build.
       Builds them all, returns a best-effort subset of `object_targets` that
       failed.
-    parse_ninja_deps: given an out_dir, yields non-stale ninja deps.
+    parse_ninja_deps: given an out_dir and targets to limit the output to (or
+      None for all of them), yields non-stale ninja deps.
     cc_to_target_map: a mapping of cc_files -> [targets_built_by_it].
     potential_src_cc_file_deps: A mapping of
       {src_files_to_generate_build_artifacts_for:
@@ -968,7 +1137,7 @@ def _perform_build(out_dir: str, run_ninja: Any, parse_ninja_deps: Callable[
   def parse_deps(only_targets, interesting_src_files):
     logging.info('Parsing deps...')
     src_file_to_target_map = collections.defaultdict(set)
-    for target, src_files in parse_ninja_deps(out_dir):
+    for target, src_files in parse_ninja_deps(out_dir, only_targets):
       if only_targets is not None and target not in only_targets:
         continue
 
@@ -1062,7 +1231,7 @@ def _generate_tidy_actions(
     out_dir: str,
     only_src_files: Optional[List[str]],
     run_ninja: Any,
-    parse_ninja_deps: Callable[[str],
+    parse_ninja_deps: Callable[[str, Optional[Iterable[str]]],
                                Generator[Tuple[str, List[str]], None, None]],
     gn_desc: _GnDesc,
     compile_commands: List[_CompileCommand],
@@ -1075,8 +1244,8 @@ def _generate_tidy_actions(
       passed in every C/C++ file in compile_commands, ignoring generated
       targets.
     run_ninja: forwarded to _perform_build; please see comments there.
-    parse_ninja_deps: a function that, given an out_dir, yields non-stale ninja
-      deps.
+    parse_ninja_deps: a function that, given an out_dir and targets to limit
+      the output to (or None for all of them), yields non-stale ninja deps.
     gn_desc: a _GnDesc object describing our world.
     compile_commands: a list of `_CompileCommand`s.
     max_tidy_actions_per_file: the maximum number of `_TidyAction`s to emit
@@ -1160,6 +1329,206 @@ def _generate_tidy_actions(
   return actions, sorted(x for x in actions if x.target in failed_targets)
 
 
+def _diagnostic_from_json_obj(obj: Dict[str, Any]) -> _TidyDiagnostic:
+  """Inverse of `dataclasses.asdict` for _TidyDiagnostics."""
+
+  def expansion_locs(locs):
+    return tuple(_ExpandedFrom(**x) for x in locs)
+
+  return _TidyDiagnostic(
+      file_path=obj['file_path'],
+      line_number=obj['line_number'],
+      diag_name=obj['diag_name'],
+      message=obj['message'],
+      replacements=tuple(_TidyReplacement(**x) for x in obj['replacements']),
+      expansion_locs=expansion_locs(obj['expansion_locs']),
+      notes=tuple(
+          _TidyNote(
+              file_path=x['file_path'],
+              line_number=x['line_number'],
+              message=x['message'],
+              expansion_locs=expansion_locs(x['expansion_locs']),
+          ) for x in obj['notes']),
+  )
+
+
+class _TidyResultCache:
+  """An on-disk cache of clang-tidy results, keyed by TU fingerprint.
+
+  A TU's fingerprint covers everything that can change what clang-tidy says
+  about it: the clang-tidy binary, the checks, the compile flags, and the
+  contents of the cc_file, of every file it depends on according to ninja,
+  and of the .clang-tidy files above it. Results of TUs without known deps
+  are never cached.
+
+  Entries are JSON files in `cache_dir`, and are evicted least recently used
+  first once they take more than `max_bytes`.
+  """
+
+  # Bump this if the format of entries or fingerprints changes.
+  _VERSION = 1
+
+  def __init__(self, cache_dir: str, max_bytes: int, clang_tidy_binary: str,
+               clang_tidy_checks: Optional[str],
+               deps: Dict[str, List[str]]):
+    """Initializes the cache.
+
+    Args:
+      cache_dir: the directory to store entries in.
+      max_bytes: the size entries are trimmed to by `evict`.
+      clang_tidy_binary: the path to clang-tidy.
+      clang_tidy_checks: the checks passed to clang-tidy, if any.
+      deps: a map of {object_file: [absolute_paths_it_depends_on]}, as
+        reported by ninja.
+    """
+    self._cache_dir = cache_dir
+    self._max_bytes = max_bytes
+    self._deps = deps
+    self._file_hashes: Dict[str, Optional[str]] = {}
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+    self.uncacheable = 0
+
+    os.makedirs(cache_dir, exist_ok=True)
+    self._base_fingerprint = hashlib.sha256(
+        json.dumps([
+            self._VERSION,
+            self._hash_file(clang_tidy_binary),
+            clang_tidy_checks,
+        ]).encode('utf-8')).hexdigest()
+
+  def _hash_file(self, path: str) -> Optional[str]:
+    """Returns the sha256 of a file, or None if it can't be read."""
+    with self._lock:
+      if path in self._file_hashes:
+        return self._file_hashes[path]
+
+    digest = hashlib.sha256()
+    try:
+      with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+          digest.update(chunk)
+      result: Optional[str] = digest.hexdigest()
+    except OSError:
+      result = None
+
+    with self._lock:
+      self._file_hashes[path] = result
+    return result
+
+  @staticmethod
+  def _clang_tidy_configs(cc_file: str) -> List[str]:
+    """Returns the paths of all .clang-tidy files that may apply to cc_file."""
+    configs = []
+    directory = os.path.dirname(cc_file)
+    while True:
+      config = os.path.join(directory, '.clang-tidy')
+      if os.path.isfile(config):
+        configs.append(config)
+      parent = os.path.dirname(directory)
+      if parent == directory:
+        return configs
+      directory = parent
+
+  def fingerprint(self, action: _TidyAction) -> Optional[str]:
+    """Returns the cache key for `action`, or None if it's not cacheable."""
+    deps = self._deps.get(action.target)
+    if deps is None:
+      return None
+
+    cc_file = os.path.abspath(os.path.join(action.in_dir, action.cc_file))
+    files = sorted(
+        set([cc_file] + [os.path.abspath(x) for x in deps] +
+            self._clang_tidy_configs(cc_file)))
+    file_hashes = []
+    for path in files:
+      file_hash = self._hash_file(path)
+      # Deleted files mean that the deps are out of date.
+      if file_hash is None:
+        return None
+      file_hashes.append((path, file_hash))
+
+    flags = _trim_rewrapper_command(shlex.split(action.flags))
+    return hashlib.sha256(
+        json.dumps([
+            self._base_fingerprint,
+            action.in_dir,
+            action.cc_file,
+            flags,
+            action.flags_use_cl_driver_mode,
+            file_hashes,
+        ]).encode('utf-8')).hexdigest()
+
+  def _entry_path(self, key: str) -> str:
+    return os.path.join(self._cache_dir, key + '.json')
+
+  def load(
+      self, key: str
+  ) -> Optional[Tuple[Optional[int], str, List[_TidyDiagnostic]]]:
+    """Returns the cached result for `key`, or None on a cache miss."""
+    entry_path = self._entry_path(key)
+    try:
+      with open(entry_path, encoding='utf-8') as f:
+        entry = json.load(f)
+      findings = [
+          _intern_diagnostic(_diagnostic_from_json_obj(x))
+          for x in entry['findings']
+      ]
+      result = entry['exit_code'], entry['stdout'], findings
+    except FileNotFoundError:
+      return None
+    except (ValueError, KeyError, TypeError):
+      logging.warning('Ignoring corrupt clang-tidy cache entry %s', entry_path)
+      return None
+
+    # Mark the entry as recently used.
+    try:
+      os.utime(entry_path)
+    except OSError:
+      pass
+    return result
+
+  def store(self, key: str, exit_code: int, stdout: str,
+            findings: Iterable[_TidyDiagnostic]):
+    """Stores the result of a clang-tidy invocation which didn't time out."""
+    entry_path = self._entry_path(key)
+    tmp_path = '%s.%d.tmp' % (entry_path, os.getpid())
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+      json.dump({
+          'exit_code': exit_code,
+          'stdout': stdout,
+          'findings': [dataclasses.asdict(x) for x in findings],
+      }, f)
+    os.replace(tmp_path, entry_path)
+
+  def evict(self):
+    """Removes the least recently used entries beyond `max_bytes`."""
+    entries = []
+    with os.scandir(self._cache_dir) as it:
+      for entry in it:
+        if entry.name.endswith('.json') and entry.is_file():
+          st = entry.stat()
+          entries.append((st.st_mtime, st.st_size, entry.path))
+
+    total_bytes = sum(size for _, size, _ in entries)
+    entries.sort(reverse=True)
+    while total_bytes > self._max_bytes and entries:
+      _, size, path = entries.pop()
+      try:
+        os.unlink(path)
+      except FileNotFoundError:
+        pass
+      total_bytes -= size
+
+  def stats(self) -> Dict[str, int]:
+    return {
+        'hits': self.hits,
+        'misses': self.misses,
+        'uncacheable': self.uncacheable,
+    }
+
+
 def _run_one_tidy_action(args):
   """Runs a single tidy action in a thread or process pool."""
   run_tidy_action, clang_tidy_binary, clang_tidy_checks, action = args
@@ -1174,6 +1543,7 @@ def _run_all_tidy_actions(
     clang_tidy_binary: str,
     clang_tidy_checks: Optional[str],
     use_threads: bool,
+    cache: Optional[_TidyResultCache] = None,
 ) -> Tuple[Set[_TidyAction], Set[_TidyAction], Set[_TidyDiagnostic]]:
   """Runs a series of tidy actions, returning the status of all of that.
 
@@ -1193,12 +1563,39 @@ def _run_all_tidy_actions(
       otherwise.
     use_cl_driver_mode: if True, we'll instruct clang-tidy to parse compiler
       flags with cl (windows) compatibility.
+    cache: if not None, results are replayed from this cache where possible,
+      and results of clang-tidy invocations that didn't time out are stored in
+      it.
 
   Returns:
     - A set of _TidyActions where tidy died with a non-zero exit code.
     - A set of _TidyActions that tidy timed out on.
     - A set of all diags emitted by tidy throughout the run.
   """
+  cached_results = []
+  cache_keys = {}
+  actions_to_run = []
+  for action in tidy_actions:
+    key = cache.fingerprint(action) if cache else None
+    if key is None:
+      if cache:
+        cache.uncacheable += 1
+      actions_to_run.append(action)
+      continue
+
+    cached_result = cache.load(key)
+    if cached_result is None:
+      cache.misses += 1
+      cache_keys[action] = key
+      actions_to_run.append(action)
+    else:
+      cache.hits += 1
+      cached_results.append((action, cached_result))
+
+  if cache:
+    logging.info('Replaying clang-tidy results for %d/%d actions from cache',
+                 len(cached_results), len(tidy_actions))
+
   # Threads make sharing for testing _way_ easier. Unfortunately, YAML parsing
   # is expensive, and the GIL starts blocking us from spawning new clang-tidies
   # once parallelism is high enough (-j25-ish).
@@ -1210,13 +1607,13 @@ def _run_all_tidy_actions(
   results = pool.imap_unordered(
       _run_one_tidy_action,
       ((run_tidy_action, clang_tidy_binary, clang_tidy_checks, action)
-       for action in tidy_actions))
+       for action in actions_to_run))
   pool.close()
 
   all_findings = set()
   timed_out_actions = set()
   failed_actions = set()
-  for action, invocation_result in results:
+  for action, invocation_result in itertools.chain(cached_results, results):
     src_file, flags = action.cc_file, action.flags
     if not invocation_result:
       # Assume that we logged the exception from another thread.
@@ -1232,14 +1629,19 @@ def _run_all_tidy_actions(
       timed_out_actions.add(action)
       continue
 
+    if action in cache_keys:
+      cache.store(cache_keys[action], exit_code, stdout, findings)
+
     if exit_code:
       logging.error(
           'Clang-tidy on %r with flags %r exited with '
           'code %d; stdout/stderr: %r', src_file, flags, exit_code, stdout)
       failed_actions.add(action)
 
-    # (If memory use becomes important, there's _a ton_ of duplicated
-    # strings in these. Would probably be pretty trivial to intern them.)
+    # There's _a ton_ of duplicated strings in these. They're interned while
+    # parsing, but that doesn't survive being sent back from another process.
+    if not use_threads:
+      findings = [_intern_diagnostic(x) for x in findings]
     all_findings.update(findings)
 
   pool.join()
@@ -1517,6 +1919,21 @@ def main():
       action='store_true',
       help='Enable clang-cl-compatibility mode. When this is specified, this '
       'script will expect compile_commands to use clang-cl arguments.')
+  parser.add_argument(
+      '--gn_desc_index',
+      help='File to persist the parsed output of `gn desc` in. It is reused '
+      'as long as none of the files gn read to generate out_dir changed.')
+  parser.add_argument(
+      '--tidy_cache_dir',
+      help='Directory to cache clang-tidy results in across runs. Results '
+      'are only reused for TUs whose compile flags and dependencies are '
+      'unchanged.')
+  parser.add_argument(
+      '--tidy_cache_max_bytes',
+      type=int,
+      default=2 * 1024 * 1024 * 1024,
+      help='Size that the clang-tidy cache is trimmed to after each run, '
+      'evicting least recently used results first.')
   args = parser.parse_args()
 
   _init_logging(args.debug)
@@ -1564,7 +1981,7 @@ def main():
         only_src_files,
         run_ninja,
         _parse_ninja_deps,
-        gn_desc=_parse_gn_desc(out_dir, base_path, gn),
+        gn_desc=_load_gn_desc(out_dir, base_path, gn, args.gn_desc_index),
         compile_commands=list(_parse_compile_commands(f, clang_cl=is_windows)))
 
   if logging.getLogger().isEnabledFor(logging.DEBUG):
@@ -1579,18 +1996,34 @@ def main():
   # it could be as simple as a clang -Werror diag being tripped, or clang-tidy
   # crashing on the given file outright. Teasing things like these apart so
   # they can be surfaced to the user is likely valuable.
+  cache = None
+  if args.tidy_cache_dir:
+    tidy_targets = {x.target for x in tidy_actions}
+    cache = _TidyResultCache(
+        os.path.abspath(args.tidy_cache_dir),
+        args.tidy_cache_max_bytes,
+        clang_tidy_binary,
+        args.tidy_checks,
+        deps=dict(_parse_ninja_deps(out_dir, tidy_targets)))
+
   failed_tidy_actions, timed_out_actions, findings = _run_all_tidy_actions(
       tidy_actions,
       _run_tidy_action,
       args.tidy_jobs,
       clang_tidy_binary,
       args.tidy_checks,
-      use_threads=False)
+      use_threads=False,
+      cache=cache)
 
   results = _convert_tidy_output_json_obj(base_path, tidy_actions,
                                           failed_actions, failed_tidy_actions,
                                           timed_out_actions, findings,
                                           only_src_files)
+  if cache:
+    cache.evict()
+    logging.info('clang-tidy cache stats: %s', cache.stats())
+    # Hit/miss counts of the clang-tidy result cache.
+    results['tidy_cache_stats'] = cache.stats()
 
   # Do a two-step write, so the user can't see partial results.
   tempfile_name = findings_file + '.new'
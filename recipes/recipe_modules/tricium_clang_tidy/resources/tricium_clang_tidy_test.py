@@ -18,8 +18,11 @@ import io
 import json
 import logging
 import os
+import shutil
 import sys
+import tempfile
 import unittest
+from unittest import mock
 
 import tricium_clang_tidy_script as tidy
 
@@ -262,6 +265,45 @@ class Tests(unittest.TestCase):
         _parse_fixes_file_text(input_file, diag_yaml, tidy_invocation_dir),
         tidy_diags)
 
+  def test_fix_parsing_interns_strings(self):
+    # Build the strings at runtime so that they aren't constants that Python
+    # interns anyway.
+    name = ''.join(['-W', 'whee'])
+    tidy_diags = [
+        _build_tidy_diagnostic(
+            file_path='/foo.cc',
+            line_number=1,
+            diag_name=name,
+            message=''.join(['wh', 'ee'])) for _ in range(2)
+    ]
+    diags = _parse_fixes_file_text(
+        tidy._LineOffsetMap.for_text('whee\n'),
+        _convert_tidy_diags_to_yaml(tidy_diags))
+    self.assertEqual(len(diags), 2)
+    self.assertIs(diags[0].file_path, diags[1].file_path)
+    self.assertIs(diags[0].diag_name, diags[1].diag_name)
+    self.assertIs(diags[0].message, diags[1].message)
+
+    diag = _build_tidy_diagnostic(
+        file_path=''.join(['/foo', '.cc']),
+        line_number=1,
+        diag_name=name,
+        message='whee',
+        expansion_locs=(tidy._ExpandedFrom(
+            file_path=''.join(['/foo', '.h']), line_number=1),),
+        notes=(tidy._TidyNote(
+            file_path=''.join(['/foo', '.h']),
+            line_number=1,
+            message=''.join(['no', 'te']),
+            expansion_locs=()),),
+    )
+    interned = tidy._intern_diagnostic(diag)
+    self.assertEqual(interned, diag)
+    self.assertIs(interned.file_path, sys.intern('/foo.cc'))
+    self.assertIs(interned.expansion_locs[0].file_path, sys.intern('/foo.h'))
+    self.assertIs(interned.notes[0].file_path, sys.intern('/foo.h'))
+    self.assertIs(interned.notes[0].message, sys.intern('note'))
+
   def test_expansion_locs_are_parsed_from_notes(self):
     yaml = '\n'.join([
         'MainSourceFile:  "/tmp/x.c"',
@@ -464,7 +506,7 @@ class Tests(unittest.TestCase):
   def test_generate_tidy_actions_only_generates_up_to_n_actions_per_src(self):
     self._silence_logs()
 
-    def parse_ninja_deps(_):
+    def parse_ninja_deps(_out_dir, _targets):
       return [
           ('foo.o', ['/foo.h', '/foo.cc']),
           ('bar.o', ['/foo.h', '/bar.cc']),
@@ -566,7 +608,7 @@ class Tests(unittest.TestCase):
         only_src_files=['/foo.cc', '/bar.cc'],
         run_ninja=run_ninja,
         gn_desc=tidy._GnDesc({}, {}),
-        parse_ninja_deps=lambda _: (),
+        parse_ninja_deps=lambda _out_dir, _targets: (),
         compile_commands=compile_commands)
     self.assertEqual(failed, [])
     self.assertEqual(
@@ -614,7 +656,7 @@ class Tests(unittest.TestCase):
         ),
     ]
 
-    def parse_ninja_deps(_):
+    def parse_ninja_deps(_out_dir, _targets):
       return [
           ('foo.o', ['/foo.h', '/foo.cc']),
           ('bar.o', ['/bar.cc']),
@@ -661,7 +703,7 @@ class Tests(unittest.TestCase):
         only_src_files=['/foo.cc', '/bar.cc'],
         run_ninja=run_ninja,
         gn_desc=tidy._GnDesc({}, {}),
-        parse_ninja_deps=lambda _: (),
+        parse_ninja_deps=lambda _out_dir, _targets: (),
         compile_commands=[
             tidy._CompileCommand(
                 target_name='foo.cc.o',
@@ -696,7 +738,7 @@ class Tests(unittest.TestCase):
         out_dir='/out',
         only_src_files=None,
         run_ninja=run_ninja,
-        parse_ninja_deps=lambda _: (),
+        parse_ninja_deps=lambda _out_dir, _targets: (),
         gn_desc=tidy._GnDesc({}, {}),
         compile_commands=[
             tidy._CompileCommand(
@@ -731,7 +773,7 @@ class Tests(unittest.TestCase):
         out_dir='/out',
         only_src_files=None,
         run_ninja=run_ninja,
-        parse_ninja_deps=lambda _: (),
+        parse_ninja_deps=lambda _out_dir, _targets: (),
         gn_desc=tidy._GnDesc({}, {}),
         compile_commands={
             tidy._CompileCommand(
@@ -807,6 +849,103 @@ class Tests(unittest.TestCase):
     self.assertEqual(timed_out_cc_files, {timeout_action})
     self.assertEqual(findings, {good_diag, bad_diag})
 
+  def test_run_all_tidy_actions_replays_cached_results(self):
+    self._silence_logs()
+
+    temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, temp_dir)
+
+    def write_file(name, contents):
+      path = os.path.join(temp_dir, name)
+      with open(path, 'w', encoding='utf-8') as f:
+        f.write(contents)
+      return path
+
+    binary = write_file('clang-tidy', 'tidy')
+    cc_file = write_file('foo.cc', '#include "foo.h"')
+    header = write_file('foo.h', 'int x;')
+    write_file('.clang-tidy', 'Checks: "*"')
+    good_action = tidy._TidyAction(
+        cc_file=cc_file,
+        target='foo.o',
+        in_dir=temp_dir,
+        flags='clang++ -c foo.cc -o foo.o',
+        flags_use_cl_driver_mode=False,
+    )
+    fail_action = good_action._replace(target='fail.o', flags='clang++ -Werror')
+    no_deps_action = good_action._replace(target='no_deps.o')
+    actions = [good_action, fail_action, no_deps_action]
+
+    diag = _build_tidy_diagnostic(
+        file_path=header,
+        line_number=1,
+        diag_name='-Whee',
+        message='whee',
+        replacements=(tidy._TidyReplacement(
+            new_text='y',
+            start_line=1,
+            end_line=1,
+            start_char=4,
+            end_char=5,
+        ),),
+        expansion_locs=(tidy._ExpandedFrom(file_path=header, line_number=1),),
+        notes=(tidy._TidyNote(
+            file_path=cc_file,
+            line_number=1,
+            message='note',
+            expansion_locs=(tidy._ExpandedFrom(
+                file_path=header, line_number=1),),
+        ),),
+    )
+    ran = []
+
+    def runner(_binary, _checks, action):
+      ran.append(action.target)
+      if action.target == 'fail.o':
+        return 1, 'oh no', []
+      return 0, '', [diag]
+
+    def run_all(max_bytes=1024 * 1024):
+      cache = tidy._TidyResultCache(
+          os.path.join(temp_dir, 'cache'),
+          max_bytes,
+          binary,
+          '*',
+          deps={
+              'foo.o': [cc_file, header],
+              'fail.o': [cc_file],
+          })
+      ran.clear()
+      results = tidy._run_all_tidy_actions(
+          actions,
+          runner,
+          tidy_jobs=1,
+          clang_tidy_binary=binary,
+          clang_tidy_checks='*',
+          use_threads=True,
+          cache=cache)
+      self.assertEqual(results, ({fail_action}, set(), {diag}))
+      return cache
+
+    cache = run_all()
+    self.assertEqual(sorted(ran), ['fail.o', 'foo.o', 'no_deps.o'])
+    self.assertEqual(cache.stats(), {'hits': 0, 'misses': 2, 'uncacheable': 1})
+
+    cache = run_all()
+    self.assertEqual(ran, ['no_deps.o'])
+    self.assertEqual(cache.stats(), {'hits': 2, 'misses': 0, 'uncacheable': 1})
+
+    write_file('foo.h', 'int y;')
+    cache = run_all()
+    self.assertEqual(sorted(ran), ['foo.o', 'no_deps.o'])
+    self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'uncacheable': 1})
+
+    write_file('.clang-tidy', 'Checks: "-*"')
+    cache = run_all(max_bytes=0)
+    self.assertEqual(sorted(ran), ['fail.o', 'foo.o', 'no_deps.o'])
+    cache.evict()
+    self.assertEqual(os.listdir(os.path.join(temp_dir, 'cache')), [])
+
   def test_line_offset_map_handles_no_text_gracefully(self):
     no_text = tidy._LineOffsetMap.for_text('')
     self.assertEqual(no_text.get_line_number(0), 1)
@@ -1191,6 +1330,92 @@ class Tests(unittest.TestCase):
         ]),
     ])
 
+  def test_ninja_deps_parsing_filters_targets_without_deps(self):
+    test_input = '\n'.join([
+        'obj/foo.o: deps not found',
+        'obj/bar.o: #deps 1, deps mtime 1579507293554707399 (VALID)',
+        '    ../../base/bar_unittest.cc',
+    ])
+
+    output = list(
+        tidy._parse_ninja_deps_output(_to_stringio(test_input), u'/in/dir'))
+    self.assertEqual(output, [
+        ('obj/bar.o', ['/in/dir/../../base/bar_unittest.cc']),
+    ])
+
+  def test_ninja_deps_are_only_queried_for_given_targets(self):
+    queried = []
+
+    def parse_ninja_deps_of(out_dir, targets):
+      self.assertEqual(out_dir, '/out')
+      queried.append(targets)
+      return [(x, ['/' + x]) for x in targets]
+
+    with mock.patch.object(tidy, '_parse_ninja_deps_of', parse_ninja_deps_of):
+      output = list(
+          tidy._parse_ninja_deps(
+              '/out', {'c.o', 'a.o', 'b.o'}, max_targets_per_invocation=2))
+      self.assertEqual(queried, [['a.o', 'b.o'], ['c.o']])
+      self.assertEqual(output, [('a.o', ['/a.o']), ('b.o', ['/b.o']),
+                                ('c.o', ['/c.o'])])
+
+      queried.clear()
+      list(tidy._parse_ninja_deps('/out'))
+      self.assertEqual(queried, [[]])
+
+  def test_gn_desc_index_is_reused_until_gn_inputs_change(self):
+    out_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, out_dir)
+
+    def write_file(name, contents):
+      with open(os.path.join(out_dir, name), 'w', encoding='utf-8') as f:
+        f.write(contents)
+
+    write_file('args.gn', 'is_debug = false')
+    write_file('BUILD.gn', 'group("foo") {}')
+    write_file('build.ninja.d', 'build.ninja: BUILD.gn')
+    write_file('gn', '#!/bin/sh')
+    gn = os.path.join(out_dir, 'gn')
+    os.chmod(gn, 0o755)
+    index_path = os.path.join(out_dir, 'gn_desc_index')
+    parsed = []
+
+    def parse_gn_desc(_out_dir, chromium_root, _gn):
+      parsed.append(chromium_root)
+      return tidy._GnDesc(
+          per_target_srcs={
+              '//:a': ['/root/a.cc'],
+              '//:b': ['/root/b.h'],
+          },
+          deps={'//:a': ['//:b']})
+
+    with mock.patch.object(tidy, '_parse_gn_desc', parse_gn_desc):
+      for _ in range(2):
+        gn_desc = tidy._load_gn_desc(out_dir, '/root', gn, index_path)
+        self.assertEqual(parsed, ['/root'])
+        self.assertEqual(list(gn_desc.targets_containing('/root/b.h')), ['//:b'])
+        self.assertEqual(
+            list(gn_desc.targets_which_directly_depend_on('//:b')), ['//:a'])
+        self.assertTrue(gn_desc.has_cc_sources('//:a'))
+        self.assertFalse(gn_desc.has_cc_sources('//:b'))
+
+      write_file('BUILD.gn', 'group("foobar") {}')
+      tidy._load_gn_desc(out_dir, '/root', gn, index_path)
+      self.assertEqual(parsed, ['/root', '/root'])
+
+      tidy._load_gn_desc(out_dir, '/other_root', gn, index_path)
+      self.assertEqual(parsed, ['/root', '/root', '/other_root'])
+
+      # A different gn may generate different output from the same inputs.
+      write_file('gn', '#!/bin/sh\n# Rolled.')
+      tidy._load_gn_desc(out_dir, '/other_root', gn, index_path)
+      self.assertEqual(parsed, ['/root', '/root', '/other_root', '/other_root'])
+
+      # Without build.ninja.d, nothing can be reused.
+      os.unlink(os.path.join(out_dir, 'build.ninja.d'))
+      tidy._load_gn_desc(out_dir, '/other_root', gn, index_path)
+      self.assertEqual(len(parsed), 5)
+
   def test_gn_desc_parsing_makes_only_file_paths_relative_to_root(self):
     gn_desc = {
         '//my_awesome:target': {
@@ -1268,7 +1493,7 @@ class Tests(unittest.TestCase):
     tidy._perform_build(
         out_dir='/out',
         run_ninja=run_ninja,
-        parse_ninja_deps=lambda _: [('foo.o', ['/foo.cc', '/foo.h'])],
+        parse_ninja_deps=lambda _out_dir, _targets: [('foo.o', ['/foo.cc', '/foo.h'])],
         cc_to_target_map=cc_to_target_map,
         gn_desc=tidy._GnDesc(
             per_target_srcs={
@@ -1298,7 +1523,7 @@ class Tests(unittest.TestCase):
     tidy._perform_build(
         out_dir='/out',
         run_ninja=run_ninja,
-        parse_ninja_deps=lambda _: [('foo.o', ['/foo.cc'])],
+        parse_ninja_deps=lambda _out_dir, _targets: [('foo.o', ['/foo.cc'])],
         cc_to_target_map=cc_to_target_map,
         gn_desc=tidy._GnDesc(
             per_target_srcs={
@@ -1326,7 +1551,7 @@ class Tests(unittest.TestCase):
     src_file_to_target_map, _ = tidy._perform_build(
         out_dir='/out',
         run_ninja=lambda out_dir, object_targets: (),
-        parse_ninja_deps=lambda _: [
+        parse_ninja_deps=lambda _out_dir, _targets: [
             ('foo.o', ['/foo.cc', '/foo.h']),
             ('bar.o', ['/bar.cc', '/foo.h']),
             ('baz.o', ['/baz.cc']),
@@ -1369,7 +1594,7 @@ class Tests(unittest.TestCase):
     tidy._perform_build(
         out_dir='/out',
         run_ninja=run_ninja,
-        parse_ninja_deps=lambda _: [('foo.o', ['/foo.cc'])],
+        parse_ninja_deps=lambda _out_dir, _targets: [('foo.o', ['/foo.cc'])],
         cc_to_target_map=cc_to_target_map,
         gn_desc=tidy._GnDesc(
             per_target_srcs={
@@ -1408,7 +1633,7 @@ class Tests(unittest.TestCase):
   def test_generate_tidy_actions_copes_with_unknown_objects(self):
     self._silence_logs()
 
-    def parse_ninja_deps(_):
+    def parse_ninja_deps(_out_dir, _targets):
       # foo_pnacl.o not being present in `compile_commands` broke us before;
       # crbug.com/1067271
       return [
@@ -4,6 +4,9 @@
 # found in the LICENSE file.
 
 from __future__ import print_function
+import concurrent.futures
+import heapq
+import itertools
 import json
 import optparse
 import os
@@ -24,6 +27,9 @@ It can happen in following cases:
 Please examine logs to figure out what happened.
 """
 
+# Maximum number of sancov merger processes running concurrently.
+MAX_CONCURRENT_COVERAGE_MERGES = 8
+
 
 class BadShards:
 
@@ -48,29 +54,72 @@ class BadShards:
 
 
 class AggregatedResults:
+  """Aggregates the JSON test output of shards.
+
+  Only the |slow_tests_cutoff| slowest tests are kept in a min-heap. If
+  |output| is given, results are written as JSON to this binary file as soon as
+  they are appended instead of being held in memory. The output is completed by
+  write_json.
+  """
 
-  def __init__(self, slow_tests_cutoff):
-    self.slowest_tests = []
+  def __init__(self, slow_tests_cutoff, output=None):
+    self._slowest_tests = []
+    self._slowest_tests_order = itertools.count()
     self.results = []
     self.test_total = 0
     self.slow_tests_cutoff = slow_tests_cutoff
+    self.output = output
+    if output is not None:
+      output.write(b'{"results":[')
+    self._results_written = 0
+
+  @property
+  def slowest_tests(self):
+    return [t for _, _, t in sorted(self._slowest_tests, reverse=True)]
+
+  def _add_slow_test(self, test):
+    # Ties are broken in favor of tests appended earlier, like a stable sort.
+    entry = (test['duration'], -next(self._slowest_tests_order), test)
+    if len(self._slowest_tests) < self.slow_tests_cutoff:
+      heapq.heappush(self._slowest_tests, entry)
+    elif self._slowest_tests and entry > self._slowest_tests[0]:
+      heapq.heapreplace(self._slowest_tests, entry)
+
+  def _write_results(self, results):
+    for result in results:
+      if self._results_written:
+        self.output.write(b',')
+      self.output.write(
+          json.dumps(result, separators=(',', ':')).encode('utf-8'))
+      self._results_written += 1
 
   def append(self, json_data):
     assert isinstance(json_data, dict)
-    self.slowest_tests.extend(json_data['slowest_tests'])
-    self.results.extend(json_data['results'])
+    for test in json_data['slowest_tests']:
+      self._add_slow_test(test)
+    if self.output is None:
+      self.results.extend(json_data['results'])
+    else:
+      self._write_results(json_data['results'])
     self.test_total += json_data['test_total']
 
   def as_json(self, tags):
-    sorted_tests = sorted(
-        self.slowest_tests, key=lambda t: t['duration'], reverse=True)
     return {
-        'slowest_tests': sorted_tests[:self.slow_tests_cutoff],
+        'slowest_tests': self.slowest_tests,
         'results': self.results,
         'tags': sorted(tags),
         'test_total': self.test_total,
     }
 
+  def write_json(self, tags):
+    """Completes the JSON written to |output| with all remaining fields."""
+    remaining = self.as_json(tags)
+    del remaining['results']
+    self.output.write(b'],')
+    # Strip the opening brace, it's already written before the results.
+    self.output.write(
+        json.dumps(remaining, separators=(',', ':')).encode('utf-8')[1:])
+
 
 class TaskCollector:
 
@@ -95,10 +144,11 @@ class TaskCollector:
       return None
 
 
-  def merge_shard_results(self, output_dir, shards, options):
+  def merge_shard_results(self, output_dir, shards, options, output=None):
     """Reads JSON test output from all shards and combines them into one.
 
-    Also merges sancov coverage data if coverage_dir is spefied.
+    If |output| is given, the merged test output is written to this binary file
+    instead, shard by shard, and None is returned.
 
     Returns dict with merged test output on success or None on failure. Emits
     annotations.
@@ -109,7 +159,7 @@ class TaskCollector:
     # Merge all JSON files together.
 
     tags = set()
-    aggregated_results = AggregatedResults(options.slow_tests_cutoff)
+    aggregated_results = AggregatedResults(options.slow_tests_cutoff, output)
     bad_shards = BadShards()
     for index, result in enumerate(shards):
       if result is not None:
@@ -134,6 +184,10 @@ class TaskCollector:
       self.emit_warning('some shards did not complete: %s' % as_str,
                    MISSING_SHARDS_MSG % as_str)
 
+    if output is not None:
+      aggregated_results.write_json(tags)
+      return None
+
     # Handle the case when all shards fail. Return minimalistic dict that has
     # all fields that a calling recipe expects to avoid recipe-level
     # exceptions.
@@ -150,23 +204,72 @@ class TaskCollector:
 
   def merge_test_results(self, output_dir, shards, options):
     with open(options.merged_test_output, 'wb') as f:
-      merged_data = self.merge_shard_results(output_dir, shards, options)
-      f.write(json.dumps(merged_data, separators=(',', ':')).encode('utf-8'))
+      if shards:
+        self.merge_shard_results(output_dir, shards, options, output=f)
+      else:
+        f.write(b'null')
+
+
+  def run_sancov_merger(self, options, coverage_dir, swarming_output_dir):
+    """Merges sancov files of |swarming_output_dir| into |coverage_dir|.
+
+    Returns the exit code of the merger.
+    """
+    return subprocess.call([
+        sys.executable, '-u', options.sancov_merger, '--coverage-dir',
+        coverage_dir, '--swarming-output-dir', swarming_output_dir
+    ])
 
 
   def merge_coverage_data(self, output_dir, shards, options):
-    # Merge coverage data if specified.
-    if options.coverage_dir:
-      for index, result in enumerate(shards):
-        exit_code = subprocess.call([
-            sys.executable, '-u', options.sancov_merger, '--coverage-dir',
-            options.coverage_dir, '--swarming-output-dir',
-            os.path.join(output_dir, result['task_id'])
-        ])
-        if exit_code:
+    """Merges sancov coverage data of all shards if coverage_dir is specified.
+
+    The merger updates the files in its coverage directory in place, so shards
+    are split into groups, each merged concurrently into its own temporary
+    directory. The temporary directories are then merged one by one.
+    """
+    if not options.coverage_dir:
+      return
+
+    indexed_shards = list(enumerate(shards))
+    num_groups = min(MAX_CONCURRENT_COVERAGE_MERGES, len(indexed_shards))
+    if num_groups <= 1:
+      coverage_dirs = [options.coverage_dir]
+    else:
+      coverage_dirs = [
+          tempfile.mkdtemp(suffix='_coverage', dir=options.temp_root_dir)
+          for _ in range(num_groups)
+      ]
+
+    def merge_group(coverage_dir, group):
+      return [
+          index for index, result in group
+          if self.run_sancov_merger(options, coverage_dir,
+                                    os.path.join(output_dir, result['task_id']))
+      ]
+
+    try:
+      max_workers = max(1, num_groups)
+      with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        failures = executor.map(
+            merge_group, coverage_dirs,
+            [indexed_shards[i::num_groups] for i in range(num_groups)])
+        for index in sorted(itertools.chain.from_iterable(failures)):
           self.emit_warning(
               'error when merging coverage data of shard %d' % index)
 
+      if num_groups > 1:
+        for group, coverage_dir in enumerate(coverage_dirs):
+          if self.run_sancov_merger(options, options.coverage_dir,
+                                    coverage_dir):
+            indices = range(group, len(indexed_shards), num_groups)
+            self.emit_warning('error when merging coverage data of shards %s' %
+                              ', '.join(map(str, indices)))
+    finally:
+      if num_groups > 1:
+        for coverage_dir in coverage_dirs:
+          shutil.rmtree(coverage_dir, ignore_errors=True)
+
 
   def load_shard_json(self, output_dir, task_id, file_name):
     """Reads JSON output of a single shard."""
@@ -4,9 +4,12 @@
 
 import collections
 import collect_v8_task
+import io
 import json
 import unittest
 
+from unittest import mock
+
 from pyfakefs import fake_filesystem_unittest
 
 
@@ -64,11 +67,17 @@ class AggregatedResultsTestCase(unittest.TestCase):
     self.assertEqual(aggregated_results.test_total, 0)
     self.assertEqual(aggregated_results.slow_tests_cutoff, 10)
     aggregated_results.append({
-        'slowest_tests': 'x',
+        'slowest_tests': [{
+            'name': 'x',
+            'duration': 1
+        }],
         'results': 'y',
         'test_total': 1
     })
-    self.assertEqual(aggregated_results.slowest_tests, ['x'])
+    self.assertEqual(aggregated_results.slowest_tests, [{
+        'name': 'x',
+        'duration': 1
+    }])
     self.assertEqual(aggregated_results.results, ['y'])
     self.assertEqual(aggregated_results.test_total, 1)
     self.assertEqual(aggregated_results.slow_tests_cutoff, 10)
@@ -110,6 +119,82 @@ class AggregatedResultsTestCase(unittest.TestCase):
             'tags': ['tag 1', 'tag 2', 'tag 3']
         })
 
+  def test_keep_slowest_tests_up_to_cutoff(self):
+    aggregated_results = collect_v8_task.AggregatedResults(3)
+    for durations in [[10, 30], [20, 5], [30, 20, 40]]:
+      aggregated_results.append({
+          'slowest_tests': [{
+              'name': 'shard %d' % len(aggregated_results.results),
+              'duration': duration
+          } for duration in durations],
+          'results': ['r'],
+          'test_total': len(durations)
+      })
+    self.assertEqual(aggregated_results.slowest_tests, [
+        {
+            'name': 'shard 2',
+            'duration': 40
+        },
+        {
+            'name': 'shard 0',
+            'duration': 30
+        },
+        {
+            'name': 'shard 2',
+            'duration': 30
+        },
+    ])
+    self.assertEqual(aggregated_results.test_total, 7)
+
+  def test_write_aggregated_tests_as_json(self):
+    output = io.BytesIO()
+    aggregated_results = collect_v8_task.AggregatedResults(1, output)
+    aggregated_results.append({
+        'slowest_tests': [{
+            'name': 'a',
+            'duration': 10
+        }],
+        'results': [{
+            'name': 'a'
+        }, {
+            'name': 'b'
+        }],
+        'test_total': 2
+    })
+    aggregated_results.append({
+        'slowest_tests': [],
+        'results': [],
+        'test_total': 0
+    })
+    aggregated_results.append({
+        'slowest_tests': [{
+            'name': 'c',
+            'duration': 20
+        }],
+        'results': [{
+            'name': 'c'
+        }],
+        'test_total': 1
+    })
+    self.assertEqual(aggregated_results.results, [])
+    aggregated_results.write_json(['tag'])
+    self.assertEqual(
+        json.loads(output.getvalue()), {
+            'slowest_tests': [{
+                'duration': 20,
+                'name': 'c'
+            }],
+            'results': [{
+                'name': 'a'
+            }, {
+                'name': 'b'
+            }, {
+                'name': 'c'
+            }],
+            'test_total': 3,
+            'tags': ['tag']
+        })
+
 
 class TaskCollectorTestCase(fake_filesystem_unittest.TestCase):
 
@@ -230,6 +315,113 @@ class TaskCollectorTestCase(fake_filesystem_unittest.TestCase):
               'test_total': 0
           })
 
+  def test_merge_test_results_from_shards(self):
+    self.setUpPyfakefs(allow_root_user=True)
+    for task_id, name in [('a', 'foo'), ('b', 'bar')]:
+      self.fs.create_file('/%s/output.json' % task_id,
+                          contents=json.dumps({
+                              'slowest_tests': [{
+                                  'name': name,
+                                  'duration': 1
+                              }],
+                              'results': [{
+                                  'name': name
+                              }],
+                              'test_total': 1
+                          }))
+
+    Options = collections.namedtuple(
+        'options', ['merged_test_output', 'slow_tests_cutoff'])
+    example_options = Options(merged_test_output='/merged_output.json',
+                              slow_tests_cutoff=10)
+    task_collector = collect_v8_task.TaskCollector()
+    task_collector.merge_test_results(output_dir='/',
+                                      shards=[{
+                                          'task_id': 'a'
+                                      }, None, {
+                                          'task_id': 'b'
+                                      }],
+                                      options=example_options)
+
+    with open(example_options.merged_test_output, 'r') as f:
+      self.assertEqual(
+          json.load(f), {
+              'slowest_tests': [{
+                  'name': 'foo',
+                  'duration': 1
+              }, {
+                  'name': 'bar',
+                  'duration': 1
+              }],
+              'results': [{
+                  'name': 'foo'
+              }, {
+                  'name': 'bar'
+              }],
+              'tags': ['UNRELIABLE_RESULTS'],
+              'test_total': 2
+          })
+    self.assertEqual(task_collector.warnings[0][0],
+                     'some shards did not complete: 1')
+
+  def test_merge_test_results_without_shards(self):
+    self.setUpPyfakefs(allow_root_user=True)
+    Options = collections.namedtuple('options', ['merged_test_output'])
+    example_options = Options(merged_test_output='/merged_output.json')
+    task_collector = collect_v8_task.TaskCollector()
+    task_collector.merge_test_results(output_dir='/',
+                                      shards=None,
+                                      options=example_options)
+
+    with open(example_options.merged_test_output, 'r') as f:
+      self.assertIsNone(json.load(f))
+
+  def test_merge_coverage_data(self):
+    self.setUpPyfakefs(allow_root_user=True)
+    Options = collections.namedtuple('options',
+                                     ['coverage_dir', 'temp_root_dir'])
+    example_options = Options(coverage_dir='/coverage', temp_root_dir='/tmp')
+    shards = [{'task_id': str(i)} for i in range(10)]
+    merges = []
+
+    def run_sancov_merger(options, coverage_dir, swarming_output_dir):
+      merges.append((coverage_dir, swarming_output_dir))
+      return int(swarming_output_dir in ('/3', '/8'))
+
+    task_collector = collect_v8_task.TaskCollector()
+    with mock.patch.object(task_collector,
+                           'run_sancov_merger',
+                           side_effect=run_sancov_merger):
+      task_collector.merge_coverage_data(output_dir='/',
+                                         shards=shards,
+                                         options=example_options)
+
+    # Every shard is merged into a temporary directory of its group, all of
+    # which are merged into the coverage directory last.
+    temp_dirs = [d for _, d in merges[-8:]]
+    self.assertEqual(merges[-8:], [('/coverage', d) for d in temp_dirs])
+    self.assertEqual(sorted(merges[:-8]),
+                     sorted((temp_dirs[i % 8], '/%d' % i) for i in range(10)))
+    self.assertFalse(any(self.fs.exists(d) for d in temp_dirs))
+    self.assertEqual(task_collector.warnings, [
+        ['error when merging coverage data of shard 3', ''],
+        ['error when merging coverage data of shard 8', ''],
+    ])
+
+  def test_merge_coverage_data_of_single_shard(self):
+    Options = collections.namedtuple('options', ['coverage_dir'])
+    example_options = Options(coverage_dir='/coverage')
+    task_collector = collect_v8_task.TaskCollector()
+    with mock.patch.object(task_collector, 'run_sancov_merger',
+                           return_value=0) as merger:
+      task_collector.merge_coverage_data(output_dir='/',
+                                         shards=[{
+                                             'task_id': 'a'
+                                         }],
+                                         options=example_options)
+    merger.assert_called_once_with(example_options, '/coverage', '/a')
+    self.assertEqual(task_collector.warnings, [])
+
 
 if __name__ == '__main__':
   unittest.main()
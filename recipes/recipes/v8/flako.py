@@ -25,6 +25,9 @@ Tests are only run on existing isolated files, looked up on Google Storage.
 All revisions during bisections are represented as offsets to the start revision
 which has offset 0.
 
+With multisection k > 2, each bisection step checks k - 1 revisions
+concurrently, narrowing a range down by a factor of k instead of 2.
+
 See PROPERTIES for documentation on the recipe's interface.
 """
 
@@ -41,6 +44,7 @@ from PB.recipe_engine.result import RawResult
 
 
 DEPS = [
+    'recipe_engine/futures',
     'recipe_engine/json',
     'recipe_engine/path',
     'recipe_engine/properties',
@@ -72,6 +76,11 @@ PROPERTIES = {
     # Mode combined runs progression and regression bisection.
     # Mode repro only checks if a flake reproduces with the given revision.
     'mode': Property(default='combined', kind=str),
+    # Number of parts a revision range is split into in each bisection step.
+    # The revisions at all split points are checked concurrently. Bounded so
+    # that at most MAX_SWARMING_SHARDS swarming tasks run at once after
+    # calibration.
+    'multisection': Property(default=2, kind=Single((int, float))),
     # Initial number of swarming shards.
     'num_shards': Property(default=2, kind=Single((int, float))),
     # Optional build directory for backwards-compatibility, e.g. 'out/Release'.
@@ -585,10 +594,9 @@ class Runner:
 
     def trigger_task(path, shard):
       # TODO(machenbach): Would be nice to just use 'shard X' as step names for
-      # trigger/collect. But swarming enforces unique task titles and we can't
-      # use our optimization to not collect some tasks. Either properly
-      # cancel the task, such that they are not in the list of pending tasks or
-      # override the step names.
+      # trigger/collect. But swarming enforces unique task titles among pending
+      # tasks, which would require each check to collect or cancel all of its
+      # tasks, or to override the step names.
       task = self.api.chromium_swarming.task(
           name=f'{step_prefix} - shard {shard}',
           task_output_dir=path.join(f'task_output_dir_{shard}'),
@@ -623,24 +631,34 @@ class Runner:
     # TODO(sergiyb): Make bisect more robust to infra failures, e.g. we trigger
     # several dozen of tasks during bisect and currently if one expires, the
     # whole thing goes purple.
+    def enough_failures(num_failures):
+      return (self.repro_only and num_failures or
+              num_failures >= MIN_FLAKE_THRESHOLD)
+
     path = self.api.path.mkdtemp('v8-flake-bisect-')
     with self.api.step.nest(step_prefix) as parent:
-      tasks = [
-        trigger_task(path, shard)
-        for shard in range(self.num_shards)
-      ]
+      tasks_by_ids = {}
+      for shard in range(self.num_shards):
+        task = trigger_task(path, shard)
+        tasks_by_ids[tuple(task.get_task_ids())] = task
       num_failures = 0
-      for task in tasks:
-        num_failures += collect_task(task)
-        if (self.repro_only and num_failures or
-            num_failures >= MIN_FLAKE_THRESHOLD):
-          # Stop waiting for more tasks early if already enough failures are
-          # found.
-          # TODO(machenbach): Cancel the tasks we don't collect. During
-          # calibration we might even want to figure out a better number of
-          # shards? E.g. when doubling from 4 to 8, maybe 5 was enough and
-          # should be used throughout.
-          break
+      attempts = 0
+      # Collect tasks in the order they finish and stop waiting for more tasks
+      # early if already enough failures are found.
+      # TODO(machenbach): During calibration we might even want to figure out a
+      # better number of shards? E.g. when doubling from 4 to 8, maybe 5 was
+      # enough and should be used throughout.
+      while tasks_by_ids and not enough_failures(num_failures):
+        finished_sets, attempts = (
+            self.api.chromium_swarming.wait_for_finished_task_set(
+                list(tasks_by_ids), attempts=attempts))
+        for task_ids in finished_sets:
+          num_failures += collect_task(tasks_by_ids.pop(task_ids))
+          if enough_failures(num_failures):
+            break
+      if tasks_by_ids:
+        # Free the swarming capacity of the tasks that are still pending.
+        self.api.chromium_swarming.cancel_tasks(list(tasks_by_ids.values()))
       parent.presentation.step_text = f'{num_failures} failures'
       return num_failures
 
@@ -656,18 +674,20 @@ class Validator:
 
 
 class Bisector(Validator):
-  def __init__(self, api, depot, builds, is_bad_func):
+  def __init__(self, api, depot, builds, is_bad_func, multisection=2):
     """Collection of bisection helpers.
 
     Args:
       api: Recipe api.
       depot: Helper for accessing storage and git.
       is_bad_func: Function (revision->bool) determining if a revision is bad.
+      multisection: Number of parts a range is split into in each step.
     """
     super().__init__(api)
     self.depot = depot
     self.builds = builds
     self.is_bad_func = is_bad_func
+    self.multisection = multisection
 
   def report_range(self, text, from_offset, to_offset):
     from_revision = self.depot.get_revision(from_offset)
@@ -688,31 +708,76 @@ class Bisector(Validator):
         text % f'#{offset} (commit position: {rev_cp})', cmd=None)
     step_result.presentation.links[rev[:8]] = f'{REPO}/+/{rev}'
 
+  def check_revisions(self, offsets, is_bad_func=None):
+    """Checks the revisions at the given offsets concurrently.
+
+    Args:
+        offsets: Offsets of the revisions to check.
+        is_bad_func: Function checking the revision at an offset. Defaults to
+            the is_bad_func of the bisector.
+
+    Returns:
+        A list of booleans indicating if the revision at the respective offset
+        is bad.
+    """
+    is_bad_func = is_bad_func or self.is_bad_func
+    for offset in offsets:
+      self.report_revision('Checking %s', offset)
+    if len(offsets) == 1:
+      return [is_bad_func(offsets[0])]
+    futures = [
+        self.api.futures.spawn(is_bad_func, offset) for offset in offsets
+    ]
+    # Let all checks finish before raising the failure of any of them.
+    self.api.futures.wait(futures)
+    return [future.result() for future in futures]
+
+  def _is_bad_back(self, offset, bisect_step_num):
+    """Checks the revision at offset in bisection step bisect_step_num back.
+
+    Builds of revisions far back might have gone out of CAS retention, so
+    failing to check them is not an infra failure.
+    """
+    try:
+      return self.is_bad_func(offset)
+    except self.api.step.InfraFailure:
+      if bisect_step_num >= MAX_BISECT_STEPS / 2:
+        raise self.api.step.StepFailure(
+            'Unable to retrieve from CAS, probably went out of retention')
+      raise
+
   def bisect_back(self, to_offset):
     """Bisects backwards from to_offset, doubling the delta in each iteration.
 
+    With multisection, the next multisection - 1 iterations are checked at once.
+
     Returns:
         A tuple of (from_offset, to_offset), where from_offset..to_offset
         represents the range of good..bad revision found.
     """
     commit_offset = 1
-    for bisect_step_num in range(MAX_BISECT_STEPS):
-      from_offset = to_offset + commit_offset
-
-      # Check if from_offset is a good revision, otherwise iterate backwards.
-      from_offset = self.builds.find_closest_build(from_offset)
-      self.report_revision('Checking %s', from_offset)
-      try:
-        if not self.is_bad_func(from_offset):
+    bisect_step_num = 0
+    while bisect_step_num < MAX_BISECT_STEPS:
+      from_offsets = []
+      for _ in range(
+          min(self.multisection - 1, MAX_BISECT_STEPS - bisect_step_num)):
+        from_offset = (from_offsets or [to_offset])[-1] + commit_offset
+        from_offsets.append(self.builds.find_closest_build(from_offset))
+        commit_offset *= 2
+      step_nums = {
+          offset: bisect_step_num + i for i, offset in enumerate(from_offsets)
+      }
+
+      # Check if a from_offset is a good revision, otherwise iterate backwards.
+      is_bad_results = self.check_revisions(
+          from_offsets,
+          lambda offset: self._is_bad_back(offset, step_nums[offset]))
+
+      for from_offset, is_bad in zip(from_offsets, is_bad_results):
+        if not is_bad:
           return from_offset, to_offset
-      except self.api.step.InfraFailure as e:
-        if bisect_step_num >= MAX_BISECT_STEPS / 2:
-          raise self.api.step.StepFailure(
-              'Unable to retrieve from CAS, probably went out of retention')
-        raise e
-
-      to_offset = from_offset
-      commit_offset *= 2
+        to_offset = from_offset
+      bisect_step_num += len(from_offsets)
 
     raise api.step.StepFailure(
         'Could not find a good revision.')  # pragma: no cover
@@ -730,22 +795,33 @@ class Bisector(Validator):
       # range than 1 commit due to missing cas_digests.
       if from_offset - to_offset <= 1:
         return known_good, known_bad
-      middle_offset = to_offset + (from_offset - to_offset) // 2
-      build_offset = self.builds.find_closest_build(middle_offset, from_offset)
+      split_offsets = sorted(
+          set(to_offset + (from_offset - to_offset) * i // self.multisection
+              for i in range(1, self.multisection)) - {to_offset})
+      build_offsets = []
+      for split_offset in split_offsets:
+        build_offset = self.builds.find_closest_build(split_offset, from_offset)
+        if build_offset >= from_offset:
+          self.report_range('No builds in %s', from_offset, split_offset)
+          # There are no cas_digests in the remaining parts. Skip them.
+          from_offset = split_offset
+          break
+        if build_offset not in build_offsets:
+          build_offsets.append(build_offset)
 
-      if build_offset >= from_offset:
-        self.report_range('No builds in %s', from_offset, middle_offset)
-        # There are no cas_digests in lower half. Skip it and continue.
-        from_offset = middle_offset
+      if not build_offsets:
         continue
 
-      self.report_revision('Checking %s', build_offset)
-      if self.is_bad_func(build_offset):
+      # The range is narrowed down to the first good build and the bad build
+      # before it.
+      is_bad_results = self.check_revisions(build_offsets)
+      for build_offset, is_bad in zip(build_offsets, is_bad_results):
+        if not is_bad:
+          from_offset = build_offset
+          known_good = build_offset
+          break
         to_offset = build_offset
         known_bad = build_offset
-      else:
-        from_offset = build_offset
-        known_good = build_offset
 
 
 class RegressionBisector(Bisector):
@@ -757,9 +833,10 @@ class RegressionBisector(Bisector):
 
 
 class ProgressionBisector(Bisector):
-  def __init__(self, api, depot, builds, is_bad_func):
+  def __init__(self, api, depot, builds, is_bad_func, multisection=2):
     # For progression testing we invert the meaning of "is_bad".
-    super().__init__(api, depot, builds, lambda *args: not is_bad_func(*args))
+    super().__init__(api, depot, builds, lambda *args: not is_bad_func(*args),
+                     multisection)
 
   def bisect(self, known_bad_offset):
     head_offset = self.builds.find_closest_build(self.depot.get_head_offset())
@@ -776,10 +853,12 @@ class ProgressionBisector(Bisector):
 class CombinedBisector(Validator):
   """Combines the regression and progression bisector steps."""
 
-  def __init__(self, api, depot, builds, is_bad_func):
+  def __init__(self, api, depot, builds, is_bad_func, multisection=2):
     super().__init__(api)
-    self.progression = ProgressionBisector(api, depot, builds, is_bad_func)
-    self.regression = RegressionBisector(api, depot, builds, is_bad_func)
+    self.progression = ProgressionBisector(
+        api, depot, builds, is_bad_func, multisection)
+    self.regression = RegressionBisector(
+        api, depot, builds, is_bad_func, multisection)
 
   def bisect(self, known_bad_offset):
     # First try progression testing to quickly know if the problem is still
@@ -847,13 +926,14 @@ def create_flakes_pyl_entry_step(api, config):
 
 def RunSteps(api, bisect_builder_group, bisect_buildername, extra_args,
              failure_regexp, max_calibration_attempts, isolated_name,
-             mode, num_shards, outdir, repetitions, revision,
+             mode, multisection, num_shards, outdir, repetitions, revision,
              swarming_dimensions, swarming_priority, swarming_expiration,
              test_name, timeout_sec, total_timeout_sec, to_revision, variant):
   # Convert floats to ints.
   assert mode in BISECTORS.keys()
   repro_only = mode == 'repro'
   max_calibration_attempts = max(min(int(max_calibration_attempts), 5), 1)
+  multisection = max(min(int(multisection), MAX_SWARMING_SHARDS), 2)
   num_shards = int(num_shards)
   repetitions = int(repetitions)
   timeout_sec = int(timeout_sec)
@@ -874,13 +954,19 @@ def RunSteps(api, bisect_builder_group, bisect_buildername, extra_args,
   runner = Runner(
       api, builds, command, num_shards, repro_only, max_calibration_attempts,
       failure_regexp)
-  bisector = BISECTORS[mode](api, depot, builds, runner.check_num_flakes)
 
   known_bad_offset = builds.find_closest_build(0)
 
   # Get confidence that the given revision is flaky and optionally calibrate the
   # repetitions.
   could_reproduce = runner.calibrate(known_bad_offset)
+
+  # Each of the multisection - 1 concurrent checks uses the calibrated number
+  # of shards. Don't use more than MAX_SWARMING_SHARDS tasks at once.
+  multisection = min(
+      multisection, MAX_SWARMING_SHARDS // max(runner.num_shards, 1) + 1)
+  bisector = BISECTORS[mode](
+      api, depot, builds, runner.check_num_flakes, multisection)
   bisector.validate(could_reproduce)
 
   create_flakes_pyl_entry_step(api, {
@@ -1067,6 +1153,137 @@ def GenTests(api):
       api.post_process(DropExpectation)
   )
 
+  # Same revisions as above, but bisecting with 4 parts per step. Overview of
+  # all revisions ordered new -> old.
+  # a0..a4: flaky
+  # a5..a7: not flaky
+  # -> Bisecting backwards checks a1, a3 and a7 at once, then bisecting into
+  # a7..a3 checks a4, a5 and a6 at once, suspecting range a5..a4.
+  yield (
+      test('multisection', multisection=4) +
+      get_revisions(1, 8) +
+      successful_lookups(0, 1, 3, 4, 5, 6, 7) +
+      is_flaky(0, 0, 5, calibration_attempt=1) +
+      is_flaky(1, 0, 3) +
+      is_flaky(3, 0, 3) +
+      is_flaky(4, 0, 2) +
+      api.post_process(MustRun, 'Checking #7 (commit position: 92)') +
+      api.post_process(DoesNotRun, 'Checking #2 (commit position: 97)') +
+      api.post_process(MustRun, 'Checking #6 (commit position: 93)') +
+      verify_suspects(5, 4) +
+      api.post_process(DropExpectation)
+  )
+
+  # Bisecting with 4 parts per step through a range with missing builds.
+  # Overview of all revisions ordered new -> old.
+  # a0..a4: flaky
+  # a5..a6: no cas digest
+  # a7: not flaky
+  # -> Bisecting into a7..a3 checks only a4, since there are no builds from a5,
+  # suspecting range a7..a4.
+  yield (
+      test('multisection_no_builds', multisection=4) +
+      get_revisions(1, 7) +
+      successful_lookups(0, 1, 3, 4, 7) +
+      is_flaky(0, 0, 5, calibration_attempt=1) +
+      is_flaky(1, 0, 3) +
+      is_flaky(3, 0, 3) +
+      is_flaky(4, 0, 2) +
+      api.post_process(MustRun, 'No builds in #7..#5') +
+      api.post_process(MustRun, 'Checking #4 (commit position: 95)') +
+      api.post_process(DoesNotRun, 'Checking #5 (commit position: 94)') +
+      verify_suspects(7, 4) +
+      api.post_process(DropExpectation)
+  )
+
+  # Bisecting with 4 parts per step where all split points of a7..a3 snap to
+  # the same build a6, which is checked only once.
+  # a0..a3: flaky
+  # a4..a5: no cas digest
+  # a6: flaky
+  # a7: not flaky
+  yield (
+      test('multisection_same_build', multisection=4) +
+      get_revisions(1, 7) +
+      successful_lookups(0, 1, 3, 6, 7) +
+      is_flaky(0, 0, 5, calibration_attempt=1) +
+      is_flaky(1, 0, 3) +
+      is_flaky(3, 0, 3) +
+      is_flaky(6, 0, 2) +
+      api.post_process(MustRun, 'Checking #6 (commit position: 93)') +
+      api.post_process(DoesNotRun, 'Checking #6 (commit position: 93) (2)') +
+      verify_suspects(7, 6) +
+      api.post_process(DropExpectation)
+  )
+
+  # With 4 shards, at most 8 / 4 = 2 revisions are checked at once, even if
+  # more parts are requested.
+  yield (
+      test('multisection_bounded', multisection=8, num_shards=4) +
+      get_revisions(1, 7) +
+      successful_lookups(0, 1, 3, 7) +
+      is_flaky(0, 0, 5, calibration_attempt=1) +
+      is_flaky(1, 0, 3) +
+      api.post_process(MustRun, 'Checking #3 (commit position: 96)') +
+      api.post_process(DoesNotRun, 'Checking #7 (commit position: 92)') +
+      verify_suspects(3, 1) +
+      api.post_process(DropExpectation)
+  )
+
+  # Simulate not returning a JSON output for one of several revisions checked
+  # at once.
+  yield (
+      test('multisection_no_json_output', multisection=4) +
+      get_revisions(1, 7) +
+      successful_lookups(0, 1, 3, 7) +
+      is_flaky(0, 0, 5, calibration_attempt=1) +
+      is_flaky(1, 0, 3) +
+      is_flaky(3, 0, 1, no_output=True) +
+      api.post_process(
+          SummaryMarkdownRE,
+          'Infra Failure.*missing shard results.*') +
+      api.post_process(StatusAnyFailure) +
+      api.post_process(DropExpectation)
+  )
+
+  # Same as above, but after going back more than half of MAX_BISECT_STEPS
+  # revisions, 3 at a time.
+  yield (
+      test('multisection_long_bisection_with_no_json_output', multisection=4) +
+      successful_lookups(0) +
+      is_flaky(0, 0, 5, calibration_attempt=1) +
+      sum((one_bisect_iteration(i)
+          for i in range(1, 10)), api.empty_test_data()) +
+      get_revisions(1023, 1) + successful_lookups(1023) +
+      is_flaky(1023, 0, 1, no_output=True) +
+      get_revisions(2047, 1) + successful_lookups(2047) +
+      get_revisions(4095, 1) + successful_lookups(4095) +
+      api.post_process(
+          SummaryMarkdown,
+          'Unable to retrieve from CAS, probably went out of retention') +
+      api.post_process(StatusAnyFailure) +
+      api.post_process(DropExpectation)
+  )
+
+  # The revisions checked at once are counted as separate bisection steps: #511
+  # is the 9th revision back, even though it's checked along with #127 and #255
+  # in the 7th to 9th steps.
+  yield (
+      test('multisection_bisection_with_no_json_output_in_batch',
+           multisection=4) +
+      successful_lookups(0) +
+      is_flaky(0, 0, 5, calibration_attempt=1) +
+      sum((one_bisect_iteration(i)
+          for i in range(1, 9)), api.empty_test_data()) +
+      get_revisions(511, 1) + successful_lookups(511) +
+      is_flaky(511, 0, 1, no_output=True) +
+      api.post_process(
+          SummaryMarkdown,
+          'Unable to retrieve from CAS, probably went out of retention') +
+      api.post_process(StatusAnyFailure) +
+      api.post_process(DropExpectation)
+  )
+
   # Test bisecting through a large range of missing builds.
   yield (
       test('large_gap') +
@@ -1352,6 +1569,29 @@ def GenTests(api):
       api.post_process(DropExpectation)
   )
 
+  # Simulate shard 1 finishing first and reproducing the flake. Shard 0 is
+  # cancelled instead of being collected.
+  yield (
+      test('repro_only_finish_order', mode='repro') +
+      successful_lookups(0) +
+      api.chromium_swarming.wait_for_finished_task_set(
+          [([['1']], 1)],
+          nest_step_name='calibration attempt 1.check mjsunit/foobar at #0') +
+      is_flaky(0, 1, 1, calibration_attempt=1) +
+      api.post_process(
+          MustRun, 'calibration attempt 1.check mjsunit/foobar at #0.'
+          'check mjsunit/foobar at #0 - shard 1') +
+      api.post_process(
+          DoesNotRun, 'calibration attempt 1.check mjsunit/foobar at #0.'
+          'check mjsunit/foobar at #0 - shard 0') +
+      api.post_process(
+          MustRun, 'calibration attempt 1.check mjsunit/foobar at #0.'
+          'cancel tasks') +
+      api.post_process(SummaryMarkdown, 'Flake still reproduces.') +
+      api.post_process(StatusSuccess) +
+      api.post_process(DropExpectation)
+  )
+
   # Simulate triggering of the recipe by the flake verification bot.
   yield (
       test('verify_flake', mode='repro', swarming_priority=40, num_shards=2,
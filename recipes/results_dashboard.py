@@ -12,13 +12,16 @@ script src/tools/perf/core/results_dashboard.py instead.
 """
 
 import calendar
+import collections
 import datetime
 import httplib
 import httplib2
 import json
+import multiprocessing.pool
 import os
 import subprocess
 import sys
+import threading
 import traceback
 import urllib
 import urllib2
@@ -37,6 +40,17 @@ CACHE_FILENAME = 'results_to_retry'
 ERROR_NO_OAUTH_TOKEN = (
     'No oauth token provided, cannot upload HistogramSet. Discarding.')
 
+# Maximum number of cached results that are uploaded concurrently.
+MAX_CONCURRENT_UPLOADS = 4
+
+# Key of the cache file lines which record the indexes of the cached results
+# that don't need to be sent anymore. The cache file is compacted once these
+# results outnumber the pending ones.
+CACHE_SENT_KEY = 'sent'
+
+# Keep-alive connections to the dashboard, one per uploading thread.
+_http_connections = threading.local()
+
 
 class SendResultException(Exception):
   pass
@@ -128,10 +142,86 @@ def _AddLineToCacheFile(line, cache_file_name):
     cache.write('\n' + line)
 
 
+def _ReadCacheFile(cache_file_name):
+  """Reads the results of the given cache file.
+
+  Returns:
+    A pair (results, sent_indexes), where results is the list of all the result
+    lines in the cache file, and sent_indexes is the set of the indexes of the
+    results that don't need to be sent anymore.
+  """
+  with open(cache_file_name, 'rb') as cache:
+    cache_lines = cache.readlines()
+
+  results = []
+  sent_indexes = set()
+  for line in cache_lines:
+    line = line.strip()
+    if not line:
+      continue
+    try:
+      line_dict = json.loads(line)
+    except ValueError:
+      line_dict = None
+    if isinstance(line_dict, dict) and line_dict.keys() == [CACHE_SENT_KEY]:
+      sent_indexes.update(line_dict[CACHE_SENT_KEY])
+    else:
+      results.append(line)
+  return results, sent_indexes
+
+
+def _UpdateCacheFile(cache_file_name, results, sent_indexes, new_sent_indexes):
+  """Records the results which were sent in the given cache file.
+
+  The newly sent results are appended to the cache file as a single line,
+  unless they leave few enough results to send that rewriting the cache file
+  with only those is cheaper.
+  """
+  sent_indexes = sent_indexes | new_sent_indexes
+  lines_to_retry = []
+  seen_lines = set()
+  for index, line in enumerate(results):
+    if index not in sent_indexes and line not in seen_lines:
+      lines_to_retry.append(line)
+      seen_lines.add(line)
+
+  if len(lines_to_retry) * 2 <= len(results):
+    with open(cache_file_name, 'wb') as cache:
+      cache.write('\n'.join(lines_to_retry))
+  elif new_sent_indexes:
+    _AddLineToCacheFile(
+        json.dumps({CACHE_SENT_KEY: sorted(new_sent_indexes)}),
+        cache_file_name)
+
+
+def _SendResult(url, is_histogramset, data, oauth_token):
+  """Sends one result to the dashboard.
+
+  Returns:
+    None if the result was sent, or a pair (exception, traceback string) of
+    the error which occurred while sending it.
+  """
+  try:
+    if is_histogramset:
+      # TODO(eakuefner): Remove this discard logic once all bots use
+      # histograms.
+      _SendHistogramJson(url, json.dumps(data), oauth_token)
+    else:
+      _SendResultsJson(url, json.dumps(data), oauth_token)
+  except Exception as e:
+    return e, traceback.format_exc()
+  return None
+
+
 def _SendResultsFromCache(cache_file_name, url, oauth_token):
-  """Tries to send each line from the cache file in a separate request.
+  """Tries to send each result from the cache file in a separate request.
+
+  Up to MAX_CONCURRENT_UPLOADS results are sent concurrently, but the outcomes
+  are handled in the order of the cache file, so that the first failed result
+  decides whether the failure is fatal and which results are retried.
 
-  This also writes data which failed to send back to the cache file.
+  This also records which results don't need to be sent anymore in the cache
+  file.
 
   Args:
     cache_file_name: A file name.
@@ -143,68 +233,84 @@ def _SendResultsFromCache(cache_file_name, url, oauth_token):
     whether there there was a major error and the step should fail, and errors
     is a list of error strings.
   """
-  with open(cache_file_name, 'rb') as cache:
-    cache_lines = cache.readlines()
-  total_results = len(cache_lines)
+  results, sent_indexes = _ReadCacheFile(cache_file_name)
+  total_results = len(results)
 
   fatal_error = False
   errors = []
 
-  lines_to_retry = []
-  for index, line in enumerate(cache_lines):
-    line = line.strip()
-    if not line:
+  # We need to check whether we're trying to upload histograms. If the JSON
+  # is invalid, we should not try to send this data or re-try it later.
+  # Instead, we'll print an error.
+  results_to_send = []
+  new_sent_indexes = set()
+  for index, line in enumerate(results):
+    if index in sent_indexes:
       continue
-    print 'Sending result %d of %d to dashboard.' % (index + 1, total_results)
-    # We need to check whether we're trying to upload histograms. If the JSON
-    # is invalid, we should not try to send this data or re-try it later.
-    # Instead, we'll print an error.
     try:
       is_histogramset, data = _GetData(line)
     except ValueError:
       errors.append('Could not parse JSON: %s' % line)
+      new_sent_indexes.add(index)
       continue
+    results_to_send.append((index, is_histogramset, data))
 
-    data_type = ('histogram' if is_histogramset else 'chartjson')
-
-    try:
-      if oauth_token is None:
-        oauth_token = LuciAuthTokenGeneratorCallback(None)
-      if is_histogramset:
-        # TODO(eakuefner): Remove this discard logic once all bots use
-        # histograms.
-        _SendHistogramJson(url, json.dumps(data), oauth_token)
-      else:
-        _SendResultsJson(url, json.dumps(data), oauth_token)
-    except SendResultsRetryException as e:
-      error = 'Error while uploading %s data: %s' % (data_type, str(e))
-      if index != len(cache_lines) - 1:
-        # The very last item in the cache_lines list is the new results line.
-        # If this line is not the new results line, then this results line
-        # has already been tried before; now it's considered fatal.
+  failure = None
+  uploads = collections.deque()
+  pending_results = iter(results_to_send)
+  pool = multiprocessing.pool.ThreadPool(
+      max(1, min(MAX_CONCURRENT_UPLOADS, len(results_to_send))))
+  try:
+    while True:
+      # Keep up to MAX_CONCURRENT_UPLOADS results in flight until one fails.
+      while failure is None and len(uploads) < MAX_CONCURRENT_UPLOADS:
+        result = next(pending_results, None)
+        if result is None:
+          break
+        index, is_histogramset, data = result
+        data_type = ('histogram' if is_histogramset else 'chartjson')
+        if oauth_token is None:
+          try:
+            oauth_token = LuciAuthTokenGeneratorCallback(None)
+          except Exception as e:
+            failure = (index, data_type, e, traceback.format_exc())
+            break
+        print 'Sending result %d of %d to dashboard.' % (index + 1,
+                                                         total_results)
+        uploads.append((index, data_type, pool.apply_async(
+            _SendResult, (url, is_histogramset, data, oauth_token))))
+      if not uploads:
+        break
+      index, data_type, upload = uploads.popleft()
+      error = upload.get()
+      if error is None:
+        new_sent_indexes.add(index)
+      elif failure is None:
+        failure = (index, data_type) + error
+  finally:
+    pool.close()
+    pool.join()
+
+  if failure:
+    index, data_type, e, formatted_traceback = failure
+    if isinstance(e, SendResultsRetryException):
+      errors.append('Error while uploading %s data: %s' % (data_type, str(e)))
+      if index != total_results - 1:
+        # The very last result is the new results line. If this result is not
+        # the new results line, then it has already been tried before; now
+        # it's considered fatal.
         fatal_error = True
-
-      # The lines to retry are all lines starting from the current one.
-      lines_to_retry = [l.strip() for l in cache_lines[index:] if l.strip()]
-      errors.append(error)
-      break
-    except SendResultsFatalException as e:
-      error = 'Error uploading %s data: %s' % (data_type, str(e))
-      errors.append(error)
-      fatal_error = True
-      break
-    except Exception:
-      error = 'Unexpected error while uploading %s data: %s' % (
-          data_type, traceback.format_exc())
-      errors.append(error)
+    else:
+      if isinstance(e, SendResultsFatalException):
+        errors.append('Error uploading %s data: %s' % (data_type, str(e)))
+      else:
+        errors.append('Unexpected error while uploading %s data: %s' % (
+            data_type, formatted_traceback))
       fatal_error = True
-      break
-
-  # Write any failing requests to the cache file.
-  cache = open(cache_file_name, 'wb')
-  cache.write('\n'.join(set(lines_to_retry)))
-  cache.close()
+      # Results are only retried after retryable errors.
+      new_sent_indexes.update(range(total_results))
 
+  _UpdateCacheFile(cache_file_name, results, sent_indexes, new_sent_indexes)
   return fatal_error, errors
 
 
@@ -495,7 +601,11 @@ def _Httplib2PostRequest(url, data, oauth_token):
       'Authorization': 'Bearer %s' % oauth_token,
       'User-Agent': 'perf-uploader/1.0'
   }
-  http = httplib2.Http()
+  # Reuse the connection of the thread, so that it's kept alive across
+  # requests.
+  http = getattr(_http_connections, 'http', None)
+  if http is None:
+    http = _http_connections.http = httplib2.Http()
   return http.request(url, method='POST', body=data, headers=headers)
 
 
@@ -3,8 +3,11 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import hashlib
 import os
+import shutil
 import sys
+import tempfile
 import unittest
 
 import mock
@@ -161,6 +164,86 @@ class TestGSUtil(unittest.TestCase):
         'file://bar/foo',
     ])
 
+  def testUploadBlobsToGS(self, run_command_mock):
+    run_command_mock.return_value = 0
+    blob = os.path.abspath(__file__)
+    bot_utils.UploadBlobs({'1' * 64: blob}, 'gs://bucket/blobs', gs_acl='public')
+    command = run_command_mock.call_args[0][0]
+    self.assertEqual(command[:-2],
+                     ['/mock/gsutil', '-m', 'cp', '-n', '-a', 'public'])
+    self.assertTrue(command[-2].startswith('file://'))
+    self.assertTrue(command[-2].endswith('*'))
+    self.assertEqual(command[-1], 'gs://bucket/blobs/')
+
+  def testDownloadBlobsFromGSFailure(self, run_command_mock):
+    run_command_mock.return_value = 1
+    blob_dir = tempfile.mkdtemp()
+    try:
+      with self.assertRaises(chromium_utils.ExternalError):
+        bot_utils.DownloadBlobs(['1' * 64, '2' * 64], 'gs://bucket/blobs/',
+                               blob_dir)
+      command = run_command_mock.call_args[0][0]
+      self.assertEqual(command[:-1], [
+          '/mock/gsutil', '-m', 'cp', 'gs://bucket/blobs/' + '1' * 64,
+          'gs://bucket/blobs/' + '2' * 64
+      ])
+      self.assertEqual(os.listdir(blob_dir), [])
+    finally:
+      shutil.rmtree(blob_dir)
+
+
+class BlobsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.store = os.path.join(self.tmp_dir, 'store')
+    self.blob_dir = os.path.join(self.tmp_dir, 'blobs')
+    self.blob_sources = {}
+    for contents in [b'foo', b'bar']:
+      path = os.path.join(self.tmp_dir, contents.decode())
+      with open(path, 'wb') as f:
+        f.write(contents)
+      self.blob_sources[hashlib.sha256(contents).hexdigest()] = path
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def testUploadAndDownloadBlobs(self):
+    bot_utils.UploadBlobs(self.blob_sources, self.store)
+    self.assertEqual(sorted(os.listdir(self.store)), sorted(self.blob_sources))
+    digests = sorted(self.blob_sources)
+    bot_utils.DownloadBlobs(digests, self.store, self.blob_dir)
+    self.assertEqual(sorted(os.listdir(self.blob_dir)), digests)
+    with open(os.path.join(self.blob_dir, digests[0]), 'rb') as f:
+      self.assertEqual(hashlib.sha256(f.read()).hexdigest(), digests[0])
+
+  def testDownloadCorruptBlob(self):
+    bot_utils.UploadBlobs(self.blob_sources, self.store)
+    digest = sorted(self.blob_sources)[0]
+    with open(os.path.join(self.store, digest), 'wb') as f:
+      f.write(b'corrupt')
+    with self.assertRaises(chromium_utils.ExternalError):
+      bot_utils.DownloadBlobs([digest], self.store, self.blob_dir)
+    self.assertEqual(os.listdir(self.blob_dir), [])
+
+  def testDownloadMissingBlob(self):
+    with self.assertRaises(chromium_utils.ExternalError):
+      bot_utils.DownloadBlobs(['0' * 64], self.store, self.blob_dir)
+
+  def testInvalidDigests(self):
+    bot_utils.UploadBlobs(self.blob_sources, self.store)
+    digest, path = sorted(self.blob_sources.items())[0]
+    evil = os.path.join('..', 'evil')
+    for invalid in (evil, digest.upper(), digest + '\n', digest[:-1]):
+      with self.assertRaises(chromium_utils.ExternalError):
+        bot_utils.UploadBlobs({invalid: path}, self.store)
+      with self.assertRaises(chromium_utils.ExternalError):
+        bot_utils.DownloadBlobs([digest, invalid], self.store, self.blob_dir)
+    # Nothing was read or written outside of the store and the blob dir.
+    self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, 'evil')))
+    self.assertEqual(sorted(os.listdir(self.store)), sorted(self.blob_sources))
+    self.assertFalse(os.path.exists(self.blob_dir))
+
 
 class GetGitRevisionTest(unittest.TestCase):
   """Tests related to getting revisions from a directory."""
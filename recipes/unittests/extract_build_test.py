@@ -3,7 +3,10 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import json
 import os
+import shutil
+import tempfile
 import unittest
 import sys
 
@@ -16,6 +19,7 @@ sys.path.extend([
 
 import extract_build
 import bot_utils
+from common import chromium_utils
 
 
 class MockOptions:
@@ -67,6 +71,45 @@ class ExtractBuildTest(unittest.TestCase):
     )
     self.assertEqual(url, expected_url)
 
+  def testExtractDeltaBuild(self):
+    tempdir = tempfile.mkdtemp()
+    try:
+      build_dir = os.path.join(tempdir, 'build')
+      os.makedirs(os.path.join(build_dir, 'gen'))
+      for name, contents in [('chrome', 'chrome'), ('gen/a', 'a'),
+                             ('gen/b', 'a')]:
+        with open(os.path.join(build_dir, name), 'w') as f:
+          f.write(contents)
+      manifest, blob_sources = chromium_utils.MakeDeltaManifest(
+          'full-build-linux', ['chrome', 'gen'], build_dir)
+      store = os.path.join(tempdir, 'store')
+      bot_utils.UploadBlobs(blob_sources, store)
+      manifest['blob_store'] = store
+      manifest_file = os.path.join(tempdir, 'full-build-linux.json')
+      with open(manifest_file, 'w') as f:
+        json.dump(manifest, f)
+
+      options = MockOptions()
+      options.delta_store = None
+      options.delta_cache_dir = None
+      options.gsutil_py_path = None
+      options.extract_jobs = 2
+      out_dir = os.path.join(tempdir, 'out')
+      extract_build.ExtractDeltaBuild(manifest_file, out_dir, options)
+      with open(os.path.join(out_dir, 'full-build-linux', 'gen', 'b')) as f:
+        self.assertEqual('a', f.read())
+      cache_dir = os.path.join(out_dir, 'delta_cache')
+      self.assertEqual(sorted(blob_sources), sorted(os.listdir(cache_dir)))
+
+      # Cached blobs are not downloaded again.
+      shutil.rmtree(store)
+      shutil.rmtree(os.path.join(out_dir, 'full-build-linux'))
+      extract_build.ExtractDeltaBuild(manifest_file, out_dir, options)
+      with open(os.path.join(out_dir, 'full-build-linux', 'chrome')) as f:
+        self.assertEqual('chrome', f.read())
+    finally:
+      shutil.rmtree(tempdir)
+
 
 if __name__ == '__main__':
   unittest.main()
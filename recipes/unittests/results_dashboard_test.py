@@ -314,6 +314,10 @@ class ResultsDashboardSendDataTest(unittest.TestCase):
         self.build_dir, results_dashboard.CACHE_DIR,
         results_dashboard.CACHE_FILENAME
     )
+    # Send results one at a time, in the order the tests expect them.
+    patcher = mock.patch('results_dashboard.MAX_CONCURRENT_UPLOADS', 1)
+    patcher.start()
+    self.addCleanup(patcher.stop)
 
   def tearDown(self):
     shutil.rmtree(self.build_dir)
@@ -574,6 +578,107 @@ class ResultsDashboardSendDataTest(unittest.TestCase):
                                    send_as_histograms=True,
                                    oauth_token='fake')
 
+  def _WriteCacheFile(self, data_list):
+    for data in data_list:
+      results_dashboard._AddLineToCacheFile(
+          json.dumps({
+              'is_histogramset': False,
+              'data': data
+          }), self.cache_file_name)
+
+  def _SendResultsWithStatuses(self, new_data, status_by_sample):
+    sent_samples = []
+
+    def _fake_httplib2_req(url, data, token):
+      sample = json.loads(urllib.unquote_plus(data)[len('data='):])['sample']
+      sent_samples.append(sample)
+      return httplib2.Response({
+          'status': status_by_sample.get(sample, 200),
+          'reason': 'foo'
+      }), ''
+
+    with mock.patch('results_dashboard._Httplib2PostRequest',
+                    side_effect=_fake_httplib2_req):
+      result = results_dashboard.SendResults(new_data,
+                                             'https://x.com',
+                                             self.build_dir,
+                                             oauth_token='fake')
+    return result, sent_samples
+
+  def test_Json_SentConcurrently(self):
+    """Cached results are all sent when sent concurrently."""
+    self._WriteCacheFile([{'sample': i} for i in range(10)])
+    with mock.patch('results_dashboard.MAX_CONCURRENT_UPLOADS', 4):
+      result, sent_samples = self._SendResultsWithStatuses({'sample': 10}, {})
+    self.assertTrue(result)
+    self.assertEqual(range(11), sorted(sent_samples))
+    with open(self.cache_file_name) as cache:
+      self.assertEqual('', cache.read())
+
+  def test_Json_SentConcurrently_403_Retried(self):
+    """Results after the first failed one which weren't sent are retried."""
+    self._WriteCacheFile([{'sample': i} for i in range(10)])
+    with mock.patch('results_dashboard.MAX_CONCURRENT_UPLOADS', 4):
+      result, sent_samples = self._SendResultsWithStatuses({'sample': 10}, {
+          3: 403,
+          5: 403
+      })
+    self.assertFalse(result)
+    self.assertEqual(range(7), sorted(sent_samples))
+    results, sent_indexes = results_dashboard._ReadCacheFile(
+        self.cache_file_name)
+    self.assertEqual([{
+        'sample': i
+    } for i in (3, 5, 7, 8, 9, 10)], [
+        results_dashboard._GetData(line)[1]
+        for i, line in enumerate(results)
+        if i not in sent_indexes
+    ])
+
+  def test_CacheFile_SentResultsAppended(self):
+    """Sent results are recorded without rewriting the cached results."""
+    self._WriteCacheFile([{'sample': i} for i in range(3)])
+    result, sent_samples = self._SendResultsWithStatuses({'sample': 3},
+                                                         {1: 403})
+    self.assertFalse(result)
+    self.assertEqual([0, 1], sent_samples)
+    with open(self.cache_file_name) as cache:
+      lines = cache.read().strip().splitlines()
+    self.assertEqual(5, len(lines))
+    self.assertEqual({results_dashboard.CACHE_SENT_KEY: [0]},
+                     json.loads(lines[-1]))
+
+    # The next time, the results which weren't sent are sent with the new one.
+    result, sent_samples = self._SendResultsWithStatuses({'sample': 4}, {})
+    self.assertTrue(result)
+    self.assertEqual([1, 2, 3, 4], sent_samples)
+    with open(self.cache_file_name) as cache:
+      self.assertEqual('', cache.read())
+
+  def test_CacheFile_Compacted(self):
+    """The cache file is rewritten once most cached results were sent."""
+    self._WriteCacheFile([{'sample': i} for i in range(3)])
+    result, sent_samples = self._SendResultsWithStatuses({'sample': 3},
+                                                         {2: 403})
+    self.assertFalse(result)
+    self.assertEqual([0, 1, 2], sent_samples)
+    with open(self.cache_file_name) as cache:
+      self.assertEqual([{
+          'sample': 2
+      }, {
+          'sample': 3
+      }], [
+          results_dashboard._GetData(line)[1]
+          for line in cache.read().splitlines()
+      ])
+
+  @mock.patch('httplib2.Http')
+  def test_Httplib2PostRequest_ReusesConnection(self, http_class):
+    results_dashboard._Httplib2PostRequest('https://x.com/a', 'data1', 'fake')
+    results_dashboard._Httplib2PostRequest('https://x.com/b', 'data2', 'fake')
+    self.assertLessEqual(http_class.call_count, 1)
+    self.assertEqual(2, http_class.return_value.request.call_count)
+
 
 class ResultsDashboardTest(unittest.TestCase):
   """Tests for other functions in results_dashboard."""
@@ -3,6 +3,7 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import json
 import optparse
 import os
 import shutil
@@ -98,6 +99,86 @@ class TestWriteRevisionFile(unittest.TestCase):
     finally:
       shutil.rmtree(tempdir)
 
+  def testArchiveDelta(self):
+    tempdir = tempfile.mkdtemp()
+    options = _setup_testdir(tempdir)
+    options.delta_store = os.path.join(tempdir, 'store')
+    try:
+      urls = zip_build.Archive(options)
+      manifest_filename = urls['zip_url'].rsplit('/', 1)[1]
+      self.assertTrue(manifest_filename.endswith(zip_build.DELTA_MANIFEST_EXT))
+      with open(os.path.join(options.staging_dir, manifest_filename)) as f:
+        manifest = json.load(f)
+      self.assertEqual(options.delta_store, manifest['blob_store'])
+      blobs = chromium_utils.DeltaManifestBlobs(manifest)
+      self.assertEqual(sorted(blobs), sorted(os.listdir(options.delta_store)))
+
+      # Only new contents are uploaded on the next build.
+      for blob in blobs:
+        os.remove(os.path.join(options.delta_store, blob))
+      with open(os.path.join(_build_dir(options), 'chrome'), 'w') as f:
+        f.write('changed')
+      options.build_number = 2
+      zip_build.Archive(options)
+      self.assertEqual([
+          chromium_utils.HashFile(os.path.join(_build_dir(options), 'chrome'))
+      ], os.listdir(options.delta_store))
+    finally:
+      shutil.rmtree(tempdir)
+
+
+def _path_matcher(*args):
+  option_parser = optparse.OptionParser()
+  zip_build.AddOptions(option_parser)
+  options, _ = option_parser.parse_args(list(args))
+  options.target = 'Release'
+  return zip_build.PathMatcher(options)
+
+
+class TestPathMatcher(unittest.TestCase):
+  def testInclusionsOverrideExclusions(self):
+    path_filter = _path_matcher(
+        '--include-files', 'gen/*.pak, foo', '--exclude-files', 'gen/*,*.txt'
+    )
+    self.assertTrue(path_filter.Match(os.path.join('gen', 'a.pak')))
+    self.assertTrue(path_filter.Match('foo'))
+    self.assertFalse(path_filter.Match(os.path.join('gen', 'a.js')))
+    self.assertFalse(path_filter.Match('a.txt'))
+    self.assertFalse(path_filter.Match('obj'))
+    self.assertTrue(path_filter.Match('chrome'))
+
+  def testCustomWhitelist(self):
+    path_filter = _path_matcher(
+        '--exclude-files', 'b*', '--whitelist', r'^.+\.pak$',
+        '--exclude-extra'
+    )
+    self.assertTrue(path_filter.Match('a.pak'))
+    self.assertFalse(path_filter.Match('b.pak'))
+    self.assertFalse(path_filter.Match('chrome'))
+
+  def testExcludeUnmatched(self):
+    path_filter = _path_matcher('--exclude-unmatched')
+    self.assertFalse(path_filter.Match('chrome'))
+
+
+class TestBuildDirFiles(unittest.TestCase):
+  def testListFiles(self):
+    tempdir = tempfile.mkdtemp()
+    try:
+      for path in ['chrome', 'a/b/c.pak', 'a/obj/d.pak', 'gen/e.pak']:
+        path = os.path.join(tempdir, *path.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'w').close()
+      os.symlink(os.path.join(tempdir, 'a'), os.path.join(tempdir, 'link'))
+
+      files = zip_build._BuildDirFiles(tempdir, _path_matcher())
+      self.assertEqual(
+          sorted(files),
+          sorted(['chrome', os.path.join('a', 'b', 'c.pak'), 'link'])
+      )
+    finally:
+      shutil.rmtree(tempdir)
+
 
 if __name__ == '__main__':
   unittest.main()
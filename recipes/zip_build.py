@@ -53,6 +53,10 @@ MOJOM_SEARCH_DIRS = [
 # Layout test data directory relative to the build directory.
 LAYOUT_TEST_DATA_DIR = 'gen/layout_test_data'
 
+# Extension of delta archive manifests, which replace the zip file in delta
+# archive mode.
+DELTA_MANIFEST_EXT = '.json'
+
 
 class StagingError(Exception):
   pass
@@ -184,6 +188,43 @@ def _LayoutTestFiles(build_dir):
   return results
 
 
+def _BuildDirFiles(build_dir, path_filter):
+  """Lists all files in the build directory matched by |path_filter|.
+
+  Directories not matched by |path_filter| are pruned without being listed.
+  Symbolic links to directories are not followed, but treated like files.
+
+  Args:
+    build_dir: The build directory.
+    path_filter: A PathMatcher.
+
+  Returns:
+    A list of file paths which are relative to the build directory.
+  """
+  results = []
+  # Pairs of absolute and relative paths of directories left to list.
+  pending_dirs = [(build_dir, '')]
+  while pending_dirs:
+    path, rel_path = pending_dirs.pop()
+    try:
+      entries = list(os.scandir(path))
+    except OSError:
+      continue
+    for entry in entries:
+      rel_entry = os.path.join(rel_path, entry.name)
+      if not path_filter.Match(rel_entry):
+        continue
+      try:
+        is_dir = entry.is_dir() and not entry.is_symlink()
+      except OSError:
+        is_dir = False
+      if is_dir:
+        pending_dirs.append((entry.path, rel_entry))
+      else:
+        results.append(rel_entry)
+  return results
+
+
 def WriteRevisionFile(dirname, build_revision):
   """Writes a file containing revision number to given directory.
   Replaces the target file in place.
@@ -241,6 +282,63 @@ def MakeUnversionedArchive(
   return zip_file
 
 
+def MakeUnversionedDeltaArchive(
+    build_dir, staging_dir, zip_file_list, zip_file_name, delta_store,
+    gs_acl=None, gsutil_py_path=None
+):
+  """Creates an unversioned delta build archive.
+
+  Only the blobs which are not referred to by the previous manifest in the
+  staging directory are uploaded to |delta_store|, unless it was uploaded to
+  another store.
+
+  Returns the path of the created manifest."""
+  manifest, blob_sources = chromium_utils.MakeDeltaManifest(
+      zip_file_name, sorted(set(zip_file_list)), build_dir
+  )
+  manifest['blob_store'] = delta_store
+
+  manifest_file = os.path.join(staging_dir, zip_file_name + DELTA_MANIFEST_EXT)
+  known_blobs = set()
+  if os.path.exists(manifest_file):
+    try:
+      with open(manifest_file) as f:
+        previous_manifest = json.load(f)
+      if previous_manifest.get('blob_store') == delta_store:
+        known_blobs = chromium_utils.DeltaManifestBlobs(previous_manifest)
+    except (IOError, ValueError, chromium_utils.ExternalError):
+      print('Ignoring unreadable previous manifest %s.' % manifest_file)
+
+  upload_sources = {
+      digest: path
+      for digest, path in blob_sources.items()
+      if digest not in known_blobs
+  }
+  override_gsutil = None
+  if gsutil_py_path:
+    override_gsutil = [sys.executable, gsutil_py_path]
+  bot_utils.UploadBlobs(
+      upload_sources, delta_store, gs_acl=gs_acl,
+      override_gsutil=override_gsutil
+  )
+  print(
+      'Uploaded %d of %d blobs (%d bytes) to %s' % (
+          len(upload_sources), len(blob_sources),
+          sum(os.stat(path).st_size for path in upload_sources.values()),
+          delta_store
+      )
+  )
+
+  # Replace the manifest instead of writing it in place, as the previous one
+  # may be hard linked to its versioned copy.
+  temp_manifest_file = manifest_file + '.tmp'
+  with open(temp_manifest_file, 'w') as f:
+    json.dump(manifest, f, separators=(',', ':'))
+  os.replace(temp_manifest_file, manifest_file)
+  chromium_utils.MakeWorldReadable(manifest_file)
+  return manifest_file
+
+
 def MakeVersionedArchive(zip_file, file_suffix, options):
   """Takes a file name, e.g. /foo/bar.zip and an extra suffix, e.g. _baz,
   and copies (or hardlinks) the file to /foo/bar_baz.zip.
@@ -316,8 +414,21 @@ def PruneOldArchives(staging_dir, zip_base, zip_ext, prune_limit):
       chromium_utils.RemoveFile(staging_dir, zip_file)
 
 
+def _CompileGlobs(patterns):
+  """Compiles fnmatch patterns into one regex, or None if there are none."""
+  if not patterns:
+    return None
+  return re.compile(
+      '|'.join(fnmatch.translate(os.path.normcase(p)) for p in patterns)
+  )
+
+
 class PathMatcher:
-  """Generates a matcher which can be used to filter file paths."""
+  """Generates a matcher which can be used to filter file paths.
+
+  All patterns are compiled once, inclusion and exclusion globs into one regex
+  each, since Match is called for every entry in the build directory.
+  """
 
   def __init__(self, options):
 
@@ -334,6 +445,14 @@ class PathMatcher:
     self.exclude_extra = options.exclude_extra
     self.custom_whitelist = options.whitelist
 
+    self._inclusions_re = _CompileGlobs(self.inclusions)
+    self._exclusions_re = _CompileGlobs(self.exclusions)
+    self._regex_whitelist_re = re.compile(self.regex_whitelist)
+    self._regex_blacklist_re = re.compile(self.regex_blacklist)
+    self._custom_whitelist_re = (
+        re.compile(self.custom_whitelist) if self.custom_whitelist else None
+    )
+
   def __str__(self):
     return '\n  '.join([
         'Zip rules',
@@ -347,19 +466,20 @@ class PathMatcher:
     ])
 
   def Match(self, filename):
-    for p in self.inclusions:
-      if fnmatch.fnmatch(filename, p):
-        return True
-    for p in self.exclusions:
-      if fnmatch.fnmatch(filename, p):
-        return False
-    if (self.custom_whitelist and re.match(self.custom_whitelist, filename)):
+    # Globs are matched like fnmatch.fnmatch does, i.e. case-normalized.
+    normalized = os.path.normcase(filename)
+    if self._inclusions_re and self._inclusions_re.match(normalized):
+      return True
+    if self._exclusions_re and self._exclusions_re.match(normalized):
+      return False
+    if (self._custom_whitelist_re and
+        self._custom_whitelist_re.match(filename)):
       return True
     if self.exclude_extra:
       return False
-    if re.match(self.regex_whitelist, filename):
+    if self._regex_whitelist_re.match(filename):
       return True
-    if re.match(self.regex_blacklist, filename):
+    if self._regex_blacklist_re.match(filename):
       return False
     return not self.exclude_unmatched
 
@@ -413,24 +533,7 @@ def Archive(options):
   print(path_filter)
 
   # Build the list of files to archive.
-  zip_file_list = []
-  for root, dirs, files in os.walk(build_dir):
-
-    def rel(f):
-      return os.path.relpath(os.path.join(root, f), build_dir)
-
-    zip_file_list += [rel(f) for f in files if path_filter.Match(rel(f))]
-
-    # For some reason os.walk returns symbolic links that point to directories
-    # in dirs and not files, so we need to handle any symlinks in dirs as if
-    # they appeared in files instead.
-    def islink(f):
-      return os.path.islink(os.path.join(root, f))
-
-    zip_file_list += [
-        rel(d) for d in dirs if islink(d) and path_filter.Match(rel(d))
-    ]
-    dirs[:] = [d for d in dirs if not islink(d) and path_filter.Match(rel(d))]
+  zip_file_list = _BuildDirFiles(build_dir, path_filter)
 
   # Include mojo public JS library.
   if (os.path.exists(os.path.join(build_dir, MOJO_BINDINGS_PATH))):
@@ -447,13 +550,21 @@ def Archive(options):
   print('Include layout test data: %s' % layout_test_data_files)
   zip_file_list.extend(layout_test_data_files)
 
-  zip_file = MakeUnversionedArchive(
-      build_dir,
-      staging_dir,
-      zip_file_list,
-      unversioned_base_name,
-      strip_files=options.strip_files
-  )
+  if options.delta_store:
+    if options.strip_files:
+      raise StagingError('--strip-files is not supported with --delta-store')
+    zip_file = MakeUnversionedDeltaArchive(
+        build_dir, staging_dir, zip_file_list, unversioned_base_name,
+        options.delta_store, options.gs_acl, options.gsutil_py_path
+    )
+  else:
+    zip_file = MakeUnversionedArchive(
+        build_dir,
+        staging_dir,
+        zip_file_list,
+        unversioned_base_name,
+        strip_files=options.strip_files
+    )
 
   zip_base, zip_ext, versioned_file = MakeVersionedArchive(
       zip_file, version_suffix, options
@@ -597,6 +708,12 @@ def AddOptions(option_parser):
   option_parser.add_option(
       '--gsutil-py-path', help='Specify path to gsutil.py script.'
   )
+  option_parser.add_option(
+      '--delta-store',
+      help='Google Storage URL or local directory of a content-addressed '
+      'store. If given, a manifest of the files is archived instead of a zip '
+      'file, and only file contents missing in the store are uploaded to it.'
+  )
 
 
 def main(argv):
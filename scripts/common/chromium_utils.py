@@ -5,20 +5,26 @@
 """ Set of basic operations/utilities that are used by the build. """
 from __future__ import print_function
 
+import collections
 import errno
 import fnmatch
+import hashlib
 import io
 import json
 import math
+import multiprocessing
 import os
 import re
 import shutil
 import stat
+import struct
 import subprocess
 import sys
+import tempfile
 import threading
 import time
 import zipfile
+import zlib
 
 
 _WIN_LINK_FUNC = None
@@ -440,8 +446,318 @@ def _CopyFileToDir(src_path, dest_dir, dest_fn=None, link_ok=False):
     shutil.copy2(src_path, os.path.join(dest_dir, src_file))
 
 
+# Compressed data of files larger than this is spooled to disk while zipping
+# without a staging directory.
+_ZIP_SPOOL_MAX_SIZE = 64 * 1024 * 1024
+_ZIP_READ_CHUNK_SIZE = 1024 * 1024
+
+
+def _ThreadPoolExecutor(max_workers):
+  """Returns a concurrent.futures.ThreadPoolExecutor.
+
+  concurrent.futures is imported here, as this module is also used by python2
+  scripts, which don't have it.
+  """
+  import concurrent.futures  # pylint: disable=import-outside-toplevel
+  return concurrent.futures.ThreadPoolExecutor(max_workers)
+
+
+def _ZipDateTime(timestamp):
+  """Returns the zip date_time of a timestamp, clamped to what zip supports."""
+  date_time = time.localtime(timestamp)[0:6]
+  if date_time[0] < 1980:
+    return (1980, 1, 1, 0, 0, 0)
+  if date_time[0] > 2107:
+    return (2107, 12, 31, 23, 59, 59)
+  return date_time
+
+
+def _IterZipSources(archive_name, file_list, file_relative_dir, raise_error,
+                    preserve_symlinks):
+  """Yields (src_path, arcname, kind) for the files to add to a zip archive.
+
+  kind is one of 'dir', 'link' or 'file'. Directories in |file_list| are
+  added recursively. Symlinks are yielded as links, without being followed,
+  if |preserve_symlinks| is True. Parent directories are yielded before
+  their contents, and every arcname is yielded once.
+  """
+  seen = set()
+
+  def _Entry(src_path, arcname, kind):
+    if arcname in seen:
+      return []
+    seen.add(arcname)
+    return [(src_path, arcname, kind)]
+
+  def _ParentDirs(rel_path):
+    parents = []
+    rel_path = os.path.dirname(rel_path)
+    while rel_path:
+      parents.append(rel_path)
+      rel_path = os.path.dirname(rel_path)
+    for parent in reversed(parents):
+      for entry in _Entry(os.path.join(file_relative_dir, parent),
+                          '%s/%s' % (archive_name, parent), 'dir'):
+        yield entry
+
+  for entry in _Entry(file_relative_dir, archive_name, 'dir'):
+    yield entry
+  for needed_file in file_list:
+    needed_file = os.path.normpath(needed_file.rstrip())
+    src_path = os.path.join(file_relative_dir, needed_file)
+    arcname = '%s/%s' % (archive_name, needed_file.replace(os.sep, '/'))
+    for entry in _ParentDirs(needed_file.replace(os.sep, '/')):
+      yield entry
+    if preserve_symlinks and os.path.islink(src_path):
+      for entry in _Entry(src_path, arcname, 'link'):
+        yield entry
+    elif os.path.isdir(src_path):
+      for root, dirs, files in os.walk(src_path,
+                                       followlinks=not preserve_symlinks):
+        arcroot = arcname + root[len(src_path):].replace(os.sep, '/')
+        for entry in _Entry(root, arcroot, 'dir'):
+          yield entry
+        subdirs = set(dirs)
+        for name in sorted(dirs + files):
+          path = os.path.join(root, name)
+          if preserve_symlinks and os.path.islink(path):
+            kind = 'link'
+          elif name in subdirs:
+            # Walked after this directory.
+            continue
+          else:
+            kind = 'file'
+          for entry in _Entry(path, '%s/%s' % (arcroot, name), kind):
+            yield entry
+        dirs.sort()
+    elif os.path.isfile(src_path):
+      for entry in _Entry(src_path, arcname, 'file'):
+        yield entry
+    elif raise_error:
+      raise PathNotFound('Unable to find file %s' % src_path)
+
+
+def _StripZipEntry(src_path, spool_dir):
+  """Returns the path of a stripped copy of a file, or None if strip failed."""
+  fd, stripped_path = tempfile.mkstemp(dir=spool_dir)
+  os.close(fd)
+  if RunCommand(['strip', '-o', stripped_path, src_path]) == 0:
+    # Keep the mode and mtime of the original file in the zip.
+    shutil.copystat(src_path, stripped_path)
+    return stripped_path
+  os.remove(stripped_path)
+  return None
+
+
+def _DeflateZipEntry(src_path, strip, spool_dir):
+  """Deflates a file for _ZipArchiveWriter.WriteEntry().
+
+  If |strip| is True, a stripped copy of the file is deflated instead.
+
+  Returns:
+    A tuple (st, crc, file_size, data), where st is the os.stat() of the file
+    and data is a file object holding the raw deflate stream of its contents.
+  """
+  st = os.stat(src_path)
+  stripped_path = _StripZipEntry(src_path, spool_dir) if strip else None
+  data = tempfile.SpooledTemporaryFile(
+      max_size=_ZIP_SPOOL_MAX_SIZE, dir=spool_dir)
+  try:
+    compressor = zlib.compressobj(1, zlib.DEFLATED, -15)
+    crc = 0
+    file_size = 0
+    with open(stripped_path or src_path, 'rb') as f:
+      for chunk in iter(lambda: f.read(_ZIP_READ_CHUNK_SIZE), b''):
+        crc = zlib.crc32(chunk, crc)
+        file_size += len(chunk)
+        data.write(compressor.compress(chunk))
+    data.write(compressor.flush())
+    return st, crc & 0xFFFFFFFF, file_size, data
+  except Exception:
+    data.close()
+    raise
+  finally:
+    if stripped_path:
+      os.remove(stripped_path)
+
+
+class _ZipArchiveWriter(object):
+  """Writes a zip archive out of entries which are already compressed.
+
+  zipfile can't add data compressed elsewhere to an archive, so this writes
+  the local file headers, the central directory and, if the archive needs
+  them, the zip64 records itself.
+  """
+
+  # Sizes, offsets and entry counts above these need zip64 records.
+  ZIP64_LIMIT = (1 << 31) - 1
+  FILECOUNT_LIMIT = (1 << 16) - 1
+
+  def __init__(self, fp):
+    self._fp = fp
+    self._offset = 0
+    self._central_dir = []
+
+  def _Write(self, data):
+    self._fp.write(data)
+    self._offset += len(data)
+
+  def WriteEntry(self, arcname, date_time, external_attr, data, crc=0,
+                 file_size=None, deflated=False):
+    """Appends an entry to the archive.
+
+    Args:
+      arcname: Name of the entry, with '/' separators.
+      date_time: Tuple (year, month, day, hour, minute, second) of the entry.
+      external_attr: External attributes of the entry, such as the unix mode
+        bits in the upper 16 bits.
+      data: File object holding the stored or deflated data of the entry, to
+        be read from its current position to its end.
+      crc: CRC-32 of the uncompressed data.
+      file_size: Size of the uncompressed data. Defaults to the size of data.
+      deflated: Whether data is a raw deflate stream.
+    """
+    start = data.tell()
+    data.seek(0, os.SEEK_END)
+    compress_size = data.tell() - start
+    data.seek(start)
+    if file_size is None:
+      file_size = compress_size
+    try:
+      name = arcname.encode('ascii')
+      flags = 0
+    except UnicodeError:
+      name = arcname.encode('utf-8')
+      flags = 0x800
+    year, month, day, hour, minute, second = date_time
+    dos_date = (year - 1980) << 9 | month << 5 | day
+    dos_time = hour << 11 | minute << 5 | second // 2
+    method = zipfile.ZIP_DEFLATED if deflated else zipfile.ZIP_STORED
+    create_system = 0 if IsWindows() else 3
+
+    zip64 = max(file_size, compress_size) > self.ZIP64_LIMIT
+    version = 45 if zip64 else 20
+    extra = b''
+    if zip64:
+      extra = struct.pack('<HHQQ', 1, 16, file_size, compress_size)
+    header_offset = self._offset
+    self._Write(struct.pack(
+        '<L5H3L2H', 0x04034b50, version, flags, method, dos_time, dos_date,
+        crc, 0xFFFFFFFF if zip64 else compress_size,
+        0xFFFFFFFF if zip64 else file_size, len(name), len(extra)))
+    self._Write(name)
+    self._Write(extra)
+    for chunk in iter(lambda: data.read(_ZIP_READ_CHUNK_SIZE), b''):
+      self._Write(chunk)
+
+    # The central directory only has zip64 fields for the values which
+    # overflow, in this order.
+    zip64_fields = []
+    central_values = []
+    for value in (file_size, compress_size, header_offset):
+      if value > self.ZIP64_LIMIT:
+        zip64_fields.append(value)
+        central_values.append(0xFFFFFFFF)
+      else:
+        central_values.append(value)
+    extra = b''
+    if zip64_fields:
+      version = 45
+      extra = struct.pack('<HH%dQ' % len(zip64_fields), 1,
+                          8 * len(zip64_fields), *zip64_fields)
+    file_size, compress_size, header_offset = central_values
+    self._central_dir.append(struct.pack(
+        '<L6H3L5H2L', 0x02014b50, create_system << 8 | version, version,
+        flags, method, dos_time, dos_date, crc, compress_size, file_size,
+        len(name), len(extra), 0, 0, 0, external_attr, header_offset) +
+                             name + extra)
+
+  def Close(self):
+    """Writes the central directory. No entry can be added afterwards."""
+    central_dir_offset = self._offset
+    for record in self._central_dir:
+      self._Write(record)
+    central_dir_size = self._offset - central_dir_offset
+    count = len(self._central_dir)
+    if (count > self.FILECOUNT_LIMIT or
+        central_dir_offset > self.ZIP64_LIMIT or
+        central_dir_size > self.ZIP64_LIMIT):
+      zip64_end_offset = self._offset
+      self._Write(struct.pack(
+          '<LQ2H2L4Q', 0x06064b50, 44, 45, 45, 0, 0, count, count,
+          central_dir_size, central_dir_offset))
+      self._Write(struct.pack('<2LQL', 0x07064b50, 0, zip64_end_offset, 1))
+      count = min(count, 0xFFFF)
+      central_dir_size = min(central_dir_size, 0xFFFFFFFF)
+      central_dir_offset = min(central_dir_offset, 0xFFFFFFFF)
+    self._Write(struct.pack('<L4H2LH', 0x06054b50, 0, 0, count, count,
+                            central_dir_size, central_dir_offset, 0))
+
+
+def _MakeZipWithoutStaging(output_file, archive_name, file_list,
+                           file_relative_dir, raise_error, strip_files, jobs):
+  """Writes the files of MakeZip() straight into |output_file|.
+
+  Files are deflated at level 1, like zip -1 does for the staged archive, on
+  a pool of |jobs| threads, as zlib releases the GIL. Files in |strip_files|
+  are stripped into temporary copies by the same threads first. Entries are
+  written in the order of |file_list|.
+  """
+  preserve_symlinks = not IsWindows()
+  spool_dir = os.path.dirname(output_file)
+  max_pending = 2 * jobs
+  with open(output_file, 'wb') as f, _ThreadPoolExecutor(jobs) as executor:
+    writer = _ZipArchiveWriter(f)
+    # Pairs of (arcname, future) of files to write, where the future results
+    # in the tuple returned by _DeflateZipEntry().
+    pending = collections.deque()
+
+    def _WritePending(max_size):
+      while len(pending) > max_size:
+        arcname, future = pending.popleft()
+        st, crc, file_size, data = future.result()
+        with data:
+          data.seek(0)
+          writer.WriteEntry(arcname, _ZipDateTime(st.st_mtime),
+                            (st.st_mode & 0xFFFF) << 16, data, crc=crc,
+                            file_size=file_size, deflated=True)
+        print('Adding %s' % arcname)
+
+    try:
+      for src_path, arcname, kind in _IterZipSources(
+          archive_name, file_list, file_relative_dir, raise_error,
+          preserve_symlinks):
+        if kind == 'file':
+          strip = (not IsWindows() and
+                   os.path.basename(src_path) in strip_files)
+          pending.append((arcname, executor.submit(
+              _DeflateZipEntry, src_path, strip, spool_dir)))
+          _WritePending(max_pending)
+          continue
+        # Keep the entries in order.
+        _WritePending(0)
+        st = os.lstat(src_path)
+        if kind == 'dir':
+          writer.WriteEntry(arcname + '/', _ZipDateTime(st.st_mtime),
+                            ((st.st_mode & 0xFFFF) << 16) | 0x10,
+                            io.BytesIO(b''))
+        else:
+          target = os.readlink(src_path).encode('utf-8')
+          writer.WriteEntry(arcname, _ZipDateTime(st.st_mtime),
+                            (st.st_mode & 0xFFFF) << 16, io.BytesIO(target),
+                            crc=zlib.crc32(target) & 0xFFFFFFFF)
+        print('Adding %s' % arcname)
+      _WritePending(0)
+      writer.Close()
+    finally:
+      for _, future in pending:
+        if not future.cancel() and not future.exception():
+          future.result()[3].close()
+
+
 def MakeZip(output_dir, archive_name, file_list, file_relative_dir,
-            raise_error=True, remove_archive_directory=True, strip_files=None):
+            raise_error=True, remove_archive_directory=True, strip_files=None,
+            stage_files=True, jobs=None):
   """Packs files into a new zip archive.
 
   Files are first copied into a directory within the output_dir named for
@@ -452,6 +768,11 @@ def MakeZip(output_dir, archive_name, file_list, file_relative_dir,
   the output_dir.  The zip file will be named as the archive_name, plus
   '.zip'.
 
+  If stage_files is False, files are instead read from file_relative_dir and
+  compressed straight into the zip file, preserving symlinks and mode bits,
+  and no archive directory is created. Files are stripped and compressed in
+  parallel. This requires python3.
+
   Args:
     output_dir: Absolute path to the directory in which the archive is to
       be created.
@@ -467,10 +788,15 @@ def MakeZip(output_dir, archive_name, file_list, file_relative_dir,
       before copying files over to it.
     strip_files: List of executable files to strip symbols when zipping. The
       option currently does not work in Windows.
+    stage_files: Whether to copy the files to the archive directory before
+      zipping them. Must be True under python2.
+    jobs: Number of files to strip and compress concurrently if stage_files
+      is False. Defaults to the number of CPUs.
 
   Returns:
     A tuple consisting of (archive_dir, zip_file_path), where archive_dir
-    is the full path to the newly created archive_name subdirectory.
+    is the full path to the newly created archive_name subdirectory, which
+    does not exist if stage_files is False.
 
   Raises:
     PathNotFound if any of the files in the list is not found, unless
@@ -479,8 +805,19 @@ def MakeZip(output_dir, archive_name, file_list, file_relative_dir,
   if not strip_files:
     strip_files = []
   start_time = time.time()
-  # Collect files into the archive directory.
   archive_dir = os.path.join(output_dir, archive_name)
+  if not stage_files:
+    assert sys.version_info.major >= 3, 'stage_files=False requires python3'
+    output_file = '%s.zip' % archive_dir
+    MoveFile(output_file, '%s_old.zip' % archive_dir)
+    print('Creating %s' % output_file)
+    _MakeZipWithoutStaging(output_file, archive_name, file_list,
+                           file_relative_dir, raise_error, strip_files,
+                           jobs or multiprocessing.cpu_count())
+    print('Took %f seconds to create zip.' % (time.time() - start_time))
+    return (archive_dir, output_file)
+
+  # Collect files into the archive directory.
   print('output_dir: %s, archive_name: %s' % (output_dir, archive_name))
   print(
       'archive_dir: %s, remove_archive_directory: %s, exists: %s' %
@@ -593,8 +930,133 @@ def MakeZip(output_dir, archive_name, file_list, file_relative_dir,
   return (archive_dir, output_file)
 
 
-def ExtractZip(filename, output_dir, verbose=True):
+def _ZipEntryPath(root, name):
+  """Returns the path a zip entry is extracted to, checking it is in root.
+
+  |root| is the real path of the output directory, see os.path.realpath().
+  """
+  path = os.path.normpath(os.path.join(root, *name.rstrip('/').split('/')))
+  try:
+    inside = os.path.commonpath([root, path]) == root
+  except ValueError:
+    # Paths on different drives.
+    inside = False
+  if os.path.isabs(name) or not inside or path == root:
+    raise ExternalError('Zip entry %s is outside of %s' % (name, root))
+  return path
+
+
+def _ZipEntryMode(info):
+  """Returns the unix st_mode stored for a zip entry, or 0 if there is none."""
+  if info.create_system != 3:
+    return 0
+  return info.external_attr >> 16
+
+
+def _ExtractZipFiles(filename, root, infos, verbose):
+  """Extracts the regular files |infos| of a zip archive to root.
+
+  Returns the number of bytes extracted.
+  """
+  extracted_bytes = 0
+  with zipfile.ZipFile(filename) as zf:
+    for info in infos:
+      if verbose:
+        print('Extracting %s' % info.filename)
+      path = _ZipEntryPath(root, info.filename)
+      # Do not write through symlinks of a previous extraction.
+      if os.path.islink(path):
+        os.remove(path)
+      with zf.open(info) as src, open(path, 'wb') as dst:
+        shutil.copyfileobj(src, dst, _ZIP_READ_CHUNK_SIZE)
+      mode = _ZipEntryMode(info)
+      if mode and not IsWindows():
+        os.chmod(path, stat.S_IMODE(mode))
+      extracted_bytes += info.file_size
+  return extracted_bytes
+
+
+def ExtractZipInParallel(filename, output_dir, jobs=None, verbose=False):
+  """Extracts the zip archive in the output directory with the zipfile module.
+
+  The files of the archive are split by size between |jobs| threads, each
+  with its own handle on the archive. Permission bits are restored and
+  symlinks are recreated, except on Windows.
+
+  Args:
+    filename: Path to the zip archive.
+    output_dir: Directory to extract the archive to.
+    jobs: Number of files to extract concurrently. Defaults to the number of
+      CPUs.
+    verbose: Whether to print the name of every extracted entry.
+  """
+  start_time = time.time()
+  jobs = jobs or multiprocessing.cpu_count()
+  MaybeMakeDirectory(output_dir)
+  root = os.path.realpath(output_dir)
+  with zipfile.ZipFile(filename) as zf:
+    infos = zf.infolist()
+
+  dirs = []
+  links = []
+  files = []
+  for info in infos:
+    mode = _ZipEntryMode(info)
+    if info.filename.endswith('/'):
+      dirs.append(info)
+    elif stat.S_ISLNK(mode) and not IsWindows():
+      links.append(info)
+    else:
+      files.append(info)
+
+  # Create all the directories up front, so that workers never race to.
+  dir_paths = set(_ZipEntryPath(root, info.filename) for info in dirs)
+  dir_paths.update(
+      os.path.dirname(_ZipEntryPath(root, info.filename))
+      for info in files + links)
+  for path in sorted(dir_paths):
+    MaybeMakeDirectory(path)
+
+  # Balance the bytes to extract between jobs, largest files first.
+  partitions = [[] for _ in range(min(jobs, len(files)) or 1)]
+  partition_sizes = [0] * len(partitions)
+  for info in sorted(files, key=lambda i: i.file_size, reverse=True):
+    index = partition_sizes.index(min(partition_sizes))
+    partitions[index].append(info)
+    partition_sizes[index] += info.file_size
+  with _ThreadPoolExecutor(len(partitions)) as executor:
+    extracted_bytes = sum(executor.map(
+        lambda infos: _ExtractZipFiles(filename, root, infos, verbose),
+        partitions))
+
+  if links:
+    with zipfile.ZipFile(filename) as zf:
+      for info in links:
+        if verbose:
+          print('Extracting %s' % info.filename)
+        path = _ZipEntryPath(root, info.filename)
+        if os.path.islink(path) or os.path.isfile(path):
+          os.remove(path)
+        os.symlink(zf.read(info).decode('utf-8'), path)
+
+  # Restore the permissions of directories last, in case they are read-only.
+  if not IsWindows():
+    for info in dirs:
+      mode = _ZipEntryMode(info)
+      if mode:
+        os.chmod(_ZipEntryPath(root, info.filename), stat.S_IMODE(mode))
+
+  elapsed = max(time.time() - start_time, 1e-6)
+  print('Extracted %d entries (%d bytes) in %f seconds (%.1f MB/s).' %
+        (len(infos), extracted_bytes, elapsed,
+         extracted_bytes / elapsed / (1024 * 1024)))
+
+
+def ExtractZip(filename, output_dir, verbose=True, jobs=None):
   """ Extract the zip archive in the output directory.
+
+  If jobs is set, the archive is extracted by ExtractZipInParallel() with
+  that many jobs instead of by an unzip command.
   """
   MaybeMakeDirectory(output_dir)
 
@@ -602,19 +1064,19 @@ def ExtractZip(filename, output_dir, verbose=True):
   # handle links and file bits (executable), which is much
   # easier then trying to do that with ZipInfo options.
   #
-  # On Windows, try to use 7z if it is installed, otherwise fall back to python
-  # zip module and pray we don't have files larger than 512MB to unzip.
+  # On Windows, try to use 7z if it is installed, otherwise fall back to
+  # extracting the archive in parallel with the python zip module.
   unzip_cmd = None
   if IsLinux():
     unzip_cmd = ['unzip', '-o']
   elif IsMac():
     # The Mac version of unzip does not have LARGE_FILE_SUPPORT until
-    # macOS 10.12, so use ditto instead. The Python ZipFile fallback
-    # used on Windows does not support symbolic links, which makes it
-    # unsuitable for Mac builds.
+    # macOS 10.12, so use ditto instead.
     unzip_cmd = ['ditto', '-x', '-k']
   elif IsWindows() and os.path.exists('C:\\Program Files\\7-Zip\\7z.exe'):
     unzip_cmd = ['C:\\Program Files\\7-Zip\\7z.exe', 'x', '-y']
+  if jobs:
+    unzip_cmd = None
 
   if unzip_cmd:
     # Make sure path is absolute before changing directories.
@@ -630,19 +1092,213 @@ def ExtractZip(filename, output_dir, verbose=True):
     if result:
       raise ExternalError('unzip failed: %s => %s' % (str(command), result))
   else:
-    assert IsWindows()
-    zf = zipfile.ZipFile(filename)
-    # TODO(hinoka): This can be multiprocessed.
-    for name in zf.namelist():
-      if verbose:
-        print('Extracting %s' % name)
-      zf.extract(name, output_dir)
-      if IsMac():
-        # Restore permission bits.
-        os.chmod(
-            os.path.join(output_dir, name),
-            zf.getinfo(name).external_attr >> 16
-        )
+    ExtractZipInParallel(filename, output_dir, jobs=jobs, verbose=verbose)
+
+
+# Version of the manifests written by MakeDeltaManifest().
+DELTA_MANIFEST_VERSION = 1
+
+# Blobs of delta archives are stored in files named by their hex SHA-256.
+_BLOB_DIGEST_RE = re.compile(r'^[0-9a-f]{64}\Z')
+
+
+def HashFile(path):
+  """Returns the hex SHA-256 digest of the contents of a file."""
+  digest = hashlib.sha256()
+  with open(path, 'rb') as f:
+    for chunk in iter(lambda: f.read(_ZIP_READ_CHUNK_SIZE), b''):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+
+def MakeDeltaManifest(archive_name,
+                      file_list,
+                      file_relative_dir,
+                      raise_error=True,
+                      jobs=None):
+  """Describes the files of MakeZip() as a content-addressed delta archive.
+
+  Instead of packing the files, the manifest lists every entry MakeZip()
+  would add, with the SHA-256 digest of the contents of regular files. The
+  contents are stored separately as blobs named by their digest, so that
+  files which did not change since a previous archive are not transferred
+  again. Files are hashed on a pool of |jobs| threads.
+
+  Args:
+    archive_name: Name of the top-level directory of the archive.
+    file_list: List of paths to files or subdirectories, relative to the
+      file_relative_dir.
+    file_relative_dir: Absolute path to the directory containing the files
+      and subdirectories in the file_list.
+    raise_error: Whether to raise a PathNotFound error if one of the files in
+      the list is not found.
+    jobs: Number of files to hash concurrently. Defaults to the number of CPUs.
+
+  Returns:
+    A tuple (manifest, blob_sources), where manifest is a JSON-serializable
+    dict and blob_sources maps the digest of every blob to the path of a file
+    with its contents.
+  """
+  sources = list(
+      _IterZipSources(archive_name, file_list, file_relative_dir, raise_error,
+                      not IsWindows()))
+  entries = []
+  blob_sources = {}
+  with _ThreadPoolExecutor(jobs or multiprocessing.cpu_count()) as executor:
+    digests = executor.map(
+        lambda source: HashFile(source[0])
+        if source[2] == 'file' else None, sources)
+    for (src_path, arcname, kind), digest in zip(sources, digests):
+      st = os.lstat(src_path)
+      entry = {
+          'path': arcname,
+          'type': kind,
+          'mode': stat.S_IMODE(st.st_mode),
+      }
+      if kind == 'link':
+        entry['target'] = os.readlink(src_path)
+      elif kind == 'file':
+        entry['sha256'] = digest
+        entry['size'] = st.st_size
+        blob_sources.setdefault(digest, src_path)
+      entries.append(entry)
+  return {'version': DELTA_MANIFEST_VERSION, 'entries': entries}, blob_sources
+
+
+def CheckBlobDigest(digest):
+  """Raises ExternalError unless digest is a hex SHA-256 digest.
+
+  Digests are joined into the paths of blobs, so this must be called on any
+  digest which was read from a manifest before it is used.
+  """
+  if not isinstance(digest, (str, type(u''))) or not _BLOB_DIGEST_RE.match(
+      digest):
+    raise ExternalError('Invalid blob digest %r' % (digest,))
+
+
+def _CheckDeltaManifest(manifest):
+  if manifest.get('version') != DELTA_MANIFEST_VERSION:
+    raise ExternalError('Unsupported delta manifest version %s' %
+                        manifest.get('version'))
+  for entry in manifest['entries']:
+    if entry['type'] == 'file':
+      CheckBlobDigest(entry['sha256'])
+
+
+def DeltaManifestBlobs(manifest):
+  """Returns the set of digests of the blobs a delta manifest refers to."""
+  _CheckDeltaManifest(manifest)
+  return set(entry['sha256']
+             for entry in manifest['entries']
+             if entry['type'] == 'file')
+
+
+def MissingDeltaBlobs(manifest, blob_dir):
+  """Returns the sorted digests of blobs of a manifest missing in blob_dir."""
+  present = set(os.listdir(blob_dir)) if os.path.isdir(blob_dir) else set()
+  return sorted(DeltaManifestBlobs(manifest) - present)
+
+
+def PruneDeltaBlobs(manifest, blob_dir):
+  """Removes the blobs in blob_dir which a delta manifest does not refer to.
+
+  Returns the number of removed blobs.
+  """
+  blobs = DeltaManifestBlobs(manifest)
+  removed = 0
+  for name in os.listdir(blob_dir):
+    path = os.path.join(blob_dir, name)
+    if name not in blobs and os.path.isfile(path):
+      os.remove(path)
+      removed += 1
+  return removed
+
+
+def _CheckRealPathWithin(path, real_output_dir, name):
+  """Raises ExternalError unless path resolves to a path in real_output_dir.
+
+  Unlike _ZipEntryPath(), this follows symlinks already on disk.
+  """
+  real_path = os.path.realpath(path)
+  if real_path != real_output_dir and not real_path.startswith(
+      os.path.join(real_output_dir, '')):
+    raise ExternalError('Zip entry %s resolves to %s, outside of %s' %
+                        (name, real_path, real_output_dir))
+
+
+def ExtractDeltaArchive(manifest, blob_dir, output_dir, jobs=None):
+  """Recreates the files of a delta manifest in the output directory.
+
+  This is the counterpart of ExtractZip() for MakeDeltaManifest(): the
+  contents of regular files are copied from blobs in |blob_dir| on a pool of
+  |jobs| threads. Permission bits are restored and symlinks are recreated
+  after the files, except on Windows, where they are skipped.
+
+  Raises:
+    ExternalError if an entry, or the target of a symlink, is outside of
+    output_dir, or if the digest of a blob is invalid.
+  """
+  start_time = time.time()
+  _CheckDeltaManifest(manifest)
+  MaybeMakeDirectory(output_dir)
+  real_output_dir = os.path.realpath(output_dir)
+  dirs = []
+  files = []
+  links = []
+  for entry in manifest['entries']:
+    path = _ZipEntryPath(real_output_dir, entry['path'])
+    if entry['type'] == 'dir':
+      MaybeMakeDirectory(path)
+      _CheckRealPathWithin(path, real_output_dir, entry['path'])
+      dirs.append((path, entry['mode']))
+    elif entry['type'] == 'link':
+      if not IsWindows():
+        links.append((path, entry))
+    else:
+      MaybeMakeDirectory(os.path.dirname(path))
+      _CheckRealPathWithin(
+          os.path.dirname(path), real_output_dir, entry['path'])
+      # Do not write through symlinks of a previous extraction.
+      if os.path.islink(path) or os.path.isfile(path):
+        os.remove(path)
+      files.append((path, entry))
+
+  def _CopyBlob(path_and_entry):
+    path, entry = path_and_entry
+    shutil.copyfile(os.path.join(blob_dir, entry['sha256']), path)
+    if not IsWindows():
+      os.chmod(path, entry['mode'])
+    return entry['size']
+
+  with _ThreadPoolExecutor(jobs or multiprocessing.cpu_count()) as executor:
+    extracted_bytes = sum(executor.map(_CopyBlob, files))
+
+  # Symlinks are created last, so that no other entry is written through them,
+  # and are checked once they all exist, as they may point at each other.
+  for path, entry in links:
+    MaybeMakeDirectory(os.path.dirname(path))
+    _CheckRealPathWithin(os.path.dirname(path), real_output_dir, entry['path'])
+    if os.path.islink(path) or os.path.isfile(path):
+      os.remove(path)
+    elif os.path.isdir(path):
+      raise ExternalError('Zip entry %s is both a directory and a symlink' %
+                          entry['path'])
+    os.symlink(entry['target'], path)
+  try:
+    for path, entry in links:
+      _CheckRealPathWithin(path, real_output_dir, entry['path'])
+  except ExternalError:
+    for path, _ in links:
+      os.remove(path)
+    raise
+
+  # Restore the permissions of directories last, in case they are read-only.
+  if not IsWindows():
+    for path, mode in dirs:
+      os.chmod(path, mode)
+
+  print('Extracted %d entries (%d bytes) in %f seconds.' %
+        (len(manifest['entries']), extracted_bytes, time.time() - start_time))
 
 
 def _FindUpwardParent(start_dir, *desired_list):
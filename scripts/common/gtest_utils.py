@@ -25,6 +25,11 @@ TEST_WARNING_LABEL = 'WARNING'
 FULL_RESULTS_FILENAME = 'full_results.json'
 TIMES_MS_FILENAME = 'times_ms.json'
 
+try:
+  _STRING_TYPES = basestring  # pylint: disable=undefined-variable
+except NameError:  # python3
+  _STRING_TYPES = str
+
 def CompressList(lines, max_length, middle_replacement):
   """Ensures that |lines| is no longer than |max_length|. If |lines| need to
   be compressed then the middle items are replaced by |middle_replacement|.
@@ -37,6 +42,130 @@ def CompressList(lines, max_length, middle_replacement):
           lines[len(lines) - (max_length - remove_from_start):])
 
 
+def _CompressSnippet(snippet, max_length, middle_replacement):
+  """Splits |snippet| into lines and compresses them like CompressList().
+
+  Only the lines that are kept are split out of |snippet|, so that huge
+  snippets are never turned into a list of all their lines.
+  """
+  if snippet.count('\n') < max_length:
+    return snippet.split('\n')
+  remove_from_start = max_length // 2
+  keep_at_end = max_length - remove_from_start
+  lines = []
+  if remove_from_start:
+    lines.extend(snippet.split('\n', remove_from_start)[:remove_from_start])
+  lines.append(middle_replacement)
+  if keep_at_end:
+    lines.extend(snippet.rsplit('\n', keep_at_end)[1:])
+  return lines
+
+
+class _JSONStreamReader(object):
+  """Reads a JSON document from a file incrementally.
+
+  Containers can be walked value by value with the Begin*/Next* methods, and
+  any value can be decoded as a whole with ReadValue(). Only the value being
+  decoded and at most one chunk of the file are kept in memory.
+  """
+
+  def __init__(self, json_file, chunk_size):
+    self._file = json_file
+    self._chunk_size = chunk_size
+    self._decoder = json.JSONDecoder()
+    self._buffer = ''
+    self._pos = 0
+    self._eof = False
+
+  def _Read(self, size):
+    """Appends at least |size| characters of the file to the buffer."""
+    if self._pos:
+      self._buffer = self._buffer[self._pos:]
+      self._pos = 0
+    while size > 0 and not self._eof:
+      data = self._file.read(max(size, self._chunk_size))
+      if not data:
+        self._eof = True
+      self._buffer += data
+      size -= len(data)
+
+  def _Peek(self):
+    """Returns the next non-whitespace character, or '' at the end."""
+    while True:
+      while (self._pos < len(self._buffer) and
+             self._buffer[self._pos] in ' \t\n\r'):
+        self._pos += 1
+      if self._pos < len(self._buffer) or self._eof:
+        return self._buffer[self._pos:self._pos + 1]
+      self._Read(self._chunk_size)
+
+  def _Expect(self, chars):
+    """Consumes the next non-whitespace character, which must be in |chars|."""
+    char = self._Peek()
+    if not char or char not in chars:
+      raise ValueError('Expected one of %r at offset %d of the buffer, got %r' %
+                       (chars, self._pos, char))
+    self._pos += 1
+    return char
+
+  def ReadValue(self):
+    """Decodes and returns the next value."""
+    self._Peek()
+    while True:
+      try:
+        value, end = self._decoder.raw_decode(self._buffer, self._pos)
+      except ValueError:
+        if self._eof:
+          raise
+      else:
+        # A number at the end of the buffer may continue in the file.
+        if end < len(self._buffer) or self._eof:
+          self._pos = end
+          return value
+      # Grow the buffer geometrically so that decoding values spanning many
+      # chunks takes linear time.
+      self._Read(len(self._buffer) - self._pos)
+
+  def BeginObject(self):
+    self._Expect('{')
+
+  def NextKey(self):
+    """Returns the next key of the current object, or None at its end."""
+    if self._Peek() == '}':
+      self._pos += 1
+      return None
+    key = self.ReadValue()
+    if not isinstance(key, _STRING_TYPES):
+      raise ValueError('Expected an object key, got %r' % (key,))
+    self._Expect(':')
+    return key
+
+  def EndValue(self):
+    """Consumes the separator after a value in an object or array."""
+    if self._Expect(',}]') == ',':
+      if self._Peek() in ('}', ']'):
+        raise ValueError('Trailing comma at offset %d of the buffer' %
+                         self._pos)
+    else:
+      # Leave the end of the container to NextKey() or HasNextItem().
+      self._pos -= 1
+
+  def BeginArray(self):
+    self._Expect('[')
+
+  def HasNextItem(self):
+    """Returns whether the current array has more items."""
+    if self._Peek() == ']':
+      self._pos += 1
+      return False
+    return True
+
+  def End(self):
+    """Checks that there is nothing but whitespace after the document."""
+    if self._Peek():
+      raise ValueError('Extra data after the JSON document')
+
+
 class GTestLogParser(object):
   """This helper class process GTest test output."""
 
@@ -102,6 +231,48 @@ class GTestLogParser(object):
     self._retry_message = re.compile('RETRYING FAILED TESTS:')
     self.retrying_failed = False
 
+    # Directives that ProcessLine() looks for anywhere in a line, in order of
+    # precedence. They are combined into a single pattern so that the common
+    # case of a line without any directive costs one search instead of one per
+    # directive.
+    self._gtest_regexps = [
+      self._test_start,
+      self._test_ok,
+      self._test_fail,
+      self._test_passed,
+      self._test_skipped,
+    ]
+    self._gtest_directive = re.compile(
+        '|'.join(regexp.pattern for regexp in self._gtest_regexps))
+
+    # Directives that _ProcessLine() matches at the start of a line, in the
+    # order they are checked, combined into one alternation with one named
+    # group per directive. Alternatives are tried in order, so the first
+    # directive matching the line wins, like when matching them one by one.
+    # Test timeouts may appear anywhere in a line and are searched separately.
+    line_regexps = [
+      ('run_test_cases', self._run_test_cases_line),
+      ('passed', self._test_passed),
+      ('disabled', self._disabled),
+      ('flaky', self._flaky),
+      ('start', self._test_start),
+      ('ok', self._test_ok),
+      ('skipped', self._test_skipped),
+      ('fail', self._test_fail),
+      ('report_start', self._report_start),
+      ('report_end', self._report_end),
+      ('retry', self._retry_message),
+    ]
+    self._line_directive = re.compile('|'.join(
+        '(?P<%s>%s)' % (name, regexp.pattern)
+        for name, regexp in line_regexps))
+    # Maps each directive to the index of its first own group in
+    # |self._line_directive|, i.e. the group(1) of its individual regexp.
+    self._line_directive_value_group = {
+      name: self._line_directive.groupindex[name] + 1 if regexp.groups else None
+      for name, regexp in line_regexps
+    }
+
     self.TEST_STATUS_MAP = {
       'OK': TEST_SUCCESS_LABEL,
       'failed': TEST_FAILURE_LABEL,
@@ -241,20 +412,15 @@ class GTestLogParser(object):
     # Code below tries to detect such cases and recognize a mixed line as two
     # separate lines.
 
-    # List of regexps that parses expects to find at the start of a line but
-    # which can be somewhere in the middle.
-    gtest_regexps = [
-      self._test_start,
-      self._test_ok,
-      self._test_fail,
-      self._test_passed,
-      self._test_skipped,
-    ]
-
-    for regexp in gtest_regexps:
-      match = regexp.search(line)
-      if match:
-        break
+    # |self._gtest_regexps| are expected at the start of a line but can be
+    # somewhere in the middle. Most lines contain none of them, which is
+    # checked at once before finding the one that takes precedence.
+    match = self._gtest_directive.search(line)
+    if match:
+      for regexp in self._gtest_regexps:
+        match = regexp.search(line)
+        if match:
+          break
 
     if not match or match.start() == 0:
       self._ProcessLine(line)
@@ -262,6 +428,32 @@ class GTestLogParser(object):
       self._ProcessLine(line[:match.start()])
       self._ProcessLine(line[match.start():])
 
+  def _MatchLineDirective(self, line):
+    """Returns the directive a line starts with and its value.
+
+    Returns:
+      A tuple (directive, value), where directive is one of the names in
+      |self._line_directive| or 'timeout', and value is the test name, count
+      or report hash it carries, if any. (None, None) for any other line.
+    """
+    # gtest's 'Note:' lines and the 'Failing tests:' header are frequent and
+    # never start with a directive, so they skip the combined match.
+    if line.startswith(('Note:', 'Failing tests:')):
+      match = None
+    else:
+      match = self._line_directive.match(line)
+    directive = match.lastgroup if match else None
+    # Test timeouts take precedence over the directives checked after them.
+    if (directive in (None, 'report_start', 'report_end', 'retry') and
+        'Test timeout' in line):
+      results = self._test_timeout.search(line)
+      if results:
+        return 'timeout', results.group(1)
+    if not directive:
+      return None, None
+    value_group = self._line_directive_value_group[directive]
+    return directive, match.group(value_group) if value_group else None
+
   def _ProcessLine(self, line):
     """Parses the line and changes the state of parsed tests accordingly.
 
@@ -273,13 +465,17 @@ class GTestLogParser(object):
     # should all be the same anyway).
 
     # Is it a line listing the master name?
-    if not self.master_name:
+    if not self.master_name and line.startswith('['):
       results = self._master_name_re.match(line)
       if results:
         self.master_name = results.group(1)
 
-    results = self._run_test_cases_line.match(line)
-    if results:
+    directive, value = self._MatchLineDirective(line)
+    if not directive:
+      self._ProcessOutputLine(line)
+      return
+
+    if directive == 'run_test_cases':
       # A run_test_cases.py output.
       if self._current_test:
         if self._test_status[self._current_test][0] == 'started':
@@ -290,17 +486,15 @@ class GTestLogParser(object):
       return
 
     # Is it a line declaring all tests passed?
-    results = self._test_passed.match(line)
-    if results:
+    if directive == 'passed':
       self.completed = True
       self._current_test = ''
       return
 
     # Is it a line reporting disabled tests?
-    results = self._disabled.match(line)
-    if results:
+    if directive == 'disabled':
       try:
-        disabled = int(results.group(1))
+        disabled = int(value)
       except ValueError:
         disabled = 0
       if disabled > 0 and isinstance(self._disabled_tests, int):
@@ -312,10 +506,9 @@ class GTestLogParser(object):
       return
 
     # Is it a line reporting flaky tests?
-    results = self._flaky.match(line)
-    if results:
+    if directive == 'flaky':
       try:
-        flaky = int(results.group(1))
+        flaky = int(value)
       except ValueError:
         flaky = 0
       if flaky > 0 and isinstance(self._flaky_tests, int):
@@ -327,13 +520,12 @@ class GTestLogParser(object):
       return
 
     # Is it the start of a test?
-    results = self._test_start.match(line)
-    if results:
+    if directive == 'start':
       if self._current_test:
         if self._test_status[self._current_test][0] == 'started':
           self._test_status[self._current_test] = (
               'timeout', self._failure_description)
-      test_name = results.group(1)
+      test_name = value
       self._test_status[test_name] = ('started', ['Did not complete.'])
       self._current_test = test_name
       if self.retrying_failed:
@@ -344,9 +536,8 @@ class GTestLogParser(object):
       return
 
     # Is it a test success line?
-    results = self._test_ok.match(line)
-    if results:
-      test_name = results.group(1)
+    if directive == 'ok':
+      test_name = value
       status = self._StatusOfTest(test_name)
       if status != 'started':
         self._RecordError(line, 'success while in status %s' % status)
@@ -359,9 +550,8 @@ class GTestLogParser(object):
       return
 
     # Is it a test skipped line?
-    results = self._test_skipped.match(line)
-    if results:
-      test_name = results.group(1)
+    if directive == 'skipped':
+      test_name = value
       status = self._StatusOfTest(test_name)
       # Skipped tests are listed again in the summary.
       if status not in ('started', 'skipped'):
@@ -372,9 +562,8 @@ class GTestLogParser(object):
       return
 
     # Is it a test failure line?
-    results = self._test_fail.match(line)
-    if results:
-      test_name = results.group(1)
+    if directive == 'fail':
+      test_name = value
       status = self._StatusOfTest(test_name)
       if status not in ('started', 'failed', 'timeout'):
         self._RecordError(line, 'failure while in status %s' % status)
@@ -388,9 +577,8 @@ class GTestLogParser(object):
       return
 
     # Is it a test timeout line?
-    results = self._test_timeout.search(line)
-    if results:
-      test_name = results.group(1)
+    if directive == 'timeout':
+      test_name = value
       status = self._StatusOfTest(test_name)
       if status not in ('started', 'failed'):
         self._RecordError(line, 'timeout while in status %s' % status)
@@ -401,9 +589,8 @@ class GTestLogParser(object):
       return
 
     # Is it the start of a new memory tool report?
-    results = self._report_start.match(line)
-    if results:
-      report_hash = results.group(1)
+    if directive == 'report_start':
+      report_hash = value
       if report_hash in self._memory_tool_reports:
         self._RecordError(line, 'multiple reports for this hash')
       self._memory_tool_reports[report_hash] = []
@@ -412,9 +599,8 @@ class GTestLogParser(object):
       return
 
     # Is it the end of a memory tool report?
-    results = self._report_end.match(line)
-    if results:
-      report_hash = results.group(1)
+    if directive == 'report_end':
+      report_hash = value
       if not self._current_report_hash:
         self._RecordError(line, 'no BEGIN matches this END')
       elif report_hash != self._current_report_hash:
@@ -428,11 +614,12 @@ class GTestLogParser(object):
       return
 
     # Is it the start of the retry tests?
-    results = self._retry_message.match(line)
-    if results:
+    if directive == 'retry':
       self.retrying_failed = True
       return
 
+  def _ProcessOutputLine(self, line):
+    """Handles a line that does not carry any directive."""
     # Random line: if we're in a report, collect it. Reports are
     # generated after all tests are finished, so this should always belong to
     # the current report hash.
@@ -468,17 +655,14 @@ class GTestJSONParser(object):
   # of output that gums up the infrastructure.
   OUTPUT_SNIPPET_LINES_LIMIT = 5000
 
+  # Number of characters read at once from the JSON summary.
+  JSON_READ_CHUNK_SIZE = 8 * 1024 * 1024
+
   def __init__(self, mastername=None):
     self.json_file_path = None
     self.delete_json_file = False
 
-    self.disabled_tests = set()
-    self.passed_tests = set()
-    self.failed_tests = set()
-    self.flaky_tests = set()
-    self.test_logs = {}
-    self.run_results = {}
-    self.ignored_failed_tests = set()
+    self._ResetResults()
 
     self.parsing_errors = []
 
@@ -494,6 +678,15 @@ class GTestJSONParser(object):
                              TEST_TIMEOUT_LABEL,
                              TEST_SKIPPED_LABEL)
 
+  def _ResetResults(self):
+    self.disabled_tests = set()
+    self.passed_tests = set()
+    self.failed_tests = set()
+    self.flaky_tests = set()
+    self.test_logs = {}
+    self.run_results = {}
+    self.ignored_failed_tests = set()
+
   def ProcessLine(self, line):
     # Deliberately do nothing - we parse out-of-band JSON summary
     # instead of in-band stdout.
@@ -553,15 +746,16 @@ class GTestJSONParser(object):
 
     with open(self.json_file_path) as json_file:
       try:
-        json_output = json_file.read()
-        json_data = json.loads(json_output)
+        self.ProcessJSONStream(json_file, build_dir)
       except ValueError:
+        # Results of the summary are all or nothing.
+        self._ResetResults()
+        json_file.seek(0)
+        json_output = json_file.read()
         # Only signal parsing error if the file is non-empty. Empty file
         # most likely means the binary doesn't support JSON output.
         if json_output:
           self.parsing_errors = json_output.split('\n')
-      else:
-        self.ProcessJSONData(json_data, build_dir)
 
     if self.delete_json_file:
       os.remove(self.json_file_path)
@@ -654,32 +848,83 @@ class GTestJSONParser(object):
 
     for iteration_data in json_data['per_iteration_data']:
       for test_name, test_runs in iteration_data.items():
-        if test_runs[-1]['status'] in ('SUCCESS', 'SKIPPED'):
-          self.passed_tests.add(test_name)
-        else:
-          self.failed_tests.add(test_name)
-
-        self.run_results[test_name] = []
-        self.test_logs.setdefault(test_name, [])
-        for run_index, run_data in enumerate(test_runs, start=1):
-          # Mark as flaky if the run result differs.
-          if run_data['status'] != test_runs[0]['status']:
-            self.flaky_tests.add(test_name)
-          if run_data['status'] in self.SUPPORTED_LABELS:
-            self.run_results[test_name].append(run_data['status'])
-          else:
-            self.run_results[test_name].append(TEST_UNKNOWN_LABEL)
-          run_lines = ['%s (run #%d):' % (test_name, run_index)]
-          # Make sure the annotations are ASCII to avoid character set related
-          # errors. They are mostly informational anyway, and more detailed
-          # info can be obtained from the original JSON output.
-          ascii_lines = run_data['output_snippet'].encode(
-              'ascii', errors='replace'
-          ).decode()
-          decoded_lines = CompressList(
-              ascii_lines.split('\n'),
-              self.OUTPUT_SNIPPET_LINES_LIMIT,
-              '<truncated, full output is in gzipped JSON '
-              'output at end of step>')
-          run_lines.extend(decoded_lines)
-          self.test_logs[test_name].extend(run_lines)
+        self._ProcessTestRuns(test_name, test_runs)
+
+  def ProcessJSONStream(self, json_file, build_dir=None):
+    """Like ProcessJSONData(), but incrementally reads the JSON from a file.
+
+    Iterations are decoded and processed one at a time, and output snippets
+    are truncated right away, so that the memory used does not depend on the
+    number of iterations in the summary.
+
+    Raises:
+      ValueError if the file does not contain valid JSON.
+    """
+    reader = _JSONStreamReader(json_file, self.JSON_READ_CHUNK_SIZE)
+    required_keys = set(['disabled_tests', 'global_tags', 'per_iteration_data'])
+    reader.BeginObject()
+    key = reader.NextKey()
+    while key is not None:
+      required_keys.discard(key)
+      if key == 'per_iteration_data':
+        reader.BeginArray()
+        while reader.HasNextItem():
+          for test_name, test_runs in reader.ReadValue().items():
+            self._ProcessTestRuns(test_name, test_runs)
+          reader.EndValue()
+      else:
+        value = reader.ReadValue()
+        if key == 'disabled_tests':
+          self.disabled_tests.update(value)
+        elif key == 'global_tags':
+          self._RetrieveIgnoredFailuresForPlatform(build_dir, value)
+      reader.EndValue()
+      key = reader.NextKey()
+    reader.End()
+    if required_keys:
+      raise ValueError('Missing keys in JSON summary: %s' %
+                       ', '.join(sorted(required_keys)))
+
+  def _ProcessTestRuns(self, test_name, test_runs):
+    """Records the runs of a test in one iteration.
+
+    Args:
+      test_name: Name of the test.
+      test_runs: List of the dicts describing each run of the test.
+    """
+    self.run_results[test_name] = []
+    self.test_logs.setdefault(test_name, [])
+    first_status = None
+    last_status = None
+    for run_index, run_data in enumerate(test_runs, start=1):
+      last_status = run_data['status']
+      if first_status is None:
+        first_status = last_status
+      # Mark as flaky if the run result differs.
+      if run_data['status'] != first_status:
+        self.flaky_tests.add(test_name)
+      if run_data['status'] in self.SUPPORTED_LABELS:
+        self.run_results[test_name].append(run_data['status'])
+      else:
+        self.run_results[test_name].append(TEST_UNKNOWN_LABEL)
+      run_lines = ['%s (run #%d):' % (test_name, run_index)]
+      # Make sure the annotations are ASCII to avoid character set related
+      # errors. They are mostly informational anyway, and more detailed
+      # info can be obtained from the original JSON output.
+      snippet = run_data['output_snippet']
+      try:
+        snippet.encode('ascii')
+      except UnicodeError:
+        snippet = snippet.encode('ascii', errors='replace').decode()
+      decoded_lines = _CompressSnippet(
+          snippet,
+          self.OUTPUT_SNIPPET_LINES_LIMIT,
+          '<truncated, full output is in gzipped JSON '
+          'output at end of step>')
+      run_lines.extend(decoded_lines)
+      self.test_logs[test_name].extend(run_lines)
+
+    if last_status in ('SUCCESS', 'SKIPPED'):
+      self.passed_tests.add(test_name)
+    else:
+      self.failed_tests.add(test_name)
@@ -6,8 +6,14 @@
 """Unit tests for classes in chromium_utils.py."""
 
 import os
+import shutil
+import stat
 import sys
+import tempfile
 import unittest
+import zipfile
+
+import mock
 
 ROOT_DIR = os.path.normpath(os.path.join(__file__, '..', '..', '..', '..'))
 sys.path.extend([
@@ -118,5 +124,288 @@ class TestRunCommand(unittest.TestCase):
     self.assertEqual(1, retval)
 
 
+@unittest.skipUnless(
+    chromium_utils.IsLinux() or chromium_utils.IsMac(), 'Requires zip')
+class TestMakeZip(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.build_dir = os.path.join(self.tmp_dir, 'build')
+    for path, contents in [
+        ('chrome', b'\x7fELF' + b'x' * 100000),
+        ('empty', b''),
+        ('gen/a.txt', b'a' * 1000),
+        ('gen/sub/b.txt', b'b'),
+        ('lib/c.so', b'c' * 10),
+    ]:
+      path = os.path.join(self.build_dir, path)
+      chromium_utils.MaybeMakeDirectory(os.path.dirname(path))
+      with open(path, 'wb') as f:
+        f.write(contents)
+    os.chmod(os.path.join(self.build_dir, 'chrome'), 0o755)
+    os.symlink('a.txt', os.path.join(self.build_dir, 'gen', 'link.txt'))
+    os.symlink('sub', os.path.join(self.build_dir, 'gen', 'link_dir'))
+    os.symlink('lib/c.so', os.path.join(self.build_dir, 'c.so'))
+    self.output_dir = os.path.join(self.tmp_dir, 'out')
+    os.mkdir(self.output_dir)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  @staticmethod
+  def _ReadZip(zip_file_path):
+    entries = {}
+    with zipfile.ZipFile(zip_file_path) as zip_file:
+      for info in zip_file.infolist():
+        mode = info.external_attr >> 16
+        entries[info.filename] = (stat.S_IFMT(mode), stat.S_IMODE(mode),
+                                  zip_file.read(info))
+    return entries
+
+  def _MakeZip(self, file_list, **kwargs):
+    return chromium_utils.MakeZip(
+        self.output_dir, 'full-build', file_list, self.build_dir, **kwargs)
+
+  def testMakeZipWithoutStaging(self):
+    file_list = ['chrome', 'empty', 'gen', 'c.so', 'gen/a.txt']
+    staged_dir, staged_zip = self._MakeZip(file_list)
+    staged = self._ReadZip(staged_zip)
+    chromium_utils.RemoveDirectory(staged_dir)
+
+    archive_dir, zip_file_path = self._MakeZip(
+        file_list, stage_files=False, jobs=3)
+    self.assertFalse(os.path.exists(archive_dir))
+    self.assertEqual(staged, self._ReadZip(zip_file_path))
+    self.assertEqual(
+        (stat.S_IFLNK, b'sub'),
+        self._ReadZip(zip_file_path)['full-build/gen/link_dir'][::2])
+    with zipfile.ZipFile(zip_file_path) as zip_file:
+      self.assertIsNone(zip_file.testzip())
+
+  def testMakeZipWithoutStagingZip64(self):
+    with open(os.path.join(self.build_dir, 'gen', '\u00e9.txt'), 'wb') as f:
+      f.write(b'e' * 100)
+    file_list = ['chrome', 'empty', 'gen', 'c.so']
+    _, zip_file_path = self._MakeZip(file_list, stage_files=False)
+    expected = self._ReadZip(zip_file_path)
+    # Make every size, offset and entry count overflow.
+    writer = chromium_utils._ZipArchiveWriter
+    with mock.patch.object(writer, 'ZIP64_LIMIT', 10), \
+        mock.patch.object(writer, 'FILECOUNT_LIMIT', 2):
+      _, zip_file_path = self._MakeZip(file_list, stage_files=False, jobs=2)
+    self.assertEqual(expected, self._ReadZip(zip_file_path))
+    self.assertIn('full-build/gen/\u00e9.txt', expected)
+    with zipfile.ZipFile(zip_file_path) as zip_file:
+      self.assertIsNone(zip_file.testzip())
+
+  def testMakeZipWithoutStagingMissingFile(self):
+    with self.assertRaises(chromium_utils.PathNotFound):
+      self._MakeZip(['chrome', 'missing'], stage_files=False)
+    _, zip_file_path = self._MakeZip(
+        ['chrome', 'missing'], raise_error=False, stage_files=False)
+    self.assertEqual(['full-build/', 'full-build/chrome'],
+                     sorted(self._ReadZip(zip_file_path)))
+
+  @staticmethod
+  def _ReadTree(root):
+    entries = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+      for name in dirnames + filenames:
+        path = os.path.join(dirpath, name)
+        st = os.lstat(path)
+        if stat.S_ISLNK(st.st_mode):
+          contents = os.readlink(path)
+        elif stat.S_ISDIR(st.st_mode):
+          contents = None
+        else:
+          with open(path, 'rb') as f:
+            contents = f.read()
+        entries[os.path.relpath(path, root)] = (
+            stat.S_IFMT(st.st_mode), stat.S_IMODE(st.st_mode), contents)
+    return entries
+
+  def testExtractZipInParallel(self):
+    archive_dir, zip_file_path = self._MakeZip(
+        ['chrome', 'empty', 'gen', 'c.so', 'lib'])
+    unzip_dir = os.path.join(self.tmp_dir, 'unzip')
+    parallel_dir = os.path.join(self.tmp_dir, 'parallel')
+    chromium_utils.ExtractZip(zip_file_path, unzip_dir)
+    for _ in range(2):
+      chromium_utils.ExtractZip(zip_file_path, parallel_dir, jobs=3)
+      self.assertEqual(self._ReadTree(unzip_dir), self._ReadTree(parallel_dir))
+    self.assertEqual(self._ReadTree(archive_dir),
+                     self._ReadTree(os.path.join(parallel_dir, 'full-build')))
+
+  def testExtractToRelativeDirectory(self):
+    file_list = ['chrome', 'gen', 'c.so', 'lib']
+    archive_dir, zip_file_path = self._MakeZip(file_list)
+    manifest, blob_dir = self._MakeDeltaArchive(file_list)
+    for output_dir in ('.', 'sub', os.path.join('sub', '..', 'other')):
+      unzip_dir = os.path.join(self.tmp_dir, 'unzip')
+      delta_dir = os.path.join(self.tmp_dir, 'delta')
+      for cwd in (unzip_dir, delta_dir):
+        chromium_utils.RemoveDirectory(cwd)
+        os.mkdir(cwd)
+      saved_dir = os.getcwd()
+      try:
+        os.chdir(unzip_dir)
+        chromium_utils.ExtractZip(zip_file_path, output_dir, jobs=2)
+        os.chdir(delta_dir)
+        chromium_utils.ExtractDeltaArchive(manifest, blob_dir, output_dir)
+      finally:
+        os.chdir(saved_dir)
+      for cwd in (unzip_dir, delta_dir):
+        self.assertEqual(
+            self._ReadTree(archive_dir),
+            self._ReadTree(os.path.join(cwd, output_dir, 'full-build')))
+
+  def testExtractZipInParallelRejectsEntriesOutside(self):
+    zip_file_path = os.path.join(self.tmp_dir, 'evil.zip')
+    with zipfile.ZipFile(zip_file_path, 'w') as zip_file:
+      zip_file.writestr('../evil', b'evil')
+    with self.assertRaises(chromium_utils.ExternalError):
+      chromium_utils.ExtractZipInParallel(
+          zip_file_path, os.path.join(self.tmp_dir, 'unzip'))
+    self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, 'evil')))
+
+  @unittest.skipUnless(chromium_utils.IsLinux(), 'Requires GNU strip')
+  def testMakeZipWithoutStagingStripsCopies(self):
+    python = os.path.join(self.build_dir, 'python')
+    shutil.copy(sys.executable, python)
+    with open(python, 'rb') as f:
+      original = f.read()
+    _, zip_file_path = self._MakeZip(
+        ['python'], strip_files=['python'], stage_files=False)
+    _, _, zipped = self._ReadZip(zip_file_path)['full-build/python']
+    self.assertLessEqual(len(zipped), len(original))
+    with open(python, 'rb') as f:
+      self.assertEqual(original, f.read())
+
+  def _MakeDeltaArchive(self, file_list):
+    manifest, blob_sources = chromium_utils.MakeDeltaManifest('full-build',
+                                                              file_list,
+                                                              self.build_dir,
+                                                              jobs=3)
+    blob_dir = os.path.join(self.tmp_dir, 'blobs')
+    chromium_utils.MaybeMakeDirectory(blob_dir)
+    for digest, path in blob_sources.items():
+      shutil.copyfile(path, os.path.join(blob_dir, digest))
+    return manifest, blob_dir
+
+  def testExtractDeltaArchive(self):
+    file_list = ['chrome', 'empty', 'gen', 'c.so', 'lib']
+    _, zip_file_path = self._MakeZip(file_list)
+    unzip_dir = os.path.join(self.tmp_dir, 'unzip')
+    chromium_utils.ExtractZip(zip_file_path, unzip_dir)
+
+    manifest, blob_dir = self._MakeDeltaArchive(file_list)
+    delta_dir = os.path.join(self.tmp_dir, 'delta')
+    for _ in range(2):
+      chromium_utils.ExtractDeltaArchive(manifest, blob_dir, delta_dir, jobs=3)
+      self.assertEqual(self._ReadTree(unzip_dir), self._ReadTree(delta_dir))
+
+  def testDeltaArchiveBlobs(self):
+    manifest, blob_dir = self._MakeDeltaArchive(['gen'])
+    # gen/a.txt and gen/sub/b.txt, links have no blobs.
+    blobs = chromium_utils.DeltaManifestBlobs(manifest)
+    self.assertEqual(2, len(blobs))
+    self.assertEqual(sorted(blobs), sorted(os.listdir(blob_dir)))
+    self.assertEqual([], chromium_utils.MissingDeltaBlobs(manifest, blob_dir))
+
+    chrome_manifest, _ = chromium_utils.MakeDeltaManifest(
+        'full-build', ['chrome', 'gen/a.txt'], self.build_dir)
+    self.assertEqual(
+        1, len(chromium_utils.MissingDeltaBlobs(chrome_manifest, blob_dir)))
+    self.assertEqual(1, chromium_utils.PruneDeltaBlobs(chrome_manifest,
+                                                       blob_dir))
+    self.assertEqual(
+        [chromium_utils.HashFile(os.path.join(self.build_dir, 'gen', 'a.txt'))],
+        os.listdir(blob_dir))
+
+  def testExtractDeltaArchiveRejectsEntriesOutside(self):
+    manifest = {
+        'version':
+            chromium_utils.DELTA_MANIFEST_VERSION,
+        'entries': [{
+            'path': '../evil',
+            'type': 'link',
+            'mode': 0o777,
+            'target': 'evil'
+        }],
+    }
+    with self.assertRaises(chromium_utils.ExternalError):
+      chromium_utils.ExtractDeltaArchive(manifest, self.tmp_dir,
+                                         os.path.join(self.tmp_dir, 'delta'))
+    self.assertFalse(os.path.lexists(os.path.join(self.tmp_dir, 'evil')))
+
+  def testDeltaManifestRejectsInvalidDigests(self):
+    with open(os.path.join(self.tmp_dir, 'evil'), 'w') as f:
+      f.write('evil')
+    for digest in (os.path.join('..', 'evil'), 'A' * 64, None):
+      manifest = {
+          'version':
+              chromium_utils.DELTA_MANIFEST_VERSION,
+          'entries': [{
+              'path': 'file',
+              'type': 'file',
+              'mode': 0o644,
+              'size': 4,
+              'sha256': digest,
+          }],
+      }
+      with self.assertRaises(chromium_utils.ExternalError):
+        chromium_utils.MissingDeltaBlobs(manifest, self.build_dir)
+      with self.assertRaises(chromium_utils.ExternalError):
+        chromium_utils.ExtractDeltaArchive(manifest, self.build_dir,
+                                           os.path.join(self.tmp_dir, 'delta'))
+      self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, 'delta')))
+
+  def _ExtractDeltaEntries(self, entries):
+    manifest = {
+        'version': chromium_utils.DELTA_MANIFEST_VERSION,
+        'entries': entries,
+    }
+    blob_dir = os.path.join(self.tmp_dir, 'blobs')
+    chromium_utils.MaybeMakeDirectory(blob_dir)
+    with open(os.path.join(blob_dir, '0' * 64), 'w') as f:
+      f.write('evil')
+    chromium_utils.ExtractDeltaArchive(manifest, blob_dir,
+                                       os.path.join(self.tmp_dir, 'delta'))
+
+  @unittest.skipIf(chromium_utils.IsWindows(), 'Symlinks are not extracted')
+  def testExtractDeltaArchiveRejectsLinksOutside(self):
+    for target in ('../evil', '/evil', 'up/../evil'):
+      with self.assertRaises(chromium_utils.ExternalError):
+        self._ExtractDeltaEntries([
+            {'path': 'up', 'type': 'link', 'mode': 0o777, 'target': '.'},
+            {'path': 'link', 'type': 'link', 'mode': 0o777, 'target': target},
+        ])
+      self.assertFalse(
+          os.path.lexists(os.path.join(self.tmp_dir, 'delta', 'link')))
+
+  @unittest.skipIf(chromium_utils.IsWindows(), 'Symlinks are not extracted')
+  def testExtractDeltaArchiveDoesNotWriteThroughLinks(self):
+    file_entry = {
+        'path': 'link/evil',
+        'type': 'file',
+        'mode': 0o644,
+        'size': 4,
+        'sha256': '0' * 64,
+    }
+    with self.assertRaises(chromium_utils.ExternalError):
+      self._ExtractDeltaEntries([
+          {'path': 'link', 'type': 'link', 'mode': 0o777, 'target': '..'},
+          file_entry,
+      ])
+    self.assertFalse(os.path.lexists(os.path.join(self.tmp_dir, 'evil')))
+
+    # Nor through a link left by a previous extraction.
+    os.symlink('..', os.path.join(self.tmp_dir, 'delta', 'stale'))
+    file_entry['path'] = 'stale/evil'
+    with self.assertRaises(chromium_utils.ExternalError):
+      self._ExtractDeltaEntries([file_entry])
+    self.assertFalse(os.path.lexists(os.path.join(self.tmp_dir, 'evil')))
+
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env vpython3
+# Copyright 2022 The Chromium Authors
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Benchmark for GTestLogParser.ProcessLine on a large synthetic gtest log.
+
+The log mostly consists of test output, like real logs of test launchers,
+with regular RUN/OK/FAILED directives and occasional flaky or memory tool
+report lines.
+
+Usage:
+  gtest_utils_benchmark.py [--lines 10000000] [--repeat 1]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT_DIR = os.path.normpath(os.path.join(__file__, '..', '..', '..', '..'))
+sys.path.extend([
+    os.path.join(ROOT_DIR, 'scripts'),
+])
+
+from common import gtest_utils
+
+_OUTPUT_LINES = [
+    '[12345:67890:1017/120000.123456:INFO:browser_main_loop.cc(123)] Starting',
+    '../../base/pickle_unittest.cc:69: Failure',
+    'Value of: false',
+    '  Actual: false',
+    'Expected: true',
+    'Note: Google Test filter = Foo.*:Bar.*',
+    '[==========] Running 3 tests from 1 test suite.',
+    '[----------] Global test environment set-up.',
+    '',
+]
+
+
+def GenerateLog(num_lines, seed=0):
+  """Yields |num_lines| lines of a synthetic gtest log."""
+  rnd = random.Random(seed)
+  emitted = 0
+  test_index = 0
+  while emitted < num_lines:
+    test_name = 'Suite%d.Test%d' % (test_index % 100, test_index)
+    test_index += 1
+    lines = ['[ RUN      ] %s' % test_name]
+    lines.extend(
+        rnd.choice(_OUTPUT_LINES) for _ in range(rnd.randint(0, 20)))
+    if rnd.random() < 0.05:
+      lines.append('[  FAILED  ] %s (12 ms)' % test_name)
+    else:
+      lines.append('[       OK ] %s (12 ms)' % test_name)
+    if rnd.random() < 0.001:
+      lines.extend([
+          '### BEGIN MEMORY TOOL REPORT (error hash=#%X#)' % test_index,
+          'Leak of 16 byte(s)',
+          '### END MEMORY TOOL REPORT (error hash=#%X#)' % test_index,
+      ])
+    for line in lines[:num_lines - emitted]:
+      yield line
+    emitted += len(lines)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument(
+      '--lines', type=int, default=10000000,
+      help='Number of log lines to parse.')
+  parser.add_argument(
+      '--repeat', type=int, default=1,
+      help='Number of times to parse the log.')
+  args = parser.parse_args()
+
+  log = list(GenerateLog(args.lines))
+  best = None
+  for _ in range(args.repeat):
+    log_parser = gtest_utils.GTestLogParser()
+    start = time.perf_counter()
+    for line in log:
+      log_parser.ProcessLine(line)
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+
+  print('Parsed %d lines in %.2fs (%.0f lines/s)' %
+        (len(log), best, len(log) / best))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
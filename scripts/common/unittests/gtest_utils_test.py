@@ -717,6 +717,40 @@ class TestGTestLogParserTests(unittest.TestCase):
       parser.ProcessLine(line)
     self.assertEqual(['Foo.Bar'], parser.FailedTests(True, True))
 
+  def testDirectiveInTheMiddleOfALine(self):
+    parser = gtest_utils.GTestLogParser()
+    for line in [
+        '[ RUN      ] Foo.Bar',
+        'some output[       OK ] Foo.Bar (1 ms)',
+        '[ RUN      ] Foo.Baz',
+        'Test timeout (100 ms) exceeded for Foo.Baz',
+        '[ RUN      ] Foo.Qux',
+        '### BEGIN MEMORY TOOL REPORT (error hash=#AB#) '
+        'Test timeout (100 ms) exceeded for Foo.Qux',
+    ]:
+      parser.ProcessLine(line)
+    self.assertEqual(['Foo.Bar'], parser.PassedTests())
+    self.assertEqual(['Foo.Baz', 'Foo.Qux'],
+                     sorted(parser.FailedTests(True, True)))
+    self.assertEqual(['TIMEOUT'], parser.TriesForTest('Foo.Baz'))
+    self.assertEqual(['TIMEOUT'], parser.TriesForTest('Foo.Qux'))
+    self.assertEqual([], parser.MemoryToolReportHashes())
+
+  def testNoteAndFailingTestsLines(self):
+    parser = gtest_utils.GTestLogParser()
+    for line in [
+        'Note: Google Test filter = Foo.*',
+        '[ RUN      ] Foo.Bar',
+        'Note: Randomizing tests\' orders with a seed of 42 .',
+        '[       OK ] Foo.Bar (1 ms)',
+        'Failing tests:',
+        'Foo.Bar',
+    ]:
+      parser.ProcessLine(line)
+    self.assertEqual([], parser.PassedTests())
+    self.assertEqual(['Foo.Bar'], parser.FailedTests())
+    self.assertEqual([], parser.ParsingErrors())
+
 
 class TestGTestJSONParserTests(unittest.TestCase):
   def testPassedTests(self):
@@ -943,6 +977,93 @@ class TestGTestJSONParserTests(unittest.TestCase):
       'per_iteration_data': []},
       tempfile.gettempdir())
 
+  def _ProcessJSONFile(self, json_output, chunk_size=7):
+    parser = gtest_utils.GTestJSONParser()
+    parser.JSON_READ_CHUNK_SIZE = chunk_size
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+      f.write(json_output)
+    try:
+      parser.PrepareJSONFile(f.name)
+      parser.ProcessJSONFile(None)
+    finally:
+      os.remove(f.name)
+    return parser
+
+  def _AssertSameResults(self, expected, actual):
+    for attr in ('disabled_tests', 'passed_tests', 'failed_tests',
+                 'flaky_tests', 'test_logs', 'run_results', 'parsing_errors'):
+      self.assertEqual(getattr(expected, attr), getattr(actual, attr), attr)
+
+  def testProcessJSONFileStreamsIterations(self):
+    json_data = {
+      'global_tags': ['OS_LINUX'],
+      'per_iteration_data': [
+        {
+          'Test.One': [
+            {'status': 'FAILURE', 'output_snippet': 'a\nb\u00e9\nc'},
+            {'status': 'SUCCESS', 'output_snippet': ''},
+          ],
+          'Test.Two': [{'status': 'CRASH', 'output_snippet': 'x' * 100}],
+        },
+        {},
+        {
+          'Test.One': [{'status': 'SUCCESS', 'output_snippet': '1\n2'}],
+          'Test.Three': [{'status': 'BOGUS', 'output_snippet': '',
+                          'elapsed_time_ms': 12345, 'losless_snippet': True}],
+        },
+      ],
+      'disabled_tests': ['Test.Disabled'],
+      'test_locations': {'Test.One': {'file': 'a.cc', 'line': 1}},
+    }
+    expected = gtest_utils.GTestJSONParser()
+    expected.ProcessJSONData(json_data)
+    for chunk_size in (1, 7, 1024):
+      for indent in (None, 2):
+        self._AssertSameResults(
+            expected,
+            self._ProcessJSONFile(json.dumps(json_data, indent=indent),
+                                  chunk_size))
+
+  def testProcessJSONFileInvalid(self):
+    json_output = ('{"disabled_tests": [], "global_tags": [], '
+                   '"per_iteration_data": [{"Test.One": [{"status": '
+                   '"SUCCESS", "output_snippet": ""}]}, ]}')
+    parser = self._ProcessJSONFile(json_output)
+    self.assertEqual([], parser.PassedTests())
+    self.assertEqual([json_output], parser.ParsingErrors())
+
+    parser = self._ProcessJSONFile('')
+    self.assertEqual([], parser.ParsingErrors())
+
+    parser = self._ProcessJSONFile('{"disabled_tests": []}')
+    self.assertEqual(['{"disabled_tests": []}'], parser.ParsingErrors())
+
+  def testOutputSnippetTruncation(self):
+    parser = gtest_utils.GTestJSONParser()
+    parser.OUTPUT_SNIPPET_LINES_LIMIT = 4
+    parser.ProcessJSONData({
+      'disabled_tests': [],
+      'global_tags': [],
+      'per_iteration_data': [
+        {
+          'Test.One': [{'status': 'FAILURE',
+                        'output_snippet': u'1\n2\n3\n4\n5\u00e9\n6'}],
+        }
+      ]
+    })
+    self.assertEqual(
+        ['Test.One (run #1):', '1', '2',
+         '<truncated, full output is in gzipped JSON output at end of step>',
+         '5?', '6'],
+        parser.FailureDescription('Test.One'))
+
+  def testCompressSnippet(self):
+    for lines in ([''], ['a'], ['a', 'b', ''], [str(i) for i in range(10)]):
+      for max_length in range(12):
+        self.assertEqual(
+            gtest_utils.CompressList(lines, max_length, 'foo'),
+            gtest_utils._CompressSnippet('\n'.join(lines), max_length, 'foo'))
+
   def testCompressList(self):
     CompressList = gtest_utils.CompressList
     self.assertEqual(['foo'], CompressList([1, 2, 3, 4], 0, 'foo'))